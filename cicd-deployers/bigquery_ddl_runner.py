@@ -14,8 +14,6 @@
 
 import argparse
 import collections
-from google.cloud import bigquery
-from google.cloud import storage
 import sys
 
 def run_sql_queries_from_gcs(project_id, location, bucket, ddl_project_id, ddl_dataset_id, ddl_data_bucket_name,
@@ -26,6 +24,9 @@ def run_sql_queries_from_gcs(project_id, location, bucket, ddl_project_id, ddl_d
         bucket_name (str): Name of the GCS bucket.
         project_id (str): Google Cloud project ID.
     """
+    from google.cloud import bigquery
+    from google.cloud import storage
+
     bigquery_client = bigquery.Client(project=project_id)
     storage_client = storage.Client(project=project_id)
 
@@ -0,0 +1,224 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import argparse
+import collections
+import concurrent.futures
+import functools
+import json
+import random
+import sys
+import time
+
+MAX_ETAG_RETRIES = 5
+
+
+@functools.lru_cache(maxsize=None)
+def get_bigquery_client(project: str):
+    """Returns the BigQuery client of a project, created on first use."""
+    from google.cloud import bigquery
+    return bigquery.Client(project=project)
+
+
+def read_extracted_metadata(input_file):
+    """Reads the output of iam_metadata_extractor.py, in either its json or ndjson format.
+
+    Args:
+        input_file (str): Path to the extractor output, "-" for stdin.
+
+    Returns:
+        list: The extracted record of each table.
+    """
+    if input_file == "-":
+        content = sys.stdin.read()
+    else:
+        with open(input_file, "r") as f:
+            content = f.read()
+    if content.lstrip().startswith("["):
+        return [json.loads(record) if isinstance(record, str) else record for record in json.loads(content)]
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def desired_bindings(iam_metadata):
+    """Normalizes an iam_metadata block to the members of each role it declares.
+
+    Both {"bindings": [{"role": ..., "members": [...]}]} and {"<role>": ["<member>", ...]} blocks are accepted.
+
+    Args:
+        iam_metadata (dict): The decoded iam_metadata block of a SQLX file.
+
+    Returns:
+        dict: The set of members of each declared role.
+    """
+    if "bindings" in iam_metadata:
+        pairs = [(binding["role"], binding.get("members", [])) for binding in iam_metadata["bindings"]]
+    else:
+        pairs = iam_metadata.items()
+    roles = collections.defaultdict(set)
+    for role, members in pairs:
+        roles[role].update([members] if isinstance(members, str) else members)
+    return dict(roles)
+
+
+def table_id(record, default_project, default_dataset):
+    """Returns the fully qualified id of the table of an extracted record."""
+    return f"{record.get('database') or default_project}.{record.get('schema') or default_dataset}.{record['table']}"
+
+
+def diff_policy(policy, desired):
+    """Computes the binding changes needed for a policy to match the desired role members.
+
+    Declared roles are authoritative: their unconditional members are set to exactly the declared ones. Roles
+    that are not declared and conditional bindings are left untouched.
+
+    Args:
+        policy: The current google.api_core.iam.Policy of the table.
+        desired (dict): The set of members of each declared role.
+
+    Returns:
+        dict: The members to add and remove for each role that changes, empty when the policy already matches.
+    """
+    current = collections.defaultdict(set)
+    for binding in policy.bindings:
+        if not binding.get("condition"):
+            current[binding["role"]].update(binding["members"])
+    changes = {}
+    for role, members in desired.items():
+        add, remove = members - current[role], current[role] - members
+        if add or remove:
+            changes[role] = {"add": sorted(add), "remove": sorted(remove)}
+    return changes
+
+
+def apply_changes(policy, desired, changes):
+    """Rewrites the unconditional bindings of the changed roles of a policy, in place."""
+    policy.bindings = [binding for binding in policy.bindings
+                       if binding.get("condition") or binding["role"] not in changes]
+    policy.bindings.extend({"role": role, "members": sorted(desired[role])} for role in sorted(changes)
+                           if desired[role])
+
+
+def reconcile_table(client, table, desired, dry_run=False):
+    """Reconciles the IAM policy of a table with its declared bindings.
+
+    setIamPolicy is only called when the diff is not empty. It carries the etag of the policy the diff was
+    computed from, and on a concurrent modification the policy is fetched and diffed again.
+
+    Args:
+        client: The BigQuery client.
+        table (str): The fully qualified table id.
+        desired (dict): The set of members of each declared role.
+        dry_run (bool): Only compute the diff.
+
+    Returns:
+        dict: The applied (or, in dry run, pending) changes of each role, empty when the policy already matches.
+    """
+    from google.api_core import exceptions
+
+    for attempt in range(MAX_ETAG_RETRIES):
+        policy = client.get_iam_policy(table)
+        changes = diff_policy(policy, desired)
+        if not changes or dry_run:
+            return changes
+        apply_changes(policy, desired, changes)
+        try:
+            client.set_iam_policy(table, policy)
+            return changes
+        except (exceptions.PreconditionFailed, exceptions.Conflict, exceptions.Aborted) as e:
+            logging.warning(f"IAM policy of {table} changed concurrently, retrying: {e}")
+            time.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1))
+    raise RuntimeError(f"Could not set the IAM policy of {table} after {MAX_ETAG_RETRIES} attempts")
+
+
+def reconcile_tables(records, project_id, default_dataset=None, max_workers=16, dry_run=False):
+    """Reconciles the IAM policies of the tables of the extracted records concurrently.
+
+    Args:
+        records (list): The records read from the extractor output.
+        project_id (str): The project of the BigQuery client, and of tables without a database.
+        default_dataset (str): The dataset of tables without a schema.
+        max_workers (int): Maximum number of tables reconciled at the same time.
+        dry_run (bool): Only compute the diffs.
+
+    Returns:
+        dict: The changes of each changed table, the number of unchanged tables and the errors of failed ones.
+    """
+    client = get_bigquery_client(project_id)
+    desired = collections.defaultdict(lambda: collections.defaultdict(set))
+    for record in records:
+        for role, members in desired_bindings(record["iam_metadata"]).items():
+            desired[table_id(record, project_id, default_dataset)][role].update(members)
+
+    summary = {"changed": {}, "unchanged": 0, "failed": {}}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(reconcile_table, client, table, dict(roles), dry_run): table
+                   for table, roles in desired.items()}
+        for future in concurrent.futures.as_completed(futures):
+            table = futures[future]
+            try:
+                changes = future.result()
+            except Exception as e:
+                logging.error(f"Error reconciling the IAM policy of {table}: {e}")
+                summary["failed"][table] = str(e)
+                continue
+            if changes:
+                logging.info(f"{'would update' if dry_run else 'updated'} the IAM policy of {table}: {changes}")
+                summary["changed"][table] = changes
+            else:
+                summary["unchanged"] += 1
+    return summary
+
+
+def main(args: collections.abc.Sequence[str]) -> int:
+    """Applies the IAM metadata extracted from Dataform SQLX files to the BigQuery tables.
+    To run the script, provide the required command-line arguments:
+        python iam_metadata_extractor.py --remote_repo_url ... --dataform_repositories_git_token ... > iam_metadata.json
+        python bigquery_iam_applier.py --input iam_metadata.json --project_id your_project_id
+    """
+    parser = argparse.ArgumentParser(description="BigQuery table IAM applier of extracted Dataform IAM metadata")
+    parser.add_argument("--input",
+                        type=str,
+                        default="-",
+                        help="The output of iam_metadata_extractor.py in json or ndjson format, - for stdin.")
+    parser.add_argument("--project_id",
+                        type=str,
+                        required=True,
+                        help="The GCP project of the BigQuery client and of tables without a database.")
+    parser.add_argument("--default_dataset",
+                        type=str,
+                        default=None,
+                        help="The dataset of tables whose SQLX config has no schema.")
+    parser.add_argument("--max_workers",
+                        type=int,
+                        default=16,
+                        help="Maximum number of tables reconciled concurrently.")
+    parser.add_argument("--dry_run",
+                        action="store_true",
+                        help="Print the binding changes without setting any IAM policy.")
+    params = parser.parse_args(args)
+
+    records = read_extracted_metadata(str(params.input))
+    missing_dataset = [record["table"] for record in records if not record.get("schema")]
+    if missing_dataset and not params.default_dataset:
+        parser.error(f"--default_dataset is required for tables without a schema: {', '.join(missing_dataset)}")
+
+    summary = reconcile_tables(records, str(params.project_id), params.default_dataset,
+                               max_workers=int(params.max_workers), dry_run=params.dry_run)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
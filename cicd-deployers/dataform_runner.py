@@ -16,28 +16,86 @@ import logging
 import time
 import argparse
 import collections
+import concurrent.futures
+import functools
 import sys
 import json
+import os
 import re
+import signal
+import statistics
+from google.api_core import exceptions as api_exceptions
 from google.cloud import dataform_v1beta1
-from google.cloud import asset_v1
-df_client = dataform_v1beta1.DataformClient()
-iam_client = asset_v1.AssetServiceClient()
+import sqlx_indexer
 
+COST_HISTORY_MAX_ENTRIES = 20
+COST_HISTORY_MIN_ENTRIES = 3
+JOB_STATISTICS_QUERY = """
+SELECT
+  job_id,
+  total_slot_ms,
+  total_bytes_processed,
+  total_bytes_billed,
+  (SELECT SUM(stage.shuffle_output_bytes) FROM UNNEST(job_stages) AS stage) AS shuffle_output_bytes,
+  (SELECT SUM(stage.shuffle_output_bytes_spilled) FROM UNNEST(job_stages) AS stage) AS shuffle_output_bytes_spilled
+FROM `{project}.region-{location}.INFORMATION_SCHEMA.JOBS`
+WHERE creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @lookback_hours HOUR)
+  AND job_id IN UNNEST(@job_ids)
+"""
+JOB_STATISTICS_FIELDS = ("total_slot_ms", "total_bytes_processed", "total_bytes_billed", "shuffle_output_bytes",
+                         "shuffle_output_bytes_spilled")
+POLL_INTERVAL_SECONDS = 4
+MAX_POLL_INTERVAL_SECONDS = 60
+DURATION_HISTORY_MAX_ENTRIES = 20
+RESUMABLE_INVOCATION_STATES = ('FAILED', 'CANCELLED')
+COMMIT_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+MISSING_RELATION_PATTERN = re.compile(r'Not found: (Table|Dataset) ([\w\-.:]+)')
+SLOWEST_ACTIONS_REPORTED = 5
+# Workflow invocations created by this process that have not reached a terminal state yet.
+active_invocations = set()
 
-def execute_workflow(repo_uri: str, compilation_result: str, tags: list):
+
+@functools.lru_cache(maxsize=None)
+def get_dataform_client():
+    """Returns the Dataform client, created on first use."""
+    return dataform_v1beta1.DataformClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_asset_client():
+    """Returns the Cloud Asset client, created on first use since only service account validation needs it."""
+    from google.cloud import asset_v1
+    return asset_v1.AssetServiceClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_bigquery_client(project: str):
+    """Returns the BigQuery client of a project, created on first use since only dry runs and cost attribution
+    need it."""
+    from google.cloud import bigquery
+    return bigquery.Client(project=project)
+
+
+def execute_workflow(repo_uri: str, compilation_result: str, tags: list, included_targets: list = None):
     """Triggers a Dataform workflow execution based on a provided compilation result.
 
     Args:
         repo_uri (str): The URI of the Dataform repository.
         compilation_result (str): The name of the compilation result to use.
+        tags (list): The tags of the actions to execute.
+        included_targets (list): The Target objects of the actions to execute instead of the tagged actions.
 
     Returns:
         str: The name of the created workflow invocation.
     """
-    invocation_config = dataform_v1beta1.types.InvocationConfig(
-        included_tags=tags
-    )
+    if included_targets:
+        invocation_config = dataform_v1beta1.types.InvocationConfig(
+            included_targets=included_targets
+        )
+    else:
+        invocation_config = dataform_v1beta1.types.InvocationConfig(
+            included_tags=tags
+        )
     request = dataform_v1beta1.CreateWorkflowInvocationRequest(
         parent=repo_uri,
         workflow_invocation=dataform_v1beta1.types.WorkflowInvocation(
@@ -45,23 +103,45 @@ def execute_workflow(repo_uri: str, compilation_result: str, tags: list):
             invocation_config=invocation_config
         )
     )
-    response = df_client.create_workflow_invocation(request=request)
+    response = get_dataform_client().create_workflow_invocation(request=request)
     name = response.name
+    active_invocations.add(name)
     logging.info(f'created workflow invocation {name}')
     return name
 
 
-def compile_workflow(repo_uri: str, branch: str):
+def cancel_workflows(workflow_invocation_names):
+    """Cancels Dataform workflow invocations, ignoring those that already finished.
+
+    Args:
+        workflow_invocation_names (list): The names of the workflow invocations to cancel.
+    """
+    for name in list(workflow_invocation_names):
+        try:
+            request = dataform_v1beta1.CancelWorkflowInvocationRequest(name=name)
+            get_dataform_client().cancel_workflow_invocation(request=request)
+            logging.info(f'cancelled workflow invocation {name}')
+        except Exception as e:
+            logging.warning(f'Could not cancel workflow invocation {name}: {e}')
+        active_invocations.discard(name)
+
+
+def handle_termination_signal(signum, frame):
+    """Cancels the running workflow invocations before exiting on SIGINT or SIGTERM."""
+    logging.warning(f'received signal {signal.Signals(signum).name}, cancelling running workflow invocations')
+    cancel_workflows(active_invocations)
+    sys.exit(128 + signum)
+
+
+def create_compilation_result(repo_uri: str, branch: str):
     """Compiles a Dataform workflow using a specified Git branch.
 
     Args:
         repo_uri (str): The URI of the Dataform repository.
-        gcp_project (str): The GCP project ID.
-        tag (str): The dataform tag to compile.
         branch (str): The Git branch to compile.
 
     Returns:
-        str: The name of the created compilation result.
+        The created CompilationResult, including its resolved git commit SHA.
     """
     request = dataform_v1beta1.CreateCompilationResultRequest(
         parent=repo_uri,
@@ -69,40 +149,854 @@ def compile_workflow(repo_uri: str, branch: str):
             git_commitish=branch
         )
     )
-    response = df_client.create_compilation_result(request=request)
-    name = response.name
-    logging.info(f'compiled workflow {name}')
-    return name
+    response = get_dataform_client().create_compilation_result(request=request)
+    logging.info(f'compiled workflow {response.name}')
+    return response
 
 
-def get_workflow_status(workflow_invocation_name):
-    """Monitors the status of a Dataform workflow invocation.
+def compile_workflow(repo_uri: str, branch: str):
+    """Compiles a Dataform workflow using a specified Git branch.
 
     Args:
-        workflow_invocation_name (str): The ID of the workflow invocation.
-        df_client: The Dataform client object.
+        repo_uri (str): The URI of the Dataform repository.
+        gcp_project (str): The GCP project ID.
+        tag (str): The dataform tag to compile.
+        branch (str): The Git branch to compile.
+
+    Returns:
+        str: The name of the created compilation result.
+    """
+    return create_compilation_result(repo_uri, branch).name
+
+
+def load_compilation_cache(cache_file: str):
+    """Loads the compilation results previously created for exact commits.
+
+    Args:
+        cache_file (str): Path to the JSON compilation cache.
+
+    Returns:
+        dict: Compilation result names keyed by "repository_uri@commit_sha".
+    """
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f'Could not read compilation cache file {cache_file}, starting a new one.')
+        return {}
+
+
+def save_compilation_cache(cache_file: str, cache: dict):
+    """Persists the compilation results created for exact commits.
+
+    Args:
+        cache_file (str): Path to the JSON compilation cache.
+        cache (dict): Compilation result names keyed by "repository_uri@commit_sha".
     """
-    while True:
+    if not cache_file:
+        return
+    tmp_file = f'{cache_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_file, cache_file)
+
+
+def get_or_create_compilation_result(repo_uri: str, commitish: str, cache: dict):
+    """Returns the compilation result of a commit, reusing the cached one when commitish is an exact commit SHA.
+
+    Branch names are always compiled since they can move between runs.
+
+    Args:
+        repo_uri (str): The URI of the Dataform repository.
+        commitish (str): The Git branch or commit SHA to compile.
+        cache (dict): Compilation result names keyed by "repository_uri@commit_sha", updated in place.
+
+    Returns:
+        The CompilationResult of the commit.
+    """
+    cache_key = f'{repo_uri}@{commitish}'
+    if COMMIT_SHA_PATTERN.match(commitish) and cache_key in cache:
+        try:
+            request = dataform_v1beta1.GetCompilationResultRequest(name=cache[cache_key])
+            compilation = get_dataform_client().get_compilation_result(request=request)
+            logging.info(f'reusing compilation result {compilation.name} for {cache_key}')
+            return compilation
+        except api_exceptions.NotFound:
+            logging.info(f'cached compilation result {cache[cache_key]} no longer exists, recompiling')
+    compilation = create_compilation_result(repo_uri, commitish)
+    if COMMIT_SHA_PATTERN.match(commitish):
+        cache[cache_key] = compilation.name
+    return compilation
+
+
+def get_compilation_results(compilation_result_names: dict):
+    """Fetches existing compilation results.
+
+    Args:
+        compilation_result_names (dict): Compilation result names keyed by repository name.
+
+    Returns:
+        dict: The CompilationResult objects keyed by repository name.
+    """
+    compilations = {}
+    for repo_name, name in compilation_result_names.items():
+        request = dataform_v1beta1.GetCompilationResultRequest(name=name)
+        compilations[repo_name] = get_dataform_client().get_compilation_result(request=request)
+    return compilations
+
+
+def list_pending_actions(compilation_result: str, tags: list):
+    """Lists the compiled actions an invocation with the given tags would run.
+
+    Args:
+        compilation_result (str): The name of the compilation result.
+        tags (list): The tags of the actions to execute, all actions are included when empty.
+
+    Returns:
+        list: The formatted targets of the matching actions.
+    """
+    return sorted(format_target(action.target) for action in get_compiled_actions(compilation_result)
+                  if not tags or set(tags) & set(compiled_action_tags(action)))
+
+
+def get_last_workflow_invocation(repo_uri: str):
+    """Finds the most recently started workflow invocation of a repository.
+
+    Args:
+        repo_uri (str): The URI of the Dataform repository.
+
+    Returns:
+        The most recent WorkflowInvocation, or None if the repository was never invoked.
+    """
+    request = dataform_v1beta1.ListWorkflowInvocationsRequest(parent=repo_uri)
+    invocations = [invocation for invocation in get_dataform_client().list_workflow_invocations(request=request)
+                   if invocation.invocation_timing.start_time]
+    if not invocations:
+        return None
+    return max(invocations, key=lambda invocation: invocation.invocation_timing.start_time)
+
+
+def plan_resume(repo_uri: str, compilation):
+    """Works out how to resume the last invocation of a repository if it failed.
+
+    Only the actions that did not succeed (failed, skipped, cancelled or never started) are re-invoked, using the
+    failed invocation's compilation result. When the branch moved to another commit since then, or the last
+    invocation did not fail, nothing is resumed and a full run is needed.
+
+    Args:
+        repo_uri (str): The URI of the Dataform repository.
+        compilation: The CompilationResult just created for the branch.
+
+    Returns:
+        tuple: The compilation result name to invoke and the Target objects to include, or None for a full run.
+    """
+    last_invocation = get_last_workflow_invocation(repo_uri)
+    if last_invocation is None or last_invocation.state.name not in RESUMABLE_INVOCATION_STATES:
+        logging.info(f'no failed invocation to resume for {repo_uri}, running all actions')
+        return compilation.name, None
+
+    request = dataform_v1beta1.GetCompilationResultRequest(name=last_invocation.compilation_result)
+    last_compilation = get_dataform_client().get_compilation_result(request=request)
+    if last_compilation.resolved_git_commit_sha != compilation.resolved_git_commit_sha:
+        logging.info(f'{repo_uri} moved from commit {last_compilation.resolved_git_commit_sha} to '
+                     f'{compilation.resolved_git_commit_sha} since {last_invocation.name}, running all actions')
+        return compilation.name, None
+
+    targets = [action.target for action in get_invocation_actions(last_invocation.name)
+               if action.state.name not in ('SUCCEEDED', 'DISABLED')]
+    logging.info(f'resuming {len(targets)} actions of {last_invocation.name}')
+    return last_invocation.compilation_result, targets
+
+
+def load_duration_history(history_file: str):
+    """Loads the recorded durations of Dataform invocations and actions.
+
+    Args:
+        history_file (str): Path to the JSON duration history file.
+
+    Returns:
+        dict: Recent {"commit_sha", "duration_seconds"} entries of each repository invocation under "invocations",
+        keyed by repository name, and of each action under "actions", keyed by target.
+    """
+    history = {"invocations": {}, "actions": {}}
+    if not history_file or not os.path.exists(history_file):
+        return history
+    try:
+        with open(history_file, 'r') as f:
+            history.update(json.load(f))
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f'Could not read duration history file {history_file}, starting a new one.')
+    return history
+
+
+def save_duration_history(history_file: str, history: dict):
+    """Persists the recorded durations of Dataform invocations and actions.
+
+    Args:
+        history_file (str): Path to the JSON duration history file.
+        history (dict): Recent durations of each repository invocation and action.
+    """
+    if not history_file:
+        return
+    tmp_file = f'{history_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_file, history_file)
+
+
+def estimate_duration(entries: list, commit_sha: str = None):
+    """Estimates a duration from recorded entries, preferring the entries recorded for the same commit.
+
+    Args:
+        entries (list): Recorded {"commit_sha", "duration_seconds"} entries.
+        commit_sha (str): The commit about to run.
+
+    Returns:
+        float: The median recorded duration in seconds, or None if there is no history.
+    """
+    same_commit = [entry["duration_seconds"] for entry in entries if entry["commit_sha"] == commit_sha]
+    durations = same_commit or [entry["duration_seconds"] for entry in entries]
+    return statistics.median(durations) if durations else None
+
+
+def record_durations(history: dict, repo_name: str, commit_sha: str, duration_seconds: float, actions: list):
+    """Appends the durations of a finished invocation and its actions to the history.
+
+    Args:
+        history (dict): Recent durations of each repository invocation and action, updated in place.
+        repo_name (str): The name of the Dataform repository.
+        commit_sha (str): The commit that was run.
+        duration_seconds (float): The duration of the invocation.
+        actions (list): The WorkflowInvocationAction objects of the invocation.
+    """
+    if duration_seconds is not None:
+        entries = history["invocations"].get(repo_name, [])
+        entries.append({"commit_sha": commit_sha, "duration_seconds": duration_seconds})
+        history["invocations"][repo_name] = entries[-DURATION_HISTORY_MAX_ENTRIES:]
+    for action in actions:
+        action_duration = interval_seconds(action.invocation_timing)
+        if action_duration is None or action.state.name != 'SUCCEEDED':
+            continue
+        target = format_target(action.target)
+        entries = history["actions"].get(target, [])
+        entries.append({"commit_sha": commit_sha, "duration_seconds": action_duration})
+        history["actions"][target] = entries[-DURATION_HISTORY_MAX_ENTRIES:]
+
+
+def next_poll_interval(pending: list, started: dict, expected: dict):
+    """Chooses how long to wait before polling again, based on the expected remaining time of the invocations.
+
+    Invocations far from their expected end are polled rarely, and polling speeds up as they get close to it.
+
+    Args:
+        pending (list): The names of the running workflow invocations.
+        started (dict): The epoch time each invocation was started, keyed by invocation name.
+        expected (dict): The expected duration in seconds of each invocation with history, keyed by name.
+
+    Returns:
+        float: Seconds to sleep before the next poll.
+    """
+    now = time.time()
+    remaining = [started[name] + expected[name] - now for name in pending if expected.get(name)]
+    if not remaining or len(remaining) < len(pending):
+        return POLL_INTERVAL_SECONDS
+    return max(POLL_INTERVAL_SECONDS, min(MAX_POLL_INTERVAL_SECONDS, min(remaining) / 10))
+
+
+def log_progress(pending: list, started: dict, expected: dict, labels: dict = None):
+    """Prints the elapsed time and ETA of the running workflow invocations to stderr.
+
+    Stdout is left alone, since Terraform reads the JSON result of the external data source from it.
+
+    Args:
+        pending (list): The names of the running workflow invocations.
+        started (dict): The epoch time each invocation was started, keyed by invocation name.
+        expected (dict): The expected duration in seconds of each invocation with history, keyed by name.
+        labels (dict): Display names of the invocations, keyed by invocation name.
+    """
+    now = time.time()
+    for name in pending:
+        label = (labels or {}).get(name, name)
+        elapsed = now - started[name]
+        if expected.get(name):
+            remaining = expected[name] - elapsed
+            eta = f'ETA {remaining:.0f}s' if remaining > 0 else f'{-remaining:.0f}s over its usual {expected[name]:.0f}s'
+            print(f'{label}: {elapsed:.0f}s elapsed, {eta}', file=sys.stderr, flush=True)
+        else:
+            print(f'{label}: {elapsed:.0f}s elapsed, no duration history for an ETA', file=sys.stderr, flush=True)
+
+
+def check_workflows(pending: list, started: dict, invocation_timeout: int = 0, run_deadline: float = None):
+    """Polls running Dataform workflow invocations once.
+
+    As soon as one invocation fails, or an invocation or the whole run goes past its deadline, the invocations
+    still running are cancelled so they stop consuming BigQuery slots.
+
+    Args:
+        pending (list): The names of the running workflow invocations, succeeded ones are removed from it.
+        started (dict): The epoch time each invocation was started, keyed by invocation name.
+        invocation_timeout (int): Maximum seconds each invocation may run, 0 for no limit.
+        run_deadline (float): Epoch time by which all invocations must finish, None for no limit.
+
+    Returns:
+        list: The names of the invocations that succeeded since the last poll.
+    """
+    succeeded = []
+    for name in list(pending):
         request = dataform_v1beta1.GetWorkflowInvocationRequest(
-            name=workflow_invocation_name
+            name=name
         )
-        response = df_client.get_workflow_invocation(request)
+        response = get_dataform_client().get_workflow_invocation(request)
         state = response.state.name
-        logging.info(f'workflow state: {state} for {workflow_invocation_name}')
+        logging.info(f'workflow state: {state} for {name}')
+
+        if state == 'SUCCEEDED':
+            pending.remove(name)
+            active_invocations.discard(name)
+            succeeded.append(name)
+        elif state in ('FAILED', 'CANCELING', 'CANCELLED'):
+            pending.remove(name)
+            active_invocations.discard(name)
+            cancel_workflows(pending)
+            raise Exception(f'Error while running workflow {name}')
+
+    now = time.time()
+    expired = [name for name in pending if invocation_timeout and now - started[name] > invocation_timeout]
+    if expired or (pending and run_deadline is not None and now > run_deadline):
+        cancel_workflows(pending)
+        raise TimeoutError(f'Deadline exceeded while running workflows {", ".join(expired or pending)}')
+    return succeeded
+
+
+def monitor_workflows(workflow_invocation_names: list, invocation_timeout: int = 0, run_deadline: float = None,
+                      expected: dict = None):
+    """Monitors several Dataform workflow invocations until all of them succeed.
+
+    Args:
+        workflow_invocation_names (list): The names of the workflow invocations.
+        invocation_timeout (int): Maximum seconds each invocation may run, 0 for no limit.
+        run_deadline (float): Epoch time by which all invocations must finish, None for no limit.
+        expected (dict): The expected duration in seconds of each invocation with history, keyed by name.
+    """
+    expected = expected or {}
+    started = {name: time.time() for name in workflow_invocation_names}
+    pending = list(workflow_invocation_names)
+    while pending:
+        check_workflows(pending, started, invocation_timeout=invocation_timeout, run_deadline=run_deadline)
+        if pending:
+            log_progress(pending, started, expected)
+            time.sleep(next_poll_interval(pending, started, expected))
+
+
+def schedule_workflows(runs: list, max_concurrent: int, max_concurrent_per_project: int,
+                       invocation_timeout: int = 0, run_deadline: float = None):
+    """Invokes compiled workflows of several repositories under global and per-project concurrency limits.
+
+    Runs are admitted in the given order whenever a global slot and a slot in their project are free, so runs
+    later in the list never delay earlier ones unless their project is saturated.
+
+    Args:
+        runs (list): Dicts with the repo_name, project, repo_uri, compilation_result, tags and optionally
+            included_targets and expected_seconds of each run, in admission order.
+        max_concurrent (int): Maximum invocations running at once across all projects.
+        max_concurrent_per_project (int): Maximum invocations running at once in the same project.
+        invocation_timeout (int): Maximum seconds each invocation may run, 0 for no limit.
+        run_deadline (float): Epoch time by which all invocations must finish, None for no limit.
+
+    Returns:
+        dict: The name of the workflow invocation of each repository.
+    """
+    queued = list(runs)
+    running = {}
+    started = {}
+    expected = {}
+    invocations = {}
+    while queued or running:
+        running_per_project = collections.Counter(run["project"] for run in running.values())
+        for run in list(queued):
+            if len(running) >= max_concurrent:
+                break
+            if running_per_project[run["project"]] >= max_concurrent_per_project:
+                continue
+            name = execute_workflow(run["repo_uri"], run["compilation_result"], run["tags"],
+                                    included_targets=run.get("included_targets"))
+            queued.remove(run)
+            running[name] = run
+            started[name] = time.time()
+            expected[name] = run.get("expected_seconds")
+            invocations[run["repo_name"]] = name
+            running_per_project[run["project"]] += 1
+            logging.info(f'admitted {run["repo_name"]} ({len(running)} running, {len(queued)} queued)')
+
+        pending = list(running)
+        for name in check_workflows(pending, started, invocation_timeout=invocation_timeout,
+                                    run_deadline=run_deadline):
+            running.pop(name)
+        if running:
+            log_progress(list(running), started, expected,
+                         labels={name: run["repo_name"] for name, run in running.items()})
+            time.sleep(next_poll_interval(list(running), started, expected))
+    return invocations
+
+
+def get_workflow_status(workflow_invocation_name, invocation_timeout: int = 0, run_deadline: float = None,
+                        expected_seconds: float = None):
+    """Monitors the status of a Dataform workflow invocation.
+
+    Args:
+        workflow_invocation_name (str): The ID of the workflow invocation.
+        invocation_timeout (int): Maximum seconds the invocation may run, 0 for no limit.
+        run_deadline (float): Epoch time by which the invocation must finish, None for no limit.
+        expected_seconds (float): The expected duration of the invocation, from its history.
+    """
+    monitor_workflows([workflow_invocation_name], invocation_timeout=invocation_timeout, run_deadline=run_deadline,
+                      expected={workflow_invocation_name: expected_seconds})
+
+
+def format_target(target):
+    """Formats a Dataform action target as a fully qualified table name.
+
+    Args:
+        target: The Dataform Target object of an action.
+
+    Returns:
+        str: The target formatted as database.schema.name.
+    """
+    return f'{target.database}.{target.schema}.{target.name}'
+
+
+def get_compiled_actions(compilation_result: str):
+    """Lists the actions of a compilation result.
+
+    Args:
+        compilation_result (str): The name of the compilation result.
+
+    Returns:
+        list: The CompilationResultAction objects.
+    """
+    request = dataform_v1beta1.QueryCompilationResultActionsRequest(name=compilation_result)
+    return list(get_dataform_client().query_compilation_result_actions(request=request))
+
+
+def compiled_action_tags(action):
+    """Returns the tags defined in the config block of a compiled action."""
+    return list(action.relation.tags) or list(action.operations.tags) or list(action.assertion.tags)
+
+
+def compiled_action_queries(action):
+    """Returns the SQL statements a compiled action runs, in order.
+
+    Args:
+        action: The CompilationResultAction object.
+
+    Returns:
+        list: The SQL of the relation (with its pre and post operations), operations or assertion, empty for
+        declarations.
+    """
+    if action.relation.select_query:
+        return (list(action.relation.pre_operations) + [action.relation.select_query] +
+                list(action.relation.post_operations))
+    if action.operations.queries:
+        return list(action.operations.queries)
+    if action.assertion.select_query:
+        return [action.assertion.select_query]
+    return []
+
+
+def get_compiled_action_tags(compilation_result: str):
+    """Maps each compiled action target to the tags defined in its config block.
+
+    Args:
+        compilation_result (str): The name of the compilation result.
 
-        if state == 'RUNNING':
-            time.sleep(4)
+    Returns:
+        dict: Tags of each action, keyed by formatted target.
+    """
+    return {format_target(action.target): compiled_action_tags(action)
+            for action in get_compiled_actions(compilation_result)}
+
+
+def dry_run_queries(bigquery_client, location: str, queries: list):
+    """Dry-runs the SQL statements of an action.
+
+    Args:
+        bigquery_client: The BigQuery client.
+        location (str): The BigQuery region.
+        queries (list): The SQL statements to validate.
+
+    Returns:
+        tuple: The estimated bytes processed by all statements, and the first error message or None.
+    """
+    from google.cloud.bigquery import QueryJobConfig
+    total_bytes = 0
+    for query in queries:
+        job_config = QueryJobConfig(dry_run=True, use_query_cache=False)
+        try:
+            query_job = bigquery_client.query(query, job_config=job_config, location=location)
+        except api_exceptions.GoogleAPICallError as e:
+            return total_bytes, e.message
+        total_bytes += query_job.total_bytes_processed or 0
+    return total_bytes, None
+
+
+def preflight_dry_run(gcp_project: str, location: str, compilation_result: str, tags: list,
+                      max_bytes_processed: int = 0, max_workers: int = 16):
+    """Dry-runs the compiled SQL of all the actions an invocation would run, concurrently, before invoking it.
+
+    Errors about tables or datasets that are themselves created by actions of the graph are ignored, since they do
+    not exist until upstream actions run.
+
+    Args:
+        gcp_project (str): The GCP project ID.
+        location (str): The BigQuery region.
+        compilation_result (str): The name of the compilation result.
+        tags (list): The tags of the actions to execute, all actions are checked when empty.
+        max_bytes_processed (int): Budget for the estimated bytes processed by all the actions, 0 for no budget.
+        max_workers (int): Maximum number of concurrent dry runs.
+
+    Returns:
+        dict: The estimated bytes and error of each action, keyed by target, and the total estimated bytes.
+    """
+    actions = get_compiled_actions(compilation_result)
+    graph_tables = {format_target(action.target) for action in actions}
+    graph_datasets = {f'{action.target.database}.{action.target.schema}' for action in actions}
+    selected = {format_target(action.target): compiled_action_queries(action) for action in actions
+                if not tags or set(tags) & set(compiled_action_tags(action))}
+
+    bigquery_client = get_bigquery_client(gcp_project)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {target: executor.submit(dry_run_queries, bigquery_client, location, queries)
+                   for target, queries in selected.items() if queries}
+        dry_runs = {target: future.result() for target, future in futures.items()}
+
+    report = {"actions": {}, "total_bytes_processed": 0}
+    errors = []
+    for target, (bytes_processed, error) in sorted(dry_runs.items()):
+        missing = MISSING_RELATION_PATTERN.search(error or '')
+        if missing and missing.group(2).replace(':', '.') in (graph_tables | graph_datasets):
+            logging.info(f'{target} depends on {missing.group(2)}, created earlier in the graph, skipping its dry run')
+            error = None
+        report["actions"][target] = {"bytes_processed": bytes_processed, "error": error}
+        report["total_bytes_processed"] += bytes_processed
+        if error:
+            errors.append(f'{target}: {error}')
+    logging.info(f'dry run of {len(dry_runs)} actions of {compilation_result}: '
+                 f'{report["total_bytes_processed"]} bytes, {len(errors)} errors')
+
+    if errors:
+        raise Exception(f'Dry run failed for {compilation_result}:\n' + '\n'.join(errors))
+    if max_bytes_processed and report["total_bytes_processed"] > max_bytes_processed:
+        raise Exception(f'Dry run of {compilation_result} estimates {report["total_bytes_processed"]} bytes processed, '
+                        f'over the budget of {max_bytes_processed}')
+    return report
+
+
+def get_invocation_actions(workflow_invocation_name: str):
+    """Lists the actions executed by a Dataform workflow invocation.
+
+    Args:
+        workflow_invocation_name (str): The name of the workflow invocation.
+
+    Returns:
+        list: The WorkflowInvocationAction objects of the invocation.
+    """
+    request = dataform_v1beta1.QueryWorkflowInvocationActionsRequest(name=workflow_invocation_name)
+    return list(get_dataform_client().query_workflow_invocation_actions(request=request))
+
+
+def fetch_job_statistics(gcp_project: str, location: str, job_ids: list, lookback_hours: int = 24):
+    """Fetches the statistics of several BigQuery jobs with a single INFORMATION_SCHEMA.JOBS query.
+
+    Args:
+        gcp_project (str): The GCP project where the jobs ran.
+        location (str): The BigQuery region where the jobs ran.
+        job_ids (list): The BigQuery job IDs to look up.
+        lookback_hours (int): How far back to scan the JOBS view, used to prune its partitions.
+
+    Returns:
+        dict: Slot, bytes and shuffle statistics of each job, keyed by job ID.
+    """
+    if not job_ids:
+        return {}
+    from google.cloud import bigquery
+    bigquery_client = get_bigquery_client(gcp_project)
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("job_ids", "STRING", job_ids),
+            bigquery.ScalarQueryParameter("lookback_hours", "INT64", lookback_hours),
+        ]
+    )
+    query = JOB_STATISTICS_QUERY.format(project=gcp_project, location=location.lower())
+    statistics_by_job = {}
+    for row in bigquery_client.query(query, job_config=job_config, location=location).result():
+        statistics_by_job[row["job_id"]] = {field: int(row[field] or 0) for field in JOB_STATISTICS_FIELDS}
+    return statistics_by_job
+
+
+def execution_project(compilation, default_project: str):
+    """Returns the project the BigQuery jobs of a compilation result run in.
+
+    Args:
+        compilation: The Dataform CompilationResult object.
+        default_project (str): The defaultDatabase of the repository workflow settings.
+
+    Returns:
+        str: The defaultDatabase override of the compilation result if any, default_project otherwise.
+    """
+    return compilation.code_compilation_config.default_database or default_project
+
+
+def load_cost_history(history_file: str):
+    """Loads the recorded slot usage history of Dataform actions and repositories.
+
+    Args:
+        history_file (str): Path to the JSON history file.
+
+    Returns:
+        dict: Recent total_slot_ms values of each action under "actions", keyed by target, and of each repository
+        invocation under "repositories", keyed by repository name.
+    """
+    history = {"actions": {}, "repositories": {}}
+    if not history_file or not os.path.exists(history_file):
+        return history
+    try:
+        with open(history_file, 'r') as f:
+            history.update(json.load(f))
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f'Could not read cost history file {history_file}, starting a new one.')
+    return history
+
+
+def repository_slot_usage(history: dict, repo_name: str):
+    """Returns the median total_slot_ms of the recorded invocations of a repository, 0 if there is none."""
+    previous = history["repositories"].get(repo_name, [])
+    return statistics.median(previous) if previous else 0
+
+
+def save_cost_history(history_file: str, history: dict):
+    """Persists the slot usage history of Dataform actions.
+
+    Args:
+        history_file (str): Path to the JSON history file.
+        history (dict): Recent total_slot_ms values of each action and repository.
+    """
+    if not history_file:
+        return
+    tmp_file = f'{history_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_file, history_file)
+
+
+def attribute_invocation_costs(gcp_project: str, location: str, compilation_result: str,
+                               workflow_invocation_name: str, history_file: str = None,
+                               growth_threshold: float = 2.0, actions: list = None, repo_name: str = None,
+                               execution_project: str = None):
+    """Attributes BigQuery slot and bytes usage to the actions and tags of a workflow invocation.
+
+    Actions whose total_slot_ms is more than growth_threshold times the median of their recorded history are
+    flagged as regressions.
+
+    Args:
+        gcp_project (str): The GCP project ID.
+        location (str): The GCP region.
+        compilation_result (str): The name of the compilation result that was invoked.
+        workflow_invocation_name (str): The name of the workflow invocation.
+        history_file (str): Path to the JSON cost history file, history is not used when empty.
+        growth_threshold (float): Ratio against the historical median above which an action is flagged.
+        actions (list): The already fetched actions of the invocation, queried if not given.
+        repo_name (str): The name of the Dataform repository, its total slot usage is recorded when given.
+        execution_project (str): The project the BigQuery jobs of the invocation ran in, whose JOBS view is queried,
+            gcp_project if not given.
+
+    Returns:
+        dict: Per action and per tag statistics, plus the list of flagged actions.
+    """
+    action_tags = get_compiled_action_tags(compilation_result)
+    if actions is None:
+        actions = get_invocation_actions(workflow_invocation_name)
+    job_ids_by_target = {}
+    for action in actions:
+        job_id = action.bigquery_action.job_id
+        if job_id:
+            job_ids_by_target[format_target(action.target)] = job_id
+
+    job_statistics = fetch_job_statistics(execution_project or gcp_project, location,
+                                          list(job_ids_by_target.values()))
+    history = load_cost_history(history_file)
+
+    per_action = {}
+    per_tag = collections.defaultdict(lambda: dict.fromkeys(JOB_STATISTICS_FIELDS, 0))
+    flagged = []
+    for target, job_id in job_ids_by_target.items():
+        stats = job_statistics.get(job_id)
+        if stats is None:
+            logging.warning(f'No INFORMATION_SCHEMA.JOBS statistics found for job {job_id} of {target}')
             continue
-        if state in ('FAILED', 'CANCELING', 'CANCELLED'):
-            raise Exception(f'Error while running workflow {workflow_invocation_name}')
-        elif state == 'SUCCEEDED':
-            return
-        break
-    return
+        per_action[target] = dict(stats, job_id=job_id, tags=action_tags.get(target, []))
+        for tag in action_tags.get(target, []):
+            for field in JOB_STATISTICS_FIELDS:
+                per_tag[tag][field] += stats[field]
+
+        previous = history["actions"].get(target, [])
+        if len(previous) >= COST_HISTORY_MIN_ENTRIES:
+            baseline = statistics.median(previous)
+            if baseline and stats['total_slot_ms'] > growth_threshold * baseline:
+                flagged.append(target)
+                logging.warning(f'{target} used {stats["total_slot_ms"]} slot-ms, '
+                                f'{stats["total_slot_ms"] / baseline:.1f}x its historical median of {baseline:.0f}')
+        history["actions"][target] = (previous + [stats['total_slot_ms']])[-COST_HISTORY_MAX_ENTRIES:]
+
+    if repo_name:
+        total_slot_ms = sum(stats['total_slot_ms'] for stats in per_action.values())
+        previous = history["repositories"].get(repo_name, [])
+        history["repositories"][repo_name] = (previous + [total_slot_ms])[-COST_HISTORY_MAX_ENTRIES:]
+    save_cost_history(history_file, history)
+
+    for target, stats in per_action.items():
+        logging.info(f'action {target}: slot_ms={stats["total_slot_ms"]} '
+                     f'bytes_processed={stats["total_bytes_processed"]} '
+                     f'shuffle_bytes={stats["shuffle_output_bytes"]}')
+    for tag, stats in per_tag.items():
+        logging.info(f'tag {tag}: slot_ms={stats["total_slot_ms"]} '
+                     f'bytes_processed={stats["total_bytes_processed"]} '
+                     f'shuffle_bytes={stats["shuffle_output_bytes"]}')
+
+    return {
+        "actions": per_action,
+        "tags": dict(per_tag),
+        "flagged_actions": flagged,
+    }
+
+
+def interval_seconds(interval):
+    """Returns the duration in seconds of a Dataform Interval, or None if it has not ended."""
+    if not interval or not interval.start_time or not interval.end_time:
+        return None
+    return round((interval.end_time - interval.start_time).total_seconds(), 3)
+
+
+def summarize_invocation(workflow_invocation_name: str, actions: list):
+    """Summarizes the outcome of a workflow invocation.
+
+    Args:
+        workflow_invocation_name (str): The name of the workflow invocation.
+        actions (list): The WorkflowInvocationAction objects of the invocation.
+
+    Returns:
+        dict: The final state and duration of the invocation, the count of actions per state and the slowest actions.
+    """
+    request = dataform_v1beta1.GetWorkflowInvocationRequest(name=workflow_invocation_name)
+    invocation = get_dataform_client().get_workflow_invocation(request)
+    action_durations = []
+    for action in actions:
+        duration = interval_seconds(action.invocation_timing)
+        if duration is not None:
+            action_durations.append({"target": format_target(action.target), "state": action.state.name,
+                                     "duration_seconds": duration})
+    action_durations.sort(key=lambda action: action["duration_seconds"], reverse=True)
+    return {
+        "state": invocation.state.name,
+        "duration_seconds": interval_seconds(invocation.invocation_timing),
+        "action_state_counts": dict(collections.Counter(action.state.name for action in actions)),
+        "slowest_actions": action_durations[:SLOWEST_ACTIONS_REPORTED],
+    }
+
+
+def format_external_result(result: dict):
+    """Formats a result for a Terraform external data source, which only accepts string values.
+
+    Args:
+        result (dict): The result to format, nested values are JSON encoded and None becomes an empty string.
+
+    Returns:
+        dict: The result with every value as a string.
+    """
+    formatted = {}
+    for key, value in result.items():
+        if value is None:
+            formatted[key] = ""
+        elif isinstance(value, str):
+            formatted[key] = value
+        else:
+            formatted[key] = json.dumps(value)
+    return formatted
+
+
+def validate_required_roles(gcp_project: str, service_account_roles: list, validation_cache_file: str = None,
+                            validation_cache_ttl: int = 3600):
+    """Raises if any "service_account_email=role" pair is not granted in the project.
+
+    Args:
+        gcp_project (str): The GCP project ID.
+        service_account_roles (list): "service_account_email=role" pairs that must be granted in gcp_project.
+        validation_cache_file (str): Path to the JSON cache of service account validation results.
+        validation_cache_ttl (int): Maximum age in seconds of a cached validation result.
+    """
+    checks = [(gcp_project, *pair.split("=", 1)) for pair in service_account_roles]
+    results = validate_service_accounts(checks, cache_file=validation_cache_file,
+                                        ttl_seconds=validation_cache_ttl)
+    missing = [f'{email} ({role})' for (_, email, role), granted in results.items() if not granted]
+    if missing:
+        raise Exception(f'Service accounts missing required roles in {gcp_project}: {", ".join(missing)}')
+
+
+def summarize_run(gcp_project: str, location: str, repo_name: str, compilation_result: str,
+                  workflow_invocation_name: str, attribute_costs: str = "false", cost_history_file: str = None,
+                  cost_growth_threshold: float = 2.0, duration_history: dict = None, commit_sha: str = None,
+                  expected_seconds: float = None, duration_alert_threshold: float = 2.0,
+                  execution_project: str = None):
+    """Collects the outcome of a finished workflow invocation, attributing its costs if requested.
+
+    Args:
+        gcp_project (str): The GCP project ID.
+        location (str): The GCP region.
+        repo_name (str): The name of the Dataform repository.
+        compilation_result (str): The name of the compilation result that was invoked.
+        workflow_invocation_name (str): The name of the workflow invocation.
+        attribute_costs (str): Whether to attribute slot and bytes usage to the executed actions.
+        cost_history_file (str): Path to the JSON file where slot usage history is recorded.
+        cost_growth_threshold (float): Ratio against the historical median above which an action is flagged.
+        duration_history (dict): Recent durations of each repository invocation and action, updated in place.
+        commit_sha (str): The commit that was run.
+        expected_seconds (float): The expected duration of the invocation, from its history.
+        duration_alert_threshold (float): Ratio against the expected duration above which the run is reported as a
+            duration regression.
+        execution_project (str): The project the BigQuery jobs of the invocation ran in, gcp_project if not given.
+
+    Returns:
+        dict: The invocation name, final state, duration, expected duration, whether it is a duration regression,
+        count of actions per state, slowest actions and, when costs are attributed, the flagged actions.
+    """
+    actions = get_invocation_actions(workflow_invocation_name)
+    result = {"workflow_invocation": workflow_invocation_name}
+    result.update(summarize_invocation(workflow_invocation_name, actions))
+    result["expected_duration_seconds"] = expected_seconds
+    result["duration_regression"] = bool(expected_seconds and result["duration_seconds"] and
+                                         result["duration_seconds"] > duration_alert_threshold * expected_seconds)
+    if result["duration_regression"]:
+        logging.warning(f'{repo_name} took {result["duration_seconds"]:.0f}s, '
+                        f'{result["duration_seconds"] / expected_seconds:.1f}x its usual {expected_seconds:.0f}s')
+    if duration_history is not None:
+        record_durations(duration_history, repo_name, commit_sha, result["duration_seconds"], actions)
+    if attribute_costs.lower() == "true":
+        costs = attribute_invocation_costs(gcp_project, location, compilation_result, workflow_invocation_name,
+                                           history_file=cost_history_file, growth_threshold=cost_growth_threshold,
+                                           actions=actions, repo_name=repo_name,
+                                           execution_project=execution_project)
+        result["flagged_actions"] = costs["flagged_actions"]
+    return result
 
 
 def run_workflow(gcp_project: str, project_num: str, location: str, repo_name: str, tags: list, execute: str,
-                 branch: str):
+                 branch: str, attribute_costs: str = "false", cost_history_file: str = None,
+                 cost_growth_threshold: float = 2.0, service_account_roles: list = None,
+                 validation_cache_file: str = None, validation_cache_ttl: int = 3600, invocation_timeout: int = 0,
+                 run_timeout: int = 0, resume: str = "false", duration_history_file: str = None,
+                 duration_alert_threshold: float = 2.0, dry_run: str = "false", max_bytes_processed: int = 0,
+                 default_project: str = None):
     """Orchestrates the complete Dataform workflow process: compilation and execution.
 
     Args:
@@ -112,15 +1006,211 @@ def run_workflow(gcp_project: str, project_num: str, location: str, repo_name: s
         repo_name (str): The name of the Dataform repository.
         tag (str): The target tags to compile and execute.
         branch (str): The Git branch to use.
+        attribute_costs (str): Whether to attribute slot and bytes usage to the executed actions.
+        cost_history_file (str): Path to the JSON file where per action slot usage history is recorded.
+        cost_growth_threshold (float): Ratio against the historical median above which an action is flagged.
+        service_account_roles (list): "service_account_email=role" pairs that must be granted in gcp_project
+            before compiling.
+        validation_cache_file (str): Path to the JSON cache of service account validation results.
+        validation_cache_ttl (int): Maximum age in seconds of a cached validation result.
+        invocation_timeout (int): Maximum seconds a workflow invocation may run before it is cancelled, 0 for no limit.
+        run_timeout (int): Maximum seconds the whole run may take before running invocations are cancelled, 0 for
+            no limit.
+        resume (str): Whether to re-invoke only the actions that did not succeed in the last invocation, if it failed.
+        duration_history_file (str): Path to the JSON file where invocation and action durations are recorded.
+        duration_alert_threshold (float): Ratio against the expected duration above which the run is reported as a
+            duration regression.
+        dry_run (str): Whether to dry-run the compiled actions and refuse to invoke them on errors.
+        max_bytes_processed (int): Budget for the bytes the dry run estimates all actions process, 0 for no budget.
+        default_project (str): The defaultDatabase of the repository workflow settings, where its BigQuery jobs run
+            unless the compilation overrides it, gcp_project if not given.
+
+    Returns:
+        dict: The compilation result name and commit SHA and, when executed, the invocation name, final state,
+        duration, count of actions per state and slowest actions.
     """
+    run_deadline = time.time() + run_timeout if run_timeout else None
+    if service_account_roles:
+        validate_required_roles(gcp_project, service_account_roles, validation_cache_file, validation_cache_ttl)
+
     repo_uri = f'projects/{gcp_project}/locations/{location}/repositories/{repo_name}'
-    compilation_result = compile_workflow(repo_uri, branch)
+    compilation = create_compilation_result(repo_uri, branch)
+    compilation_result = compilation.name
+    result = {
+        "compilation_result": compilation_result,
+        "commit_sha": compilation.resolved_git_commit_sha,
+        "workflow_invocation": None,
+        "state": "COMPILED",
+    }
+    if dry_run.lower() == "true":
+        report = preflight_dry_run(gcp_project, location, compilation_result, tags, max_bytes_processed)
+        result["estimated_bytes_processed"] = report["total_bytes_processed"]
+
+    if execute.lower() == "true":
+        included_targets = None
+        if resume.lower() == "true":
+            compilation_result, included_targets = plan_resume(repo_uri, compilation)
+            result["compilation_result"] = compilation_result
+        duration_history = load_duration_history(duration_history_file)
+        expected_seconds = None
+        if not included_targets:
+            expected_seconds = estimate_duration(duration_history["invocations"].get(repo_name, []),
+                                                 compilation.resolved_git_commit_sha)
+        workflow_invocation_name = execute_workflow(repo_uri, compilation_result, tags,
+                                                    included_targets=included_targets)
+        try:
+            get_workflow_status(workflow_invocation_name, invocation_timeout=invocation_timeout,
+                                run_deadline=run_deadline, expected_seconds=expected_seconds)
+        finally:
+            cancel_workflows(active_invocations)
+        result.update(summarize_run(gcp_project, location, repo_name, compilation_result, workflow_invocation_name,
+                                    attribute_costs, cost_history_file, cost_growth_threshold,
+                                    duration_history=duration_history,
+                                    commit_sha=compilation.resolved_git_commit_sha,
+                                    expected_seconds=expected_seconds,
+                                    duration_alert_threshold=duration_alert_threshold,
+                                    execution_project=execution_project(compilation,
+                                                                        default_project or gcp_project)))
+        if not included_targets:
+            save_duration_history(duration_history_file, duration_history)
+
+    return result
+
+
+def run_workflows(gcp_project: str, project_num: str, location: str, repositories: dict, tags: list, execute: str,
+                  attribute_costs: str = "false", cost_history_file: str = None, cost_growth_threshold: float = 2.0,
+                  service_account_roles: list = None, validation_cache_file: str = None,
+                  validation_cache_ttl: int = 3600, invocation_timeout: int = 0, run_timeout: int = 0,
+                  max_concurrent_invocations: int = 4, max_concurrent_invocations_per_project: int = 2,
+                  resume: str = "false", compilation_cache_file: str = None, compilation_results: dict = None,
+                  duration_history_file: str = None, duration_alert_threshold: float = 2.0, dry_run: str = "false",
+                  max_bytes_processed: int = 0):
+    """Compiles several Dataform repositories and invokes them under admission control.
 
-    if execute:
-        workflow_invocation_name = execute_workflow(repo_uri, compilation_result, tags)
-        get_workflow_status(workflow_invocation_name)
+    Invocations are admitted by descending priority and, within the same priority, longest first according to
+    their recorded durations (then their recorded slot usage), so high-priority repositories finish first and the
+    longest runs start early to keep the makespan low.
+
+    Args:
+        gcp_project (str): The GCP project ID where the Dataform repositories live.
+        project_num (str): The GCP project Number.
+        location (str): The GCP region.
+        repositories (dict): The branch, priority and BigQuery execution project of each repository, keyed by name.
+        tags (list): The target tags to compile and execute.
+        execute (str): Control if the repositories will be executed or compiled only.
+        attribute_costs (str): Whether to attribute slot and bytes usage to the executed actions.
+        cost_history_file (str): Path to the JSON file where slot usage history is recorded.
+        cost_growth_threshold (float): Ratio against the historical median above which an action is flagged.
+        service_account_roles (list): "service_account_email=role" pairs that must be granted in gcp_project
+            before compiling.
+        validation_cache_file (str): Path to the JSON cache of service account validation results.
+        validation_cache_ttl (int): Maximum age in seconds of a cached validation result.
+        invocation_timeout (int): Maximum seconds a workflow invocation may run before it is cancelled, 0 for no limit.
+        run_timeout (int): Maximum seconds the whole run may take before running invocations are cancelled, 0 for
+            no limit.
+        max_concurrent_invocations (int): Maximum invocations running at once across all projects.
+        max_concurrent_invocations_per_project (int): Maximum invocations running at once in the same project.
+        resume (str): Whether to re-invoke only the actions that did not succeed in the last invocation of each
+            repository, if it failed.
+        compilation_cache_file (str): Path to the JSON cache of compilation results created for exact commits.
+        compilation_results (dict): Existing compilation result names keyed by repository name, to execute them
+            instead of compiling again.
+        duration_history_file (str): Path to the JSON file where invocation and action durations are recorded.
+        duration_alert_threshold (float): Ratio against the expected duration above which a run is reported as a
+            duration regression.
+        dry_run (str): Whether to dry-run the compiled actions of every repository and refuse to invoke any of them
+            on errors.
+        max_bytes_processed (int): Budget for the bytes the dry run estimates the actions of each repository
+            process, 0 for no budget.
+
+    Returns:
+        dict: The run_workflow result of each repository, keyed by repository name. When not executed, it also
+        contains the actions an execution would run.
+    """
+    run_deadline = time.time() + run_timeout if run_timeout else None
+    if service_account_roles:
+        validate_required_roles(gcp_project, service_account_roles, validation_cache_file, validation_cache_ttl)
+
+    repo_uris = {repo_name: f'projects/{gcp_project}/locations/{location}/repositories/{repo_name}'
+                 for repo_name in repositories}
+    if compilation_results:
+        compilations = get_compilation_results(compilation_results)
+    else:
+        cache = load_compilation_cache(compilation_cache_file)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_invocations) as executor:
+            futures = {repo_name: executor.submit(get_or_create_compilation_result, repo_uris[repo_name],
+                                                  settings.get("commit_sha") or settings["branch"], cache)
+                       for repo_name, settings in repositories.items()}
+            compilations = {repo_name: future.result() for repo_name, future in futures.items()}
+        save_compilation_cache(compilation_cache_file, cache)
+
+    results = {
+        repo_name: {
+            "compilation_result": compilation.name,
+            "commit_sha": compilation.resolved_git_commit_sha,
+            "workflow_invocation": None,
+            "state": "COMPILED",
+        }
+        for repo_name, compilation in compilations.items()
+    }
+    if dry_run.lower() == "true":
+        for repo_name, result in results.items():
+            report = preflight_dry_run(gcp_project, location, result["compilation_result"], tags, max_bytes_processed)
+            result["estimated_bytes_processed"] = report["total_bytes_processed"]
+    if execute.lower() != "true":
+        for repo_name, result in results.items():
+            pending_actions = list_pending_actions(result["compilation_result"], tags)
+            result["pending_action_count"] = len(pending_actions)
+            result["pending_actions"] = pending_actions
+        return results
+
+    history = load_cost_history(cost_history_file)
+    duration_history = load_duration_history(duration_history_file)
+    expected = {repo_name: estimate_duration(duration_history["invocations"].get(repo_name, []),
+                                             compilations[repo_name].resolved_git_commit_sha)
+                for repo_name in repositories}
+    order = sorted(repositories, key=lambda repo_name: (-int(repositories[repo_name].get("priority", 0)),
+                                                        -(expected[repo_name] or 0),
+                                                        -repository_slot_usage(history, repo_name)))
+    runs = [{
+        "repo_name": repo_name,
+        "project": repositories[repo_name].get("project") or gcp_project,
+        "repo_uri": repo_uris[repo_name],
+        "compilation_result": compilations[repo_name].name,
+        "tags": tags,
+        "expected_seconds": expected[repo_name],
+    } for repo_name in order]
+    if resume.lower() == "true":
+        for run in runs:
+            run["compilation_result"], run["included_targets"] = plan_resume(run["repo_uri"],
+                                                                            compilations[run["repo_name"]])
+            results[run["repo_name"]]["compilation_result"] = run["compilation_result"]
+            if run["included_targets"]:
+                run["expected_seconds"] = None
+    try:
+        invocations = schedule_workflows(runs, max_concurrent_invocations, max_concurrent_invocations_per_project,
+                                         invocation_timeout=invocation_timeout, run_deadline=run_deadline)
+    finally:
+        cancel_workflows(active_invocations)
+
+    # Resumed runs only execute part of the graph, so they are neither compared against nor recorded in the history.
+    full_runs = {run["repo_name"]: run for run in runs if not run.get("included_targets")}
+    for repo_name, workflow_invocation_name in invocations.items():
+        full_run = full_runs.get(repo_name)
+        results[repo_name].update(summarize_run(gcp_project, location, repo_name,
+                                                results[repo_name]["compilation_result"],
+                                                workflow_invocation_name, attribute_costs, cost_history_file,
+                                                cost_growth_threshold,
+                                                duration_history=duration_history if full_run else None,
+                                                commit_sha=compilations[repo_name].resolved_git_commit_sha,
+                                                expected_seconds=full_run["expected_seconds"] if full_run else None,
+                                                duration_alert_threshold=duration_alert_threshold,
+                                                execution_project=execution_project(
+                                                    compilations[repo_name],
+                                                    repositories[repo_name].get("project") or gcp_project)))
+    save_duration_history(duration_history_file, duration_history)
+    return results
 
-    print(json.dumps({}, indent=2))
 
 def extract_config_name(file_path):
   """
@@ -133,18 +1223,13 @@ def extract_config_name(file_path):
     The config name as a string, or None if not found.
   """
   try:
-    with open(file_path, 'r') as f:
-      content = f.read()
-
-    match = re.search(r'config \{.*?name: "(.*?)"', content, re.DOTALL)
-    if match:
-      return match.group(1)
-    else:
-      logging.info(f"Config name not found in {file_path}.")
-      return None
+    name = sqlx_indexer.index_sqlx_files([file_path])[file_path]["name"]
   except FileNotFoundError:
     logging.info(f"File not found: {file_path}")
     return None
+  if name is None:
+    logging.info(f"Config name not found in {file_path}.")
+  return name
 
 def extract_iam_metadata(file_path):
   """
@@ -156,59 +1241,144 @@ def extract_iam_metadata(file_path):
   Returns:
     A dictionary containing the IAM metadata, or None if not found.
   """
-  with open(file_path, 'r') as f:
-    content = f.read()
-
-  match = re.search(r'//iam_metadata: ({[\s\S]*?})', content)
-  if match:
-    json_str = match.group(1).replace("//", "")
-    try:
-      iam_metadata = json.loads(json_str)
-      return iam_metadata
-    except json.JSONDecodeError:
-      logging.info("Error decoding JSON metadata.")
-      return None
-  else:
+  iam_metadata = sqlx_indexer.index_sqlx_files([file_path])[file_path]["iam_metadata"]
+  if iam_metadata is None:
     logging.info("IAM metadata not found in the file.")
-    return None
+  return iam_metadata
 
 
-def validate_service_account(project_id, service_account_email, required_role):
-    """
-    Validates if a Google Cloud service account exists and has a specified role.
+def load_validation_cache(cache_file: str, ttl_seconds: int):
+    """Loads the service account validation results that are still within their TTL.
 
     Args:
-        project_id: The ID of the Google Cloud project.
-        service_account_email: The email address of the service account.
-        required_role: The role the service account should have (e.g., "roles/storage.objectAdmin").
+        cache_file (str): Path to the JSON validation cache.
+        ttl_seconds (int): Maximum age of a cached result.
 
     Returns:
-        True if the service account exists and has the role, False otherwise.
+        dict: Cached results keyed by "project|service_account|role".
+    """
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f'Could not read validation cache file {cache_file}, starting a new one.')
+        return {}
+    now = time.time()
+    return {key: value for key, value in cache.items() if now - value["checked_at"] < ttl_seconds}
+
+
+def save_validation_cache(cache_file: str, cache: dict):
+    """Persists the service account validation results.
+
+    Args:
+        cache_file (str): Path to the JSON validation cache.
+        cache (dict): Results keyed by "project|service_account|role".
     """
+    if not cache_file:
+        return
+    tmp_file = f'{cache_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_file, cache_file)
+
+
+def analyze_project_roles(project_id: str, roles: list):
+    """Finds the members granted any of the given roles on a project with a single IAM policy analysis.
+
+    Google groups are expanded, so a service account granted a role through a group holds it.
 
-    # Construct the service account resource name
-    resource_name = f"//iam.googleapis.com/projects/{project_id}/serviceAccounts/{service_account_email}"
+    Args:
+        project_id (str): The ID of the Google Cloud project.
+        roles (list): The roles to look for.
 
-    # Analyze IAM policy for the service account
-    response = iam_client.analyze_iam_policy(
+    Returns:
+        dict: The set of members holding each role.
+    """
+    response = get_asset_client().analyze_iam_policy(
         request={
             "analysis_query": {
                 "scope": f"projects/{project_id}",
-                "resource_selector": {"full_resource_name": resource_name},
-                "identity_selector": {"identity": f"serviceAccount:{service_account_email}"}
+                "resource_selector": {
+                    "full_resource_name": f"//cloudresourcemanager.googleapis.com/projects/{project_id}"
+                },
+                "access_selector": {"roles": sorted(roles)},
+                "options": {"expand_groups": True}
             }
         }
     )
+    members_by_role = collections.defaultdict(set)
+    for result in response.main_analysis.analysis_results:
+        # The identities of a result include the members of the Google groups of its binding.
+        members_by_role[result.iam_binding.role].update(identity.name
+                                                        for identity in result.identity_list.identities)
+    return members_by_role
+
+
+def validate_service_accounts(checks: list, cache_file: str = None, ttl_seconds: int = 3600,
+                              max_workers: int = 8):
+    """Validates that Google Cloud service accounts have the specified roles, batching checks per project.
+
+    All the roles checked in a project are resolved with one IAM policy analysis, projects are analyzed
+    concurrently, and granted checks younger than ttl_seconds are reused from the cache file. Missing roles are
+    not cached, so a fixed binding is picked up by the next run.
 
-    # Check if the required role is in the policy bindings
-    for binding in response.main_analysis.analysis_results[0].iam_binding.bindings:
-        if required_role in binding.role:
-            return True
+    Args:
+        checks (list): Tuples of (project_id, service_account_email, required_role).
+        cache_file (str): Path to the JSON validation cache, no cache is used when empty.
+        ttl_seconds (int): Maximum age of a cached result.
+        max_workers (int): Maximum number of projects analyzed concurrently.
+
+    Returns:
+        dict: True or False for each (project_id, service_account_email, required_role) check.
+    """
+    cache = load_validation_cache(cache_file, ttl_seconds)
+    results = {}
+    pending_roles = collections.defaultdict(set)
+    for check in checks:
+        cached = cache.get("|".join(check))
+        if cached is not None:
+            results[check] = cached["granted"]
+        else:
+            pending_roles[check[0]].add(check[2])
+
+    if pending_roles:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {project_id: executor.submit(analyze_project_roles, project_id, roles)
+                       for project_id, roles in pending_roles.items()}
+            members_by_project = {project_id: future.result() for project_id, future in futures.items()}
+        now = time.time()
+        for check in checks:
+            if check in results:
+                continue
+            project_id, service_account_email, required_role = check
+            granted = f"serviceAccount:{service_account_email}" in members_by_project[project_id][required_role]
+            results[check] = granted
+            if granted:
+                cache["|".join(check)] = {"granted": granted, "checked_at": now}
+        save_validation_cache(cache_file, cache)
+
+    for (project_id, service_account_email, required_role), granted in results.items():
+        if not granted:
+            logging.info(f"Service account {service_account_email} does not have the role {required_role} in project {project_id}.")
+    return results
 
-    return False
 
-    logging.info(f"Service account {service_account_email} does not have the role {required_role} in project {project_id}.")
-    return False
+def validate_service_account(project_id, service_account_email, required_role):
+    """
+    Validates if a Google Cloud service account exists and has a specified role.
+
+    Args:
+        project_id: The ID of the Google Cloud project.
+        service_account_email: The email address of the service account.
+        required_role: The role the service account should have (e.g., "roles/storage.objectAdmin").
+
+    Returns:
+        True if the service account exists and has the role, False otherwise.
+    """
+    check = (project_id, service_account_email, required_role)
+    return validate_service_accounts([check])[check]
 
 def main(args: collections.abc.Sequence[str]) -> int:
     """The main function parses command-line arguments and calls the run_workflow function to execute the complete Dataform workflow.
@@ -231,8 +1401,11 @@ def main(args: collections.abc.Sequence[str]) -> int:
                         help="The location of the Dataform repository.")
     parser.add_argument("--repository",
                         type=str,
-                        required=True,
                         help="The name of the Dataform repository to compile and run")
+    parser.add_argument("--repositories",
+                        type=str,
+                        help="JSON object with the branch, priority and project of each Dataform repository to "
+                             "compile and run under admission control, instead of a single --repository.")
     parser.add_argument("--tags",
                         nargs="*",  # 0 or more values expected => creates a list
                         type=str,
@@ -244,24 +1417,181 @@ def main(args: collections.abc.Sequence[str]) -> int:
                         help="Control if dataform repository will be executed or compiled only.")
     parser.add_argument("--branch",
                         type=str,
-                        required=True,
+                        default="main",
                         help="The branch of the Dataform repository to use.")
+    parser.add_argument("--attribute_costs",
+                        type=str,
+                        default="false",
+                        help="Control if slot and bytes usage is attributed to the executed actions and tags.")
+    parser.add_argument("--cost_history_file",
+                        type=str,
+                        default="dataform_cost_history.json",
+                        help="JSON file where the slot usage history of each action is recorded.")
+    parser.add_argument("--cost_growth_threshold",
+                        type=float,
+                        default=2.0,
+                        help="Flag actions whose slot usage exceeds this ratio of their historical median.")
+    parser.add_argument("--service_account_roles",
+                        nargs="*",
+                        type=str,
+                        default=[],
+                        help="service_account_email=role pairs that must be granted in the project before compiling.")
+    parser.add_argument("--validation_cache_file",
+                        type=str,
+                        default="service_account_validation_cache.json",
+                        help="JSON file where service account validation results are cached.")
+    parser.add_argument("--validation_cache_ttl",
+                        type=int,
+                        default=3600,
+                        help="Seconds a cached service account validation result is reused.")
+    parser.add_argument("--invocation_timeout",
+                        type=int,
+                        default=0,
+                        help="Seconds a workflow invocation may run before it is cancelled, 0 for no limit.")
+    parser.add_argument("--run_timeout",
+                        type=int,
+                        default=0,
+                        help="Seconds the whole run may take before running invocations are cancelled, 0 for no limit.")
+    parser.add_argument("--max_concurrent_invocations",
+                        type=int,
+                        default=4,
+                        help="Maximum workflow invocations running at once across all projects.")
+    parser.add_argument("--max_concurrent_invocations_per_project",
+                        type=int,
+                        default=2,
+                        help="Maximum workflow invocations running at once in the same BigQuery project.")
+    parser.add_argument("--resume",
+                        type=str,
+                        default="false",
+                        help="Control if only the actions that did not succeed in the last failed invocation are run.")
+    parser.add_argument("--compilation_cache_file",
+                        type=str,
+                        default="dataform_compilation_cache.json",
+                        help="JSON file where compilation results created for exact commit SHAs are cached.")
+    parser.add_argument("--compilation_results",
+                        type=str,
+                        help="JSON object with the compilation result name of each repository in --repositories, to "
+                             "execute them without compiling again.")
+    parser.add_argument("--results_file",
+                        type=str,
+                        help="File where the JSON result is also written.")
+    parser.add_argument("--duration_history_file",
+                        type=str,
+                        default="dataform_duration_history.json",
+                        help="JSON file where invocation and action durations are recorded, to order runs and "
+                             "estimate ETAs.")
+    parser.add_argument("--duration_alert_threshold",
+                        type=float,
+                        default=2.0,
+                        help="Report runs taking longer than this ratio of their historical median duration.")
+    parser.add_argument("--dry_run",
+                        type=str,
+                        default="false",
+                        help="Control if the compiled actions are dry-run in BigQuery before invoking them.")
+    parser.add_argument("--max_bytes_processed",
+                        type=int,
+                        default=0,
+                        help="Refuse to invoke a repository whose dry run estimates more bytes processed, 0 for no "
+                             "budget.")
+    parser.add_argument("--default_project",
+                        type=str,
+                        default=None,
+                        help="The defaultDatabase of the --repository workflow settings, where its BigQuery jobs "
+                             "run and their costs are attributed from. Defaults to --project_id.")
     params = parser.parse_args(args)
+    if not params.repository and not params.repositories:
+        parser.error("one of --repository or --repositories is required")
+    for pair in params.service_account_roles:
+        email, _, role = pair.partition("=")
+        if not email or not role:
+            parser.error(f"--service_account_roles expects service_account_email=role pairs, got {pair!r}")
+    for name in ("max_concurrent_invocations", "max_concurrent_invocations_per_project"):
+        if getattr(params, name) < 1:
+            parser.error(f"--{name} must be at least 1")
     project_id = str(params.project_id)
     project_number = str(params.project_number)
     location = str(params.location)
-    repository = str(params.repository)
+    repository = params.repository
+    repositories = json.loads(params.repositories) if params.repositories else None
     execute = str(params.execute)
     tags = list(params.tags)
     branch = str(params.branch)
+    attribute_costs = str(params.attribute_costs)
+    cost_history_file = str(params.cost_history_file)
+    cost_growth_threshold = float(params.cost_growth_threshold)
+    service_account_roles = list(params.service_account_roles)
+    validation_cache_file = str(params.validation_cache_file)
+    validation_cache_ttl = int(params.validation_cache_ttl)
+    invocation_timeout = int(params.invocation_timeout)
+    run_timeout = int(params.run_timeout)
+    max_concurrent_invocations = int(params.max_concurrent_invocations)
+    max_concurrent_invocations_per_project = int(params.max_concurrent_invocations_per_project)
+    resume = str(params.resume)
+    compilation_cache_file = str(params.compilation_cache_file)
+    compilation_results = json.loads(params.compilation_results) if params.compilation_results else None
+    results_file = params.results_file
+    duration_history_file = str(params.duration_history_file)
+    duration_alert_threshold = float(params.duration_alert_threshold)
+    dry_run = str(params.dry_run)
+    max_bytes_processed = int(params.max_bytes_processed)
+    default_project = params.default_project
+
+    signal.signal(signal.SIGINT, handle_termination_signal)
+    signal.signal(signal.SIGTERM, handle_termination_signal)
+
+    if repositories is not None:
+        results = run_workflows(gcp_project=project_id,
+                                project_num=project_number,
+                                location=location,
+                                repositories=repositories,
+                                tags=tags,
+                                execute=execute,
+                                attribute_costs=attribute_costs,
+                                cost_history_file=cost_history_file,
+                                cost_growth_threshold=cost_growth_threshold,
+                                service_account_roles=service_account_roles,
+                                validation_cache_file=validation_cache_file,
+                                validation_cache_ttl=validation_cache_ttl,
+                                invocation_timeout=invocation_timeout,
+                                run_timeout=run_timeout,
+                                max_concurrent_invocations=max_concurrent_invocations,
+                                max_concurrent_invocations_per_project=max_concurrent_invocations_per_project,
+                                resume=resume,
+                                compilation_cache_file=compilation_cache_file,
+                                compilation_results=compilation_results,
+                                duration_history_file=duration_history_file,
+                                duration_alert_threshold=duration_alert_threshold,
+                                dry_run=dry_run,
+                                max_bytes_processed=max_bytes_processed)
+        output = {repo_name: json.dumps(format_external_result(result)) for repo_name, result in results.items()}
+    else:
+        result = run_workflow(gcp_project=project_id,
+                              project_num=project_number,
+                              location=location,
+                              repo_name=repository,
+                              tags=tags,
+                              execute=execute,
+                              branch=branch,
+                              attribute_costs=attribute_costs,
+                              cost_history_file=cost_history_file,
+                              cost_growth_threshold=cost_growth_threshold,
+                              service_account_roles=service_account_roles,
+                              validation_cache_file=validation_cache_file,
+                              validation_cache_ttl=validation_cache_ttl,
+                              invocation_timeout=invocation_timeout,
+                              run_timeout=run_timeout,
+                              resume=resume,
+                              duration_history_file=duration_history_file,
+                              duration_alert_threshold=duration_alert_threshold,
+                              dry_run=dry_run,
+                              max_bytes_processed=max_bytes_processed,
+                              default_project=default_project)
+        output = format_external_result(result)
 
-    run_workflow(gcp_project=project_id,
-                 project_num=project_number,
-                 location=location,
-                 repo_name=repository,
-                 tags=tags,
-                 execute=execute,
-                 branch=branch)
+    if results_file:
+        with open(results_file, 'w') as f:
+            json.dump(output, f, indent=2)
+    print(json.dumps(output, indent=2))
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import concurrent.futures
+import time
+
+INITIAL_POLL_SECONDS = 2.0
+MAX_POLL_SECONDS = 30.0
+POLL_BACKOFF = 1.5
+
+
+class OperationManager:
+    """Runs a graph of long-running operations, such as Dataplex lake, zone and asset creations, concurrently.
+
+    Every operation is started as soon as the operations it depends on succeed, without waiting for unrelated
+    ones, and the operations of a failed one are skipped. The pending operations are polled together in rounds:
+    each one is polled again after an interval that grows from INITIAL_POLL_SECONDS by POLL_BACKOFF up to
+    MAX_POLL_SECONDS, and the manager sleeps until the next operation is due.
+    """
+
+    def __init__(self, initial_poll_seconds=INITIAL_POLL_SECONDS, max_poll_seconds=MAX_POLL_SECONDS,
+                 backoff=POLL_BACKOFF, max_concurrent_polls=8):
+        self.initial_poll_seconds = initial_poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+        self.backoff = backoff
+        self.max_concurrent_polls = max_concurrent_polls
+        self._tasks = {}
+
+    def add(self, key, start, dependencies=(), on_done=None):
+        """Adds an operation to the graph.
+
+        Args:
+            key: The unique key of the operation.
+            start (callable): Starts the operation and returns it, a google.api_core.operation.Operation.
+            dependencies (iterable): The keys of the operations that must succeed before it starts.
+            on_done (callable): Called with the result of the operation once it succeeds, before its dependents
+                start.
+        """
+        self._tasks[key] = {"start": start, "dependencies": set(dependencies), "on_done": on_done}
+
+    @staticmethod
+    def _poll(operation):
+        """Refreshes the state of an operation, returns whether it is done and the error that prevented polling
+        it."""
+        try:
+            return operation.done(), None
+        except Exception as e:
+            return True, e
+
+    def run(self):
+        """Starts and polls every operation of the graph until all of them are done, failed or skipped.
+
+        Returns:
+            dict: The outcome of each operation keyed by its key, with its status (succeeded, failed or
+            skipped), the name of the operation, its latency from start to completion in seconds, and its
+            result or error.
+
+        Raises:
+            ValueError: If an operation depends on a key that was never added.
+        """
+        outcomes = {}
+        dependents = {key: set() for key in self._tasks}
+        for key, task in self._tasks.items():
+            for dependency in task["dependencies"]:
+                if dependency not in dependents:
+                    raise ValueError(f"{key} depends on {dependency}, which was never added")
+                dependents[dependency].add(key)
+        remaining = {key: len(task["dependencies"]) for key, task in self._tasks.items()}
+        ready = [key for key, count in remaining.items() if count == 0]
+        pending = {}
+
+        def skip(key, cause):
+            for dependent in dependents[key]:
+                if dependent not in outcomes:
+                    outcomes[dependent] = {"status": "skipped", "error": f"{cause} failed"}
+                    skip(dependent, cause)
+
+        def finish(key, outcome):
+            outcomes[key] = outcome
+            if outcome["status"] != "succeeded":
+                skip(key, key)
+                return
+            for dependent in dependents[key]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0 and dependent not in outcomes:
+                    ready.append(dependent)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrent_polls) as executor:
+            while ready or pending:
+                while ready:
+                    key = ready.pop(0)
+                    started_at = time.time()
+                    try:
+                        operation = self._tasks[key]["start"]()
+                    except Exception as e:
+                        logging.error(f"Could not start {key}: {e}")
+                        finish(key, {"status": "failed", "error": str(e), "latency_seconds": 0.0})
+                        continue
+                    logging.info(f"Started {key}: {operation.operation.name}")
+                    pending[key] = {"operation": operation, "started_at": started_at,
+                                    "interval": self.initial_poll_seconds,
+                                    "poll_at": started_at + self.initial_poll_seconds}
+                if not pending:
+                    continue
+                time.sleep(max(min(state["poll_at"] for state in pending.values()) - time.time(), 0))
+                now = time.time()
+                due = [key for key, state in pending.items() if state["poll_at"] <= now]
+                polls = dict(zip(due, executor.map(self._poll, [pending[key]["operation"] for key in due])))
+                for key in due:
+                    state = pending[key]
+                    done, error = polls[key]
+                    if not done and error is None:
+                        state["interval"] = min(state["interval"] * self.backoff, self.max_poll_seconds)
+                        state["poll_at"] = time.time() + state["interval"]
+                        continue
+                    del pending[key]
+                    outcome = {"operation": state["operation"].operation.name,
+                               "latency_seconds": round(time.time() - state["started_at"], 1)}
+                    if error is None:
+                        error = state["operation"].exception()
+                    if error is None:
+                        outcome["result"] = state["operation"].result()
+                        try:
+                            if self._tasks[key]["on_done"]:
+                                self._tasks[key]["on_done"](outcome["result"])
+                        except Exception as e:
+                            error = e
+                    if error is not None:
+                        logging.error(f"{key} failed after {outcome['latency_seconds']}s: {error}")
+                        finish(key, {**outcome, "status": "failed", "error": str(error)})
+                        continue
+                    logging.info(f"{key} done in {outcome['latency_seconds']}s")
+                    finish(key, {**outcome, "status": "succeeded"})
+        return outcomes
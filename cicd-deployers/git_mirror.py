@@ -0,0 +1,190 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import argparse
+import base64
+import collections
+import fcntl
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+DEFAULT_MIRROR_DIR = ".dataform_git_mirrors"
+FETCH_MAX_AGE_SECONDS = 300
+
+
+def mirror_path(remote_repo_url, mirror_dir=DEFAULT_MIRROR_DIR):
+    """Returns the local path of the bare mirror of a remote repository."""
+    name = re.sub(r"^[a-z]+://|^git@|\.git$", "", remote_repo_url.rstrip("/"))
+    return os.path.join(mirror_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", name) + ".git")
+
+
+def _auth_env(token):
+    """Returns the environment of git commands that authenticate HTTPS requests with a token.
+
+    The header is passed as environment configuration, so the token is neither stored on disk nor visible in the
+    command line of the git processes.
+    """
+    env = dict(os.environ)
+    if not token:
+        return env
+    credentials = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+    index = int(env.get("GIT_CONFIG_COUNT", "0") or 0)
+    env.update({"GIT_CONFIG_COUNT": str(index + 1), f"GIT_CONFIG_KEY_{index}": "http.extraHeader",
+                f"GIT_CONFIG_VALUE_{index}": f"Authorization: Basic {credentials}"})
+    return env
+
+
+class GitMirror:
+    """Reads files of a repository at any branch or commit from a local bare mirror.
+
+    The mirror is cloned on first use and then kept up to date with incremental fetches. Processes of the same
+    deploy share it: updates are serialized with a file lock, and a mirror fetched less than max_age_seconds ago
+    is not fetched again.
+    """
+
+    def __init__(self, remote_repo_url, mirror_dir=DEFAULT_MIRROR_DIR, token=None,
+                 max_age_seconds=FETCH_MAX_AGE_SECONDS):
+        self.remote_repo_url = remote_repo_url
+        self.path = mirror_path(remote_repo_url, mirror_dir)
+        self.token = token
+        self.max_age_seconds = max_age_seconds
+
+    def _git(self, *args, input=None):
+        """Runs a git command in the mirror and returns its stdout as bytes."""
+        completed = subprocess.run(["git", "--git-dir", self.path, *args], input=input, capture_output=True,
+                                   check=False, env=_auth_env(self.token))
+        if completed.returncode != 0:
+            raise RuntimeError(f"git {' '.join(args)} failed in {self.path}: {completed.stderr.decode().strip()}")
+        return completed.stdout
+
+    def update(self):
+        """Clones the mirror if it does not exist yet, or fetches the new commits of every branch.
+
+        Returns:
+            GitMirror: The mirror itself, for chaining.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(self.path):
+                logging.info(f"cloning mirror of {self.remote_repo_url} into {self.path}")
+                completed = subprocess.run(["git", "clone", "--mirror", "--quiet", self.remote_repo_url, self.path],
+                                           capture_output=True, check=False, env=_auth_env(self.token))
+                if completed.returncode != 0:
+                    raise RuntimeError(f"Could not clone {self.remote_repo_url}: {completed.stderr.decode().strip()}")
+                self._touch()
+                return self
+            fetched_at = os.path.join(self.path, "FETCH_HEAD")
+            if os.path.exists(fetched_at) and time.time() - os.path.getmtime(fetched_at) < self.max_age_seconds:
+                return self
+            logging.info(f"fetching {self.remote_repo_url} into {self.path}")
+            self._git("fetch", "--prune", "--quiet", "origin")
+            self._touch()
+        return self
+
+    def _touch(self):
+        """Records the time of the last fetch, which git does not update when nothing changed."""
+        with open(os.path.join(self.path, "FETCH_HEAD"), "a"):
+            os.utime(os.path.join(self.path, "FETCH_HEAD"))
+
+    def resolve(self, ref="HEAD"):
+        """Returns the commit SHA a branch, tag or commit points to."""
+        return self._git("rev-parse", "--verify", f"{ref}^{{commit}}").decode().strip()
+
+    def list_files(self, ref="HEAD", suffix=None):
+        """Lists the files of a commit with their blob SHAs.
+
+        Args:
+            ref (str): The branch, tag or commit.
+            suffix (str): Only list the files whose path ends with it.
+
+        Returns:
+            dict: The blob SHA of each file, keyed by its path.
+        """
+        files = {}
+        for line in self._git("ls-tree", "-r", "-z", ref).decode().split("\0"):
+            if not line:
+                continue
+            info, path = line.split("\t", 1)
+            _, object_type, sha = info.split()
+            if object_type == "blob" and (suffix is None or path.endswith(suffix)):
+                files[path] = sha
+        return files
+
+    def read_blobs(self, shas):
+        """Reads the content of several blobs with a single git cat-file process.
+
+        Args:
+            shas (iterable): The blob SHAs.
+
+        Returns:
+            dict: The decoded content of each blob, keyed by SHA.
+        """
+        shas = list(shas)
+        if not shas:
+            return {}
+        output = self._git("cat-file", "--batch", input="".join(f"{sha}\n" for sha in shas).encode())
+        contents = {}
+        offset = 0
+        for sha in shas:
+            header_end = output.index(b"\n", offset)
+            size = int(output[offset:header_end].split()[2])
+            contents[sha] = output[header_end + 1:header_end + 1 + size].decode()
+            offset = header_end + 1 + size + 1
+        return contents
+
+    def read_file(self, ref, path):
+        """Returns the decoded content of a file at a branch, tag or commit."""
+        return self._git("show", f"{ref}:{path}").decode()
+
+
+def main(args: collections.abc.Sequence[str]) -> int:
+    """Updates the local mirror of a repository and prints a file of it with the resolved commit.
+    To run the script, provide the required command-line arguments:
+        python git_mirror.py --remote_repo_url https://github.com/org/repo.git --ref main --path dataform.json
+    With --terraform_external the arguments are read from the JSON query of a Terraform external data source on
+    stdin, so the token does not appear on the command line, and the mirror is always fetched.
+    """
+    parser = argparse.ArgumentParser(description="Local git mirror reader of the Dataform repositories")
+    parser.add_argument("--remote_repo_url", type=str, help="The git repository URL.")
+    parser.add_argument("--ref", type=str, default="HEAD", help="The branch, tag or commit to read.")
+    parser.add_argument("--path", type=str, help="The file to read.")
+    parser.add_argument("--mirror_dir", type=str, default=DEFAULT_MIRROR_DIR, help="Directory of the mirrors.")
+    parser.add_argument("--token", type=str, default=None, help="The git token used to fetch the repository.")
+    parser.add_argument("--terraform_external",
+                        action="store_true",
+                        help="Read remote_repo_url, ref, path, mirror_dir and token from a JSON query on stdin.")
+    params = parser.parse_args(args)
+
+    settings = vars(params)
+    if params.terraform_external:
+        settings.update({key: value for key, value in json.load(sys.stdin).items() if value})
+    if not settings["remote_repo_url"] or not settings["path"]:
+        parser.error("--remote_repo_url and --path are required.")
+
+    # A Terraform plan must compile the commit the branch points to now, e.g. right after a push, so it always
+    # fetches. Only the extractor, which reads the mirror many times in a deploy, reuses a recent fetch.
+    max_age_seconds = 0 if params.terraform_external else FETCH_MAX_AGE_SECONDS
+    mirror = GitMirror(settings["remote_repo_url"], settings["mirror_dir"], settings["token"], max_age_seconds).update()
+    commit_sha = mirror.resolve(settings["ref"])
+    print(json.dumps({"commit_sha": commit_sha, "content": mirror.read_file(commit_sha, settings["path"])}))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
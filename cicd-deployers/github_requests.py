@@ -0,0 +1,180 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import concurrent.futures
+import contextlib
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+GITHUB_API_URL = "https://api.github.com"
+PACING_FRACTION = 0.2
+SECONDARY_LIMIT_BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 900
+
+
+class GitHubRequester:
+    """Sends GitHub REST API requests within the primary and secondary rate limits.
+
+    The remaining budget and its reset time are tracked from the X-RateLimit-* headers of every response. Once
+    less than PACING_FRACTION of the budget is left, requests are spread evenly until the reset, and below
+    min_remaining they wait for the reset. Rate-limited responses are retried after their Retry-After, the reset
+    time or an exponential backoff, and at most max_concurrency requests are in flight at once.
+    """
+
+    def __init__(self, token, max_concurrency=8, min_remaining=20, max_retries=5):
+        self.token = token
+        self.max_concurrency = max_concurrency
+        self.min_remaining = min_remaining
+        self.max_retries = max_retries
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._paused_until = 0.0
+        self._next_slot = 0.0
+
+    def _reserve_slot(self):
+        """Returns how long to wait before sending the next request to stay within the budget."""
+        with self._lock:
+            now = time.time()
+            if self._paused_until > now:
+                return self._paused_until - now
+            if self.remaining is None or self.reset_at is None or self.reset_at <= now:
+                return 0
+            if self.remaining <= self.min_remaining:
+                self._paused_until = self.reset_at
+                return self.reset_at - now
+            if self.remaining > self.limit * PACING_FRACTION:
+                return 0
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + (self.reset_at - now) / (self.remaining - self.min_remaining)
+            self.remaining -= 1
+            return slot - now
+
+    def _update_budget(self, headers):
+        """Updates the tracked budget from the X-RateLimit-* headers of a response."""
+        if headers is None or headers.get("X-RateLimit-Remaining") is None:
+            return
+        with self._lock:
+            self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 5000))
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset_at = float(headers.get("X-RateLimit-Reset", time.time() + 3600))
+
+    def _pause(self, seconds):
+        """Holds every request for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+
+    @staticmethod
+    def _transient_backoff(attempt):
+        """Returns how long to wait before retrying after a server or connection error, with jitter."""
+        return min(2 ** attempt, MAX_BACKOFF_SECONDS) * random.uniform(0.5, 1)
+
+    def _backoff(self, error, attempt):
+        """Returns how long to wait before retrying a failed request, or None if it should not be retried."""
+        retry_after = error.headers.get("Retry-After") if error.headers else None
+        if error.code in (403, 429):
+            if retry_after:
+                return float(retry_after)
+            if self.remaining == 0 and self.reset_at:
+                return max(self.reset_at - time.time(), 1)
+            if error.code == 429 or "rate limit" in str(error.reason).lower():
+                return min(SECONDARY_LIMIT_BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS)
+            return None
+        if error.code >= 500:
+            return self._transient_backoff(attempt)
+        return None
+
+    @contextlib.contextmanager
+    def open(self, url, etag=None, accept="application/vnd.github+json"):
+        """Sends a GET request and yields the open response, for callers that stream the body.
+
+        The request counts against max_concurrency until the context exits, so the body should be read within it.
+        Connection errors, such as a reset connection or a failed DNS lookup, are retried like server errors.
+
+        Args:
+            url (str): The API URL.
+            etag (str): The ETag of the cached response, a 304 response does not count against the rate limit.
+            accept (str): The media type to request.
+
+        Yields:
+            The open http.client.HTTPResponse, or None if the cached response is still current.
+        """
+        headers = {"Authorization": f"Bearer {self.token}", "Accept": accept}
+        if etag:
+            headers["If-None-Match"] = etag
+        for attempt in range(self.max_retries + 1):
+            delay = self._reserve_slot()
+            if delay > 0:
+                logging.info(f"Waiting {delay:.1f}s for the GitHub rate limit budget")
+                time.sleep(delay)
+            with self._semaphore:
+                try:
+                    response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+                except urllib.error.HTTPError as e:
+                    self._update_budget(e.headers)
+                    if e.code != 304:
+                        delay = self._backoff(e, attempt)
+                        if delay is None or attempt == self.max_retries:
+                            raise
+                        logging.warning(f"GitHub request {url} failed with {e.code}, retrying in {delay:.0f}s")
+                        self._pause(delay)
+                        continue
+                    response = None
+                except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self._transient_backoff(attempt)
+                    logging.warning(f"GitHub request {url} failed with {e}, retrying in {delay:.0f}s")
+                    self._pause(delay)
+                    continue
+                if response is None:
+                    yield None
+                    return
+                self._update_budget(response.headers)
+                with response:
+                    yield response
+                return
+
+    def get(self, url, etag=None, accept="application/vnd.github+json"):
+        """Sends a GET request.
+
+        Args:
+            url (str): The API URL.
+            etag (str): The ETag of the cached response.
+            accept (str): The media type to request.
+
+        Returns:
+            tuple: The status code, the ETag of the response and its body, which is None on 304.
+        """
+        with self.open(url, etag, accept) as response:
+            if response is None:
+                return 304, etag, None
+            return response.status, response.headers.get("ETag"), response.read()
+
+    def get_json(self, url):
+        """Sends a GET request and returns the decoded JSON body."""
+        return json.loads(self.get(url)[2])
+
+    def map(self, fn, items):
+        """Applies fn to every item concurrently, up to max_concurrency at a time, and returns the results in
+        order."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(fn, items))
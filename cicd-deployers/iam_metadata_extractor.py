@@ -1,97 +1,389 @@
 import sys
 import argparse
 import collections
+import concurrent.futures
+import hashlib
+import json
 import logging
+import os
 import re
-import json
-from github import Auth
-from github import Github
+import tarfile
+import threading
+import git_mirror
+import github_requests
+import sqlx_indexer
+
+EXTRACTION_CACHE_VERSION = 3
+BLOB_FETCH_LIMIT = 20
+MIRROR_READ_BATCH_SIZE = 64
+GITHUB_REPO_PATTERN = re.compile(r"github\.com[/:]([^/]+)/([^/]+?)(?:\.git)?/?$")
+
+
+def fetch_sqlx_contents(repo, requester, ref=None):
+    """Streams the content of every .sqlx file of a GitHub repository from a single archive download.
+
+    The tarball is read as it is downloaded and each .sqlx member is yielded as soon as it is read, so the
+    whole repository costs one request, whatever the number of files, and only one file is held in memory.
+
+    Args:
+      repo: The GitHub repository, as returned by the repos API.
+      requester: The GitHubRequester to send the request with.
+      ref: The branch, tag or commit to fetch, the default branch if not given.
+
+    Yields:
+      A tuple with the path of each .sqlx file in the repository and its content.
+    """
+    with requester.open(f"{repo['url']}/tarball/{ref or repo['default_branch']}") as response:
+        with tarfile.open(fileobj=response, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.endswith(".sqlx"):
+                    continue
+                # Members are prefixed with a "<owner>-<repo>-<sha>/" top-level directory.
+                yield member.name.split("/", 1)[-1], archive.extractfile(member).read().decode()
+
+def git_blob_sha(data):
+    """Returns the git blob SHA of a file content, as listed in git trees."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def load_extraction_cache(cache_file):
+    """Loads the extraction cache holding tree listings by ref and extracted IAM metadata by blob SHA.
+
+    Args:
+      cache_file: Path to the JSON cache file.
+
+    Returns:
+      A dict with the "trees" and "blobs" caches.
+    """
+    empty = {"trees": {}, "blobs": {}}
+    if not cache_file or not os.path.exists(cache_file):
+        return empty
+    try:
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f"Could not read IAM metadata extraction cache {cache_file}, rebuilding it.")
+        return empty
+    if cache.get("version") != EXTRACTION_CACHE_VERSION:
+        return empty
+    return {"trees": cache.get("trees", {}), "blobs": cache.get("blobs", {})}
+
+def save_extraction_cache(cache_file, cache):
+    """Persists the extraction cache.
+
+    Args:
+      cache_file: Path to the JSON cache file.
+      cache: A dict with the "trees" and "blobs" caches.
+    """
+    if not cache_file:
+        return
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"version": EXTRACTION_CACHE_VERSION, **cache}, f)
+    os.replace(tmp_file, cache_file)
+
+def list_sqlx_blobs(repo, requester, ref, tree_cache):
+    """Resolves a ref to its commit and lists the .sqlx files of the commit with their blob SHAs.
+
+    The ref is resolved with a request conditional on the ETag of the cached listing, so an unchanged ref is
+    answered with a 304 and its cached listing is reused. Otherwise the tree of the commit is listed with one
+    recursive request.
+
+    Args:
+      repo: The GitHub repository, as returned by the repos API.
+      requester: The GitHubRequester to send the requests with.
+      ref: The branch, tag or commit to list.
+      tree_cache: Cached listings keyed by "<repository>@<ref>", updated in place.
 
+    Returns:
+      A tuple with the SHA of the listed commit, and a dict with the blob SHA of each .sqlx file keyed by its
+      path, or None if GitHub truncated the tree.
+    """
+    key = f"{repo['full_name']}@{ref}"
+    cached = tree_cache.get(key, {})
+    status, etag, body = requester.get(f"{repo['url']}/commits/{ref}", cached.get("etag"),
+                                       accept="application/vnd.github.sha")
+    if status == 304:
+        return cached["commit"], cached["blobs"]
+    commit = body.decode().strip()
+    tree = requester.get_json(f"{repo['url']}/git/trees/{commit}?recursive=1")
+    if tree.get("truncated"):
+        logging.warning(f"The tree of {key} is truncated, falling back to the repository archive.")
+        return commit, None
+    blobs = {e["path"]: e["sha"] for e in tree["tree"] if e["type"] == "blob" and e["path"].endswith(".sqlx")}
+    tree_cache[key] = {"etag": etag, "commit": commit, "blobs": blobs}
+    return commit, blobs
 
-def extract_iam_metadata(file_content):
-    """Extracts IAM metadata from file content and formats it as JSON.
+def fetch_blob_contents(repo, requester, shas):
+    """Fetches the raw content of git blobs, one request each sent concurrently within the rate limit.
 
     Args:
-    file_content: The content of the .sqlx file.
+      repo: The GitHub repository, as returned by the repos API.
+      requester: The GitHubRequester to send the requests with.
+      shas: The blob SHAs to fetch.
 
     Returns:
-    A JSON string containing the extracted IAM metadata, or None if no
-    metadata is found.
+      A dict with the decoded content of each blob, keyed by SHA.
+    """
+    shas = sorted(shas)
+    bodies = requester.map(
+        lambda sha: requester.get(f"{repo['url']}/git/blobs/{sha}", accept="application/vnd.github.raw")[2], shas)
+    return {sha: body.decode() for sha, body in zip(shas, bodies)}
+
+def read_sqlx_contents(repo, requester, ref, blobs, mirror=None):
+    """Reads .sqlx files one after the other, with as few requests as possible.
+
+    They are read from the local mirror by batches of MIRROR_READ_BATCH_SIZE blobs when one is given, otherwise
+    up to BLOB_FETCH_LIMIT blobs are fetched individually and more are streamed from the repository archive.
+
+    Args:
+      repo: The GitHub repository, as returned by the repos API.
+      requester: The GitHubRequester to send the requests with.
+      ref: The branch, tag or commit the files are listed at.
+      blobs: The blob SHA of each file to read, keyed by its path.
+      mirror: The up to date git_mirror.GitMirror of the repository, GitHub is not called when given.
+
+    Yields:
+      A tuple with the path of each file and its content.
     """
-    # Find the iam_metadata block within the comments using regex
-    match = re.search(r"//iam_metadata:\s*{(.*?)}", file_content, re.DOTALL)
-    if match:
-        metadata_block = match.group(1)
-        # Remove comments and extra whitespace
-        metadata_block = re.sub(r"//|\s", "", metadata_block)
-        # Find the table name
-        table_name_match = re.search(r"name:\s*\"([^\"]+)\"", file_content)
-        table_name = table_name_match.group(1) if table_name_match else None
-
-        # Construct the JSON output
-        try:
-            print(str(table_name))
-            print(str(metadata_block))
-            json_output = {
-                "table": table_name,
-                "iam_metadata": json.loads(metadata_block)
-            }
-            return json.dumps(json_output, indent=2)
-        except json.JSONDecodeError as e:
-            logging.error(f"Error decoding iam metadata JSON from .sqlx file: {e}")
-            return None
+    if not blobs:
+        return
+    if mirror:
+        paths = sorted(blobs)
+        for i in range(0, len(paths), MIRROR_READ_BATCH_SIZE):
+            batch = paths[i:i + MIRROR_READ_BATCH_SIZE]
+            contents = mirror.read_blobs({blobs[path] for path in batch})
+            yield from ((path, contents[blobs[path]]) for path in batch)
+    elif len(set(blobs.values())) <= BLOB_FETCH_LIMIT:
+        contents = fetch_blob_contents(repo, requester, set(blobs.values()))
+        yield from ((path, contents[blobs[path]]) for path in sorted(blobs))
     else:
-        return None
+        yield from ((path, content) for path, content in fetch_sqlx_contents(repo, requester, ref) if path in blobs)
 
-def list_sqlx_files(repo):
+def list_sqlx_files(repo, requester, ref=None, cache_file=None, extraction_cache=None, on_metadata=None,
+                    mirror=None):
     """Lists .sqlx files with 'ddl' tag in a GitHub repository.
 
+    The IAM metadata of the blobs in the extraction cache is reported first, then the missing blobs are read with
+    read_sqlx_contents and each one is parsed and reported as soon as it is read, without holding the others.
+
     Args:
-      repo: The GitHub repository object.
+      repo: The GitHub repository, as returned by the repos API.
+      requester: The GitHubRequester to send the requests with.
+      ref: The branch, tag or commit to extract from, the default branch if not given.
+      cache_file: Path to the SQLX index cache, no cache is used when empty.
+      extraction_cache: The loaded extraction cache, updated in place.
+      on_metadata: Called with the IAM metadata of each table as soon as it is known, instead of collecting it.
+      mirror: The up to date git_mirror.GitMirror of the repository, GitHub is not called when given.
+
+    Returns:
+      A tuple with the IAM metadata of each table sorted by file path (empty when on_metadata is given), and the
+      blob SHAs of the .sqlx files of the ref.
     """
-    all_metadata = []
-    contents = repo.get_contents("")
-    while contents:
-        file_content = contents.pop(0)
-        if file_content.type == "dir":
-            contents.extend(repo.get_contents(file_content.path))
-
-        elif file_content.name.endswith(".sqlx"):
-            file_path = file_content.path
-            file_content = repo.get_contents(file_path).decoded_content.decode()
-            if 'tags: ["ddl"]' in file_content:
-                metadata = extract_iam_metadata(file_content)
-                if metadata:
-                    all_metadata.append(metadata)
+    ref = ref or repo["default_branch"]
+    cache = extraction_cache if extraction_cache is not None else {"trees": {}, "blobs": {}}
+    index_cache = sqlx_indexer.load_index_cache(cache_file)
+    used_entries = {}
+    collected = []
 
-    print(json.dumps(all_metadata, indent=2))
+    def report(file_path, metadata):
+        if not metadata:
+            return
+        if on_metadata:
+            on_metadata(metadata)
+        else:
+            collected.append((file_path, metadata))
+
+    def extract(file_path, content):
+        sha = blobs[file_path]
+        if sha not in cache["blobs"]:
+            digest = sqlx_indexer.content_hash(content)
+            entry = used_entries[digest] = index_cache.get(digest) or sqlx_indexer.parse_sqlx(content)
+            metadata = None
+            if "ddl" in entry["tags"] and entry["iam_metadata"] is not None:
+                print(f"{repo['full_name']}/{file_path}: {entry['name'] or file_path}", file=sys.stderr)
+                # Dataform names actions without a config name after their file.
+                table = entry["name"] or os.path.splitext(os.path.basename(file_path))[0]
+                metadata = {"table": table, "schema": entry["schema"], "database": entry["database"],
+                            "iam_metadata": entry["iam_metadata"]}
+            cache["blobs"][sha] = metadata
+        report(file_path, cache["blobs"][sha])
+
+    if mirror:
+        blobs = mirror.list_files(ref, ".sqlx")
+    else:
+        # The archive fallbacks download the listed commit rather than the ref, which may have moved since.
+        ref, blobs = list_sqlx_blobs(repo, requester, ref, cache["trees"])
+    if blobs is None:
+        # The truncated tree does not list every file, their blob SHAs are computed from the archive instead.
+        blobs = {}
+        for file_path, content in fetch_sqlx_contents(repo, requester, ref):
+            blobs[file_path] = git_blob_sha(content.encode())
+            extract(file_path, content)
+    else:
+        missing = {path: sha for path, sha in blobs.items() if sha not in cache["blobs"]}
+        logging.info(f"Extracting {len(missing)} of {len(blobs)} SQLX files of {repo['full_name']}, "
+                     f"the rest are cached.")
+        for file_path in sorted(set(blobs) - set(missing)):
+            report(file_path, cache["blobs"][blobs[file_path]])
+        for file_path, content in read_sqlx_contents(repo, requester, ref, missing, mirror):
+            extract(file_path, content)
+
+    if used_entries:
+        sqlx_indexer.save_index_cache(cache_file, used_entries)
+    return [metadata for _, metadata in sorted(collected, key=lambda item: item[0])], set(blobs.values())
+
+def parse_repository_name(remote_repo_url):
+    """Returns the "<owner>/<repo>" full name of a GitHub repository URL."""
+    match = GITHUB_REPO_PATTERN.search(remote_repo_url)
+    if not match:
+        raise ValueError(f"{remote_repo_url} is not a GitHub repository URL.")
+    return f"{match.group(1)}/{match.group(2)}"
+
+def extract_repositories(requester, repositories, cache_file=None, extraction_cache_file=None,
+                         max_workers=4, on_metadata=None, mirror_dir=None):
+    """Extracts the IAM metadata of several Dataform repositories concurrently.
+
+    Args:
+      requester: The GitHubRequester shared by all the repositories, so they draw from one rate limit budget.
+      repositories: The repository settings keyed by repository name, as in var.dataform_repositories.
+      cache_file: Path to the SQLX index cache, no cache is used when empty.
+      extraction_cache_file: Path to the cache of extracted IAM metadata by blob SHA, no cache is used when empty.
+      max_workers: Maximum number of repositories extracted at the same time.
+      on_metadata: Called with the repository-tagged IAM metadata of each table as soon as it is known, from the
+        worker threads, instead of merging the results.
+      mirror_dir: Directory of the local git mirrors to read the repositories from instead of the GitHub API.
+
+    Returns:
+      A tuple with the IAM metadata of every table tagged with its repository name (empty when on_metadata is
+      given), and the names of the repositories that failed.
+    """
+    cache = load_extraction_cache(extraction_cache_file)
+
+    def extract(name, settings):
+        full_name = parse_repository_name(settings["remote_repo_url"])
+        mirror = None
+        if mirror_dir:
+            mirror = git_mirror.GitMirror(settings["remote_repo_url"], mirror_dir, requester.token).update()
+            repo = {"full_name": full_name, "default_branch": "HEAD"}
+        else:
+            repo = requester.get_json(f"{github_requests.GITHUB_API_URL}/repos/{full_name}")
+        tag = lambda metadata: on_metadata({"repository": name, **metadata})
+        return list_sqlx_files(repo, requester, settings.get("branch"), cache_file, cache,
+                               on_metadata=tag if on_metadata else None, mirror=mirror)
+
+    merged = []
+    failed = []
+    live_shas = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(extract, name, settings): name for name, settings in repositories.items()}
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logging.error(f"Error extracting IAM metadata from repository {name}: {e}")
+                failed.append(name)
+
+    for name in sorted(results):
+        all_metadata, shas = results[name]
+        merged.extend({"repository": name, **metadata} for metadata in all_metadata)
+        live_shas.update(shas)
+
+    if not failed:
+        cache["blobs"] = {sha: metadata for sha, metadata in cache["blobs"].items() if sha in live_shas}
+    save_extraction_cache(extraction_cache_file, cache)
+    return merged, sorted(failed)
 
 
 def main(args: collections.abc.Sequence[str]) -> int:
-    """The main function parses command-line arguments and calls the run_workflow function to execute the complete Dataform workflow.
+    """The main function parses command-line arguments and extracts the IAM metadata of the Dataform repositories.
     To run the script, provide the required command-line arguments:
-        python intro.py --project_id your_project_id --location your_location --repository your_repo_name --dataset your_bq_dataset --branch your_branch
+        python iam_metadata_extractor.py --repositories '{"repo": {"remote_repo_url": "https://github.com/org/repo.git"}}' --dataform_repositories_git_token your_token
     """
     parser = argparse.ArgumentParser(description="IAM metadata extractor from dataform repository")
 
     parser.add_argument("--remote_repo_url",
                         type=str,
-                        required=True,
+                        default=None,
                         help="The github repository URL.")
+    parser.add_argument("--repositories",
+                        type=str,
+                        default=None,
+                        help="JSON map of repository name to its settings (remote_repo_url, branch), as in "
+                             "var.dataform_repositories.")
     parser.add_argument("--dataform_repositories_git_token",
                         type=str,
                         required=True,
-                        help="The GCP project Number where the Dataform code will be deployed.")
+                        help="The git token used to read the Dataform repositories.")
+    parser.add_argument("--sqlx_index_cache_file",
+                        type=str,
+                        default="sqlx_index_cache.json",
+                        help="JSON file where parsed SQLX files are cached by content hash.")
+    parser.add_argument("--iam_metadata_cache_file",
+                        type=str,
+                        default="iam_metadata_cache.json",
+                        help="JSON file where extracted IAM metadata is cached by git blob SHA.")
+    parser.add_argument("--max_workers",
+                        type=int,
+                        default=4,
+                        help="Maximum number of repositories extracted concurrently.")
+    parser.add_argument("--github_max_concurrency",
+                        type=int,
+                        default=8,
+                        help="Maximum number of GitHub API requests in flight at once, across all repositories.")
+    parser.add_argument("--git_mirror_dir",
+                        type=str,
+                        default=None,
+                        help="Directory of the local git mirrors shared with the other deployers. When set, the "
+                             "repositories are fetched into it and read locally instead of through the GitHub API.")
+    parser.add_argument("--output_format",
+                        type=str,
+                        choices=["json", "ndjson"],
+                        default="json",
+                        help="json prints a single JSON list once every repository is extracted, ndjson streams "
+                             "one JSON record per table as soon as it is extracted.")
 
     params = parser.parse_args(args)
-    remote_repo_url = str(params.remote_repo_url)
     dataform_repositories_git_token = str(params.dataform_repositories_git_token)
+    sqlx_index_cache_file = str(params.sqlx_index_cache_file)
+    iam_metadata_cache_file = str(params.iam_metadata_cache_file)
+    output_format = str(params.output_format)
+
+    repositories = json.loads(params.repositories) if params.repositories else {}
+    if params.remote_repo_url:
+        remote_repo_url = str(params.remote_repo_url)
+        repositories.setdefault(parse_repository_name(remote_repo_url).split("/")[1],
+                                {"remote_repo_url": remote_repo_url})
+    repositories = {name: settings for name, settings in repositories.items() if settings.get("remote_repo_url")}
+    if not repositories:
+        parser.error("--remote_repo_url or --repositories with at least one remote_repo_url is required.")
 
-    auth = Auth.Token(dataform_repositories_git_token)
-    g = Github(auth=auth)
-    repo = g.get_user().get_repo("aef-sample-dataform-repo")
+    requester = github_requests.GitHubRequester(dataform_repositories_git_token,
+                                                max_concurrency=int(params.github_max_concurrency))
 
-    list_sqlx_files(repo)
+    if output_format == "ndjson":
+        print_lock = threading.Lock()
+
+        def write_record(record):
+            with print_lock:
+                sys.stdout.write(json.dumps(record) + "\n")
+                sys.stdout.flush()
+
+        _, failed = extract_repositories(requester, repositories,
+                                         cache_file=sqlx_index_cache_file,
+                                         extraction_cache_file=iam_metadata_cache_file,
+                                         max_workers=int(params.max_workers), on_metadata=write_record,
+                                         mirror_dir=params.git_mirror_dir)
+        return 1 if failed else 0
+
+    all_metadata, failed = extract_repositories(requester, repositories,
+                                                cache_file=sqlx_index_cache_file,
+                                                extraction_cache_file=iam_metadata_cache_file,
+                                                max_workers=int(params.max_workers),
+                                                mirror_dir=params.git_mirror_dir)
+    print(json.dumps(all_metadata, indent=2))
+    return 1 if failed else 0
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
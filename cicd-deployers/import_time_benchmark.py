@@ -0,0 +1,122 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import collections
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+DEPLOYERS = ("bigquery_ddl_runner", "dataform_runner", "bigquery_iam_applier", "dataplex_operations",
+             "iam_metadata_extractor", "git_mirror", "github_requests", "metadata_bundle", "metadata_deployer",
+             "metadata_planner", "sqlx_indexer")
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure_import_time(module_name, python=sys.executable):
+    """Imports a deployer module in a fresh interpreter with -X importtime.
+
+    -X importtime prints each import after the ones it triggered, indented one level deeper. Only the lines nested
+    under the module are attributed to it, so the imports of the interpreter startup, such as site and the .pth
+    files of the environment, are left out.
+
+    Args:
+        module_name (str): The name of the deployer module in this directory.
+        python (str): The Python interpreter to measure, e.g. the venv one Terraform uses.
+
+    Returns:
+        tuple: The cumulative import time of the module in microseconds, and the cumulative time of each import it
+        triggered directly, keyed by package name.
+    """
+    completed = subprocess.run([python, "-X", "importtime", "-c", f"import {module_name}"],
+                               cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True, text=True, check=True)
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            imports.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    total = 0
+    packages = {}
+    for i, (cumulative_us, depth, name) in enumerate(imports):
+        if name != module_name:
+            continue
+        total = cumulative_us
+        for child_cumulative_us, child_depth, child_name in reversed(imports[:i]):
+            if child_depth <= depth:
+                break
+            if child_depth == depth + 2:
+                packages[child_name] = child_cumulative_us
+        break
+    return total, packages
+
+
+def benchmark(modules, repeat, python=sys.executable):
+    """Measures the median import time of each deployer module.
+
+    Args:
+        modules (list): The names of the deployer modules.
+        repeat (int): How many fresh interpreters to measure each module in.
+        python (str): The Python interpreter to measure.
+
+    Returns:
+        dict: The median import time in milliseconds and the heaviest direct imports of each module.
+    """
+    report = {}
+    for module_name in modules:
+        totals = []
+        packages = collections.defaultdict(list)
+        for _ in range(repeat):
+            total, module_packages = measure_import_time(module_name, python)
+            totals.append(total)
+            for name, cumulative_us in module_packages.items():
+                packages[name].append(cumulative_us)
+        heaviest = sorted(((name, statistics.median(times)) for name, times in packages.items()),
+                          key=lambda item: item[1], reverse=True)[:5]
+        report[module_name] = {
+            "import_ms": round(statistics.median(totals) / 1000, 1),
+            "heaviest_imports_ms": {name: round(us / 1000, 1) for name, us in heaviest},
+        }
+    return report
+
+
+def main(args: collections.abc.Sequence[str]) -> int:
+    """Benchmarks the import time of the cicd-deployers with python -X importtime.
+    To run the script:
+        python import_time_benchmark.py --python aef_dataform_executor/bin/python3 --repeat 5
+    """
+    parser = argparse.ArgumentParser(description="Import time benchmark of the cicd-deployers")
+    parser.add_argument("--modules",
+                        nargs="*",
+                        type=str,
+                        default=list(DEPLOYERS),
+                        help="The deployer modules to benchmark.")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="How many fresh interpreters to measure each module in.")
+    parser.add_argument("--python",
+                        type=str,
+                        default=sys.executable,
+                        help="The Python interpreter to measure, e.g. the virtualenv one used by Terraform.")
+    params = parser.parse_args(args)
+
+    print(json.dumps(benchmark(list(params.modules), int(params.repeat), str(params.python)), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,420 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import argparse
+import collections
+import hashlib
+import json
+import os
+import sys
+import time
+
+BUNDLE_VERSION = 1
+METADATA_DIRECTORIES = {
+    "lakes": "../metadata/lakes",
+    "tag_templates": "../metadata/tag_templates",
+    "policy_taxonomies": "../metadata/policy_taxonomies",
+    "annotations": "../metadata/annotations",
+}
+
+_STRING = {"type": "string"}
+_MEMBERS = {"type": "array", "items": _STRING}
+_LABELS = {"type": "array", "items": {"type": "object", "required": ["name", "value"],
+                                      "properties": {"name": _STRING}}}
+_POLICY_TAG = {
+    "type": "object",
+    "required": ["display_name"],
+    "properties": {
+        "display_name": _STRING,
+        "description": _STRING,
+        "unmasked_readers": _MEMBERS,
+        "data_policies": {"type": "array", "items": {
+            "type": "object",
+            "required": ["display_name", "masking_rule"],
+            "properties": {
+                "display_name": _STRING,
+                "masking_rule": {"type": "string", "enum": ["SHA256", "ALWAYS_NULL", "DEFAULT_MASKING_VALUE",
+                                                            "LAST_FOUR_CHARACTERS", "FIRST_FOUR_CHARACTERS",
+                                                            "EMAIL_MASK", "DATE_YEAR_MASK"]},
+                "masked_readers": _MEMBERS,
+            },
+        }},
+    },
+}
+_POLICY_TAG["properties"]["child_policy_tags"] = {"type": "array", "items": _POLICY_TAG}
+# A subset of JSON Schema describing each kind of metadata spec, after rendering.
+SPEC_SCHEMAS = {
+    "lakes": {
+        "type": "object",
+        "required": ["lakes"],
+        "properties": {
+            "project": _STRING,
+            "lakes": {"type": "array", "items": {
+                "type": "object",
+                "required": ["display_name"],
+                "properties": {
+                    "display_name": _STRING,
+                    "region": _STRING,
+                    "description": _STRING,
+                    "labels": _LABELS,
+                    "zones": {"type": "array", "items": {
+                        "type": "object",
+                        "required": ["display_name", "zone_type"],
+                        "properties": {
+                            "display_name": _STRING,
+                            "description": _STRING,
+                            "zone_type": {"type": "string", "enum": ["RAW", "CURATED"]},
+                            "location_type": {"type": "string", "enum": ["SINGLE_REGION", "MULTI_REGION"]},
+                            "labels": _LABELS,
+                        },
+                    }},
+                },
+            }},
+        },
+    },
+    "tag_templates": {
+        "type": "object",
+        "required": ["templates"],
+        "properties": {
+            "project": _STRING,
+            "templates": {"type": "array", "items": {
+                "type": "object",
+                "required": ["display_name", "fields"],
+                "properties": {
+                    "display_name": _STRING,
+                    "level": {"type": "string", "enum": ["ASSET", "FIELD"]},
+                    "fields": {"type": "array", "items": {
+                        "type": "object",
+                        "required": ["display_name", "field_type"],
+                        "properties": {
+                            "display_name": _STRING,
+                            "field_type": {"oneOf": [
+                                {"type": "string", "enum": ["DOUBLE", "STRING", "BOOL", "TIMESTAMP", "RICHTEXT"]},
+                                {"type": "object", "required": ["enum_allowed_values"],
+                                 "properties": {"enum_allowed_values": _MEMBERS}},
+                            ]},
+                        },
+                    }},
+                },
+            }},
+        },
+    },
+    "policy_taxonomies": {
+        "type": "object",
+        "required": ["taxonomies"],
+        "properties": {
+            "project": _STRING,
+            "taxonomies": {"type": "array", "items": {
+                "type": "object",
+                "required": ["display_name"],
+                "properties": {
+                    "display_name": _STRING,
+                    "description": _STRING,
+                    "policy_tags": {"type": "array", "items": _POLICY_TAG},
+                },
+            }},
+        },
+    },
+    "annotations": {
+        "type": "object",
+        "required": ["dataset", "name"],
+        "properties": {
+            "project": _STRING,
+            "dataset": _STRING,
+            "name": _STRING,
+            "description": _STRING,
+            "fields": {"type": "array", "items": {
+                "type": "object",
+                "required": ["name"],
+                "properties": {"name": _STRING, "description": _STRING},
+            }},
+        },
+    },
+}
+# The Dataplex assets registered with the metadata, e.g. the BigQuery datasets and buckets of the Terraform variables.
+ASSET_SCHEMA = {
+    "type": "object",
+    "required": ["name", "location", "lake", "zone", "resource_name", "resource_type"],
+    "properties": {
+        "name": _STRING,
+        "location": _STRING,
+        "lake": _STRING,
+        "zone": _STRING,
+        "resource_name": _STRING,
+        "resource_type": {"type": "string", "enum": ["BIGQUERY_DATASET", "STORAGE_BUCKET"]},
+        "discovery_enabled": {"type": "boolean"},
+        "labels": {"type": "object"},
+    },
+}
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool, "number": (int, float)}
+
+
+class BundleValidationError(ValueError):
+    """Raised when metadata specs do not match their schema, with every error found."""
+
+    def __init__(self, errors):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+def yaml_loader():
+    """Returns the libyaml-backed safe loader when PyYAML was built with it, the pure Python one otherwise."""
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def render_metadata_file(path, variables):
+    """Renders the Jinja placeholders of a metadata YAML file and parses it.
+
+    Args:
+        path (str): The path of the YAML file.
+        variables (dict): The values of the placeholders, e.g. project_id_tgt.
+
+    Returns:
+        dict: The parsed YAML document.
+    """
+    import jinja2
+    import yaml
+
+    with open(path, "r") as f:
+        rendered = jinja2.Template(f.read(), undefined=jinja2.StrictUndefined).render(**variables)
+    return yaml.load(rendered, Loader=yaml_loader()) or {}
+
+
+def list_metadata_files(directories):
+    """Lists the YAML files of every comma-separated metadata directory, keyed by the kind of directory."""
+    files = {}
+    for kind, kind_directories in directories.items():
+        files[kind] = []
+        for directory in filter(None, kind_directories.split(",")):
+            for dir_path, _, file_names in os.walk(directory):
+                files[kind].extend(os.path.join(dir_path, name) for name in sorted(file_names)
+                                   if name.endswith((".yaml", ".yml")))
+    return files
+
+
+def validate(document, schema, path="$"):
+    """Validates a document against a JSON Schema subset (type, required, properties, items, enum, oneOf).
+
+    Returns:
+        list: The validation errors, each prefixed with the JSON path of the offending value.
+    """
+    if "oneOf" in schema:
+        if any(not validate(document, option, path) for option in schema["oneOf"]):
+            return []
+        return [f"{path}: does not match any of the allowed forms"]
+    expected = _JSON_TYPES[schema["type"]]
+    if not isinstance(document, expected) or (schema["type"] == "number" and isinstance(document, bool)):
+        return [f"{path}: expected {schema['type']}, got {type(document).__name__}"]
+    if "enum" in schema and document not in schema["enum"]:
+        return [f"{path}: {document!r} is not one of {', '.join(schema['enum'])}"]
+    errors = []
+    if schema["type"] == "object":
+        errors.extend(f"{path}: missing required property {name}" for name in schema.get("required", [])
+                      if name not in document)
+        for name, property_schema in schema.get("properties", {}).items():
+            if name in document and document[name] is not None:
+                errors.extend(validate(document[name], property_schema, f"{path}.{name}"))
+    elif schema["type"] == "array":
+        for i, item in enumerate(document):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def content_hash(bundle):
+    """Returns the sha256 hex digest of the canonical JSON of a bundle, its hash field left out."""
+    content = {key: value for key, value in bundle.items() if key != "hash"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def cortex_variables(config):
+    """Returns the Jinja placeholders Cortex renders the metadata specs with from its configuration.
+
+    Args:
+        config (dict): The Cortex configuration, as built by metadata_deployer.build_cortex_config.
+
+    Returns:
+        dict: The value of each placeholder, e.g. project_id_tgt or k9_datasets_reporting.
+    """
+    variables = {
+        "project_id_src": config["projectIdSource"],
+        "project_id_tgt": config["projectIdTarget"],
+        "location": config["location"],
+        "target_bucket": config["targetBucket"],
+    }
+    for name, dataset in config.get("k9", {}).get("datasets", {}).items():
+        variables[f"k9_datasets_{name}"] = dataset
+    return variables
+
+
+def compile_bundle(directories, project_id, location, variables=None, assets=None):
+    """Renders, validates and normalizes every metadata spec into a single content-hashed bundle.
+
+    Args:
+        directories (dict): The comma-separated directories of each kind of spec, as in METADATA_DIRECTORIES.
+        project_id (str): The target project.
+        location (str): The location of the metadata resources.
+        variables (dict): Additional values of the Jinja placeholders. The specs are otherwise rendered with the
+            cortex_variables of the configuration metadata_deployer.py deploys them with.
+        assets (list): The Dataplex assets to register, each as described by ASSET_SCHEMA.
+
+    Returns:
+        dict: The bundle, with the rendered documents of each kind keyed by their normalized source path, and
+            the sha256 hash of its canonical JSON.
+
+    Raises:
+        BundleValidationError: If any spec does not render or does not match the schema of its kind.
+    """
+    from metadata_deployer import build_cortex_config
+
+    variables = {**cortex_variables(build_cortex_config(project_id, location)), **(variables or {})}
+    specs = {}
+    errors = []
+    for kind, paths in list_metadata_files(directories).items():
+        specs[kind] = {}
+        for path in paths:
+            try:
+                document = render_metadata_file(path, variables)
+            except Exception as e:
+                errors.append(f"{path}: {e}")
+                continue
+            errors.extend(f"{path}: {error}" for error in validate(document, SPEC_SCHEMAS[kind]))
+            specs[kind][os.path.normpath(path)] = document
+    for i, asset in enumerate(assets or []):
+        errors.extend(f"assets: {error}" for error in validate(asset, ASSET_SCHEMA, f"$[{i}]"))
+    if errors:
+        raise BundleValidationError(errors)
+    bundle = {"version": BUNDLE_VERSION, "project_id": project_id, "location": location, "specs": specs}
+    if assets:
+        bundle["assets"] = sorted(assets, key=lambda asset: (asset["location"], asset["lake"], asset["zone"],
+                                                             asset["name"]))
+    bundle["hash"] = content_hash(bundle)
+    return bundle
+
+
+def write_bundle_specs(bundle, directory):
+    """Writes the rendered documents of a bundle as YAML spec directories, for tools that read spec files.
+
+    Args:
+        bundle (dict): The bundle, as returned by compile_bundle or read_bundle.
+        directory (str): The directory the specs are written under, one subdirectory per kind.
+
+    Returns:
+        tuple: The directory of each kind, keyed by kind as in METADATA_DIRECTORIES, and the source path of each
+        written file, keyed by its path.
+    """
+    import yaml
+
+    directories = {}
+    sources = {}
+    for kind, documents in bundle["specs"].items():
+        directories[kind] = os.path.join(directory, kind)
+        os.makedirs(directories[kind], exist_ok=True)
+        for i, (source, document) in enumerate(sorted(documents.items())):
+            path = os.path.join(directories[kind], f"{i:04d}_{os.path.basename(source)}")
+            with open(path, "w") as f:
+                yaml.safe_dump(document, f, sort_keys=False)
+            sources[path] = source
+    return directories, sources
+
+
+def read_bundle(path):
+    """Reads a compiled bundle and checks that its content still matches its hash.
+
+    Raises:
+        ValueError: If the bundle was compiled by another version or was edited after compilation.
+    """
+    with open(path, "r") as f:
+        bundle = json.load(f)
+    if bundle.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"{path} is a version {bundle.get('version')} bundle, recompile it with metadata_bundle.py")
+    if content_hash(bundle) != bundle.get("hash"):
+        raise ValueError(f"{path} does not match its hash, recompile it with metadata_bundle.py")
+    return bundle
+
+
+def is_deployed(state_file, bundle_hash, settings):
+    """Returns whether a bundle was already deployed successfully with the same deployment settings.
+
+    Args:
+        state_file (str): The file recording the last successful deployment, as written by save_deployed.
+        bundle_hash (str): The hash of the bundle to deploy.
+        settings (dict): The settings that change what a deployment does, e.g. the deployment mode.
+    """
+    if not state_file or not os.path.exists(state_file):
+        return False
+    try:
+        with open(state_file, "r") as f:
+            state = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f"Could not read the deployed bundle state {state_file}, deploying.")
+        return False
+    return state.get("hash") == bundle_hash and state.get("settings") == settings
+
+
+def save_deployed(state_file, bundle_hash, settings):
+    """Records the hash and settings of a successfully deployed bundle."""
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"hash": bundle_hash, "settings": settings, "deployed_at": time.time()}, f)
+    os.replace(tmp_file, state_file)
+
+
+def main(args: collections.abc.Sequence[str]) -> int:
+    """Compiles and validates the metadata specs into a content-hashed JSON bundle.
+    To run the script, provide the required command-line arguments:
+        python metadata_bundle.py --project_id your_project_id --location your_location --output metadata_bundle.json
+    """
+    parser = argparse.ArgumentParser(description="Metadata bundle compiler")
+    parser.add_argument("--project_id",
+                        type=str,
+                        required=True,
+                        help="Project where metadata (lakes, zones, tags, etc.) will be deployed.")
+    parser.add_argument("--location",
+                        type=str,
+                        required=True,
+                        help="Location where metadata (lakes, zones, tags, etc.) will be deployed.")
+    for kind, directory in METADATA_DIRECTORIES.items():
+        parser.add_argument(f"--{kind}_directories",
+                            type=str,
+                            default=directory,
+                            help=f"Comma-separated directories of the {kind} specs.")
+    parser.add_argument("--assets",
+                        type=str,
+                        default=None,
+                        help="JSON list of the Dataplex assets to register, each with its name, location, lake, "
+                             "zone, resource_name, resource_type, discovery_enabled and labels.")
+    parser.add_argument("--output",
+                        type=str,
+                        default="metadata_bundle.json",
+                        help="The JSON file the bundle is written to.")
+    params = parser.parse_args(args)
+
+    directories = {kind: str(getattr(params, f"{kind}_directories")) for kind in METADATA_DIRECTORIES}
+    try:
+        bundle = compile_bundle(directories, str(params.project_id), str(params.location),
+                                assets=json.loads(params.assets) if params.assets else None)
+    except BundleValidationError as e:
+        for error in e.errors:
+            print(error, file=sys.stderr)
+        return 1
+    with open(str(params.output), "w") as f:
+        json.dump(bundle, f, indent=2, sort_keys=True)
+    print(json.dumps({"hash": bundle["hash"], "output": str(params.output)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -20,29 +20,224 @@ import json
 import sys
 import argparse
 import collections
+import functools
+import importlib.metadata
+import importlib.util
+import re
+import tempfile
+import time
+import metadata_bundle
+import metadata_planner
 
-def run_deploy_data_mesh(config_file, tag_template_directories, policy_directories, lake_directories,
-                         annotation_directories, overwrite):
-    """Runs the 'deploy_data_mesh.py' script with provided arguments.
+CORTEX_REPO_URL = "https://github.com/GoogleCloudPlatform/cortex-data-foundation.git"
+CORTEX_SRC_CODE_PATH = "metadata/metadata-deployer/cortex_src_code"
+CORTEX_PIN_FILE = ".aef_cortex_pin.json"
+DEPLOYED_BUNDLE_FILE = ".aef_metadata_deployed.json"
+COMMIT_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+# The names a spec declares its lakes, zones, templates, taxonomies, policy tags or annotated table with.
+SPEC_NAME_PATTERN = re.compile(r"^\s*(?:-\s*)?(?:display_name|name)\s*:\s*[\"']?([^\"'#\n]+?)[\"']?\s*$", re.MULTILINE)
+CORTEX_EXTRA_REQUIREMENTS = (
+    "exceptiongroup",
+    "google-api-core",
+    "google-cloud-bigquery",
+    "google-cloud-bigquery-datapolicies",
+    "google-cloud-datacatalog",
+    "google-cloud-dataplex",
+)
+# Needed to compile the metadata bundle, before the Cortex requirements are installed.
+BUNDLE_REQUIREMENTS = ("jinja2", "pyyaml")
+# The Google Cloud clients of the plan and apply modes, which do not install the Cortex requirements.
+PLANNER_REQUIREMENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         "metadata_planner_requirements.txt")
+
+
+def git_output(src_code_path, *args):
+    """Runs a git command in the Cortex checkout and returns its stripped stdout."""
+    return subprocess.run(["git", "-C", src_code_path, *args], check=True, capture_output=True,
+                          text=True).stdout.strip()
+
+
+def ensure_cortex_checkout(src_code_path=CORTEX_SRC_CODE_PATH, cortex_ref="main", repo_url=CORTEX_REPO_URL):
+    """Makes sure the cached Cortex checkout is at the pinned commit, fetching it only when the pin changes.
+
+    A commit SHA ref is its own pin. Any other ref (branch or tag) is pinned to the commit it resolved to on the
+    first checkout, recorded in CORTEX_PIN_FILE, until the ref itself changes. When the checkout is already at
+    the pinned commit the check is a single git rev-parse, otherwise only that commit is fetched, shallowly.
+
+    Args:
+        src_code_path (str): The directory of the persistent Cortex checkout.
+        cortex_ref (str): The commit SHA, branch or tag of cortex-data-foundation to deploy with.
+        repo_url (str): The cortex-data-foundation repository URL.
+
+    Returns:
+        str: The commit SHA of the checkout.
+    """
+    pin_file = os.path.join(src_code_path, CORTEX_PIN_FILE)
+    pinned_commit = cortex_ref if COMMIT_SHA_PATTERN.match(cortex_ref) else None
+    if pinned_commit is None and os.path.exists(pin_file):
+        with open(pin_file, "r") as f:
+            pin = json.load(f)
+        if pin.get("ref") == cortex_ref:
+            pinned_commit = pin.get("commit")
+
+    if os.path.exists(os.path.join(src_code_path, ".git")):
+        try:
+            head = git_output(src_code_path, "rev-parse", "HEAD")
+        except subprocess.CalledProcessError:
+            head = None
+        if pinned_commit is not None and head == pinned_commit:
+            logging.info(f"Cortex checkout is at pinned commit {head}")
+            return head
+    else:
+        if os.path.exists(src_code_path):
+            shutil.rmtree(src_code_path)
+        os.makedirs(src_code_path)
+        subprocess.run(["git", "-C", src_code_path, "init", "--quiet"], check=True)
+        subprocess.run(["git", "-C", src_code_path, "remote", "add", "origin", repo_url], check=True)
+
+    logging.info(f"Fetching cortex-data-foundation {pinned_commit or cortex_ref}")
+    subprocess.run(["git", "-C", src_code_path, "fetch", "--quiet", "--depth", "1", "origin",
+                    pinned_commit or cortex_ref], check=True)
+    subprocess.run(["git", "-C", src_code_path, "checkout", "--quiet", "--force", "FETCH_HEAD"], check=True)
+    head = git_output(src_code_path, "rev-parse", "HEAD")
+    with open(pin_file, "w") as f:
+        json.dump({"ref": cortex_ref, "commit": head}, f)
+    return head
+
+
+class ProgressHandler(logging.Handler):
+    """Forwards the log records of the Cortex data mesh deployment to a progress callback and collects errors."""
+
+    def __init__(self, progress=None):
+        super().__init__(level=logging.INFO)
+        self.progress = progress
+        self.errors = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if record.levelno >= logging.ERROR:
+            self.errors.append(message)
+        if self.progress:
+            self.progress({"event": "log", "level": record.levelname, "logger": record.name, "message": message})
+
+
+@functools.lru_cache(maxsize=None)
+def load_data_mesh_module(src_code_path=CORTEX_SRC_CODE_PATH):
+    """Imports the Cortex deploy_data_mesh module once per process.
+
+    Its directory is put first on sys.path, as when the script is run directly, so its own imports resolve.
 
     Args:
-        config_file (str): Path to the configuration JSON file.
+        src_code_path (str): The directory of the Cortex checkout.
+
+    Returns:
+        module: The deploy_data_mesh module.
+    """
+    module_path = os.path.abspath(os.path.join(src_code_path, "src", "common", "data_mesh", "deploy_data_mesh.py"))
+    if os.path.dirname(module_path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(module_path))
+    spec = importlib.util.spec_from_file_location("deploy_data_mesh", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def list_data_mesh_specs(directories):
+    """Lists the Cortex data mesh spec files of every kind of resource.
+
+    Args:
+        directories (dict): The comma-separated spec directories of each kind of resource.
+
+    Returns:
+        list: The kind and path of each spec file.
+    """
+    specs = []
+    for kind, kind_directories in directories.items():
+        for directory in filter(None, kind_directories.split(",")):
+            for dir_path, _, file_names in os.walk(directory):
+                specs.extend({"kind": kind, "spec": os.path.join(dir_path, name)}
+                             for name in sorted(file_names) if name.endswith((".yaml", ".yml")))
+    return specs
+
+
+def spec_names(spec_file):
+    """Returns the names the log records of Cortex may refer to a spec by: its file name and the names of the
+    resources it declares."""
+    with open(spec_file, "r") as f:
+        names = {name.strip() for name in SPEC_NAME_PATTERN.findall(f.read())}
+    file_name = os.path.basename(spec_file)
+    return {file_name, os.path.splitext(file_name)[0]} | names - {""}
+
+
+def attribute_errors(specs, errors):
+    """Attributes the error records of a Cortex run to the specs they mention by file or resource name.
+
+    Args:
+        specs (list): The kind and path of each spec file, as returned by list_data_mesh_specs.
+        errors (list): The error messages logged by the run.
+
+    Returns:
+        list: The error messages mentioning each spec, in the order of specs.
+    """
+    attributed = []
+    for spec in specs:
+        names = sorted(spec_names(spec["spec"]), key=len, reverse=True)
+        pattern = re.compile(r"(?<![\w-])(%s)(?![\w-])" % "|".join(map(re.escape, names)))
+        attributed.append([error for error in errors if pattern.search(error)])
+    return attributed
+
+
+def run_deploy_data_mesh(config, tag_template_directories, policy_directories, lake_directories,
+                         annotation_directories, overwrite, cortex_ref="main", in_process=True, progress=None):
+    """Runs the Cortex 'deploy_data_mesh.py' deployment with provided arguments.
+
+    By default the deployment runs in this process: the Cortex module is imported once and its entry point is
+    called directly, instead of paying for a second interpreter and its imports. The Cortex entry point only reads
+    its configuration from a file, so a configuration object is written to a temporary one.
+
+    Cortex deploys every spec in a single run and only reports an exit code, so the status of each resource spec
+    is derived from the error records the run logs: a spec mentioned by an error, by file name or by the name of
+    a resource it declares, failed. The other specs are deployed when the run succeeded, and unknown otherwise.
+    Error records are only captured in process.
+
+    Args:
+        config (dict or str): The Cortex configuration, or the path to a configuration JSON file.
         tag_template_directories (str): Path to the tag template directories.
         policy_directories (str): Path to the policy taxonomies directories.
         lake_directories (str): Path to the lake directories.
         annotation_directories (str): Path to the annotation directories.
         overwrite (bool): Whether to overwrite existing data.
+        cortex_ref (str): The commit SHA, branch or tag of cortex-data-foundation to deploy with.
+        in_process (bool): Run the deployment in this process rather than in a python3 subprocess.
+        progress (callable): Called with a dict for every stage and every log record of the deployment.
+
+    Returns:
+        dict: The status, Cortex commit, duration and errors of the deployment, and the status (deployed, failed
+        or unknown) and errors of each resource spec it deployed.
     """
-    src_code_path = "metadata/metadata-deployer/cortex_src_code"
-    if os.path.exists(src_code_path):
-        shutil.rmtree(src_code_path)
-        subprocess.run(["git", "rm", "-rf", "--cached", src_code_path], check=True)
-
-    subprocess.run(["git", "submodule", "add", "-f", "https://github.com/GoogleCloudPlatform/cortex-data-foundation.git",
-                    src_code_path])
-    command = [
-        "python3",
-        "metadata/metadata-deployer/cortex_src_code/src/common/data_mesh/deploy_data_mesh.py",
+    progress = progress or (lambda event: None)
+    src_code_path = CORTEX_SRC_CODE_PATH
+    progress({"event": "checkout", "cortex_ref": cortex_ref})
+    cortex_commit = ensure_cortex_checkout(src_code_path, cortex_ref)
+    progress({"event": "requirements"})
+    ensure_requirements(f"{src_code_path}/requirements.in", CORTEX_EXTRA_REQUIREMENTS)
+
+    directories = {
+        "tag_templates": tag_template_directories,
+        "policy_taxonomies": policy_directories,
+        "lakes": lake_directories,
+        "annotations": annotation_directories,
+    }
+    specs = list_data_mesh_specs(directories)
+    progress({"event": "deploy", "specs": len(specs)})
+
+    config_file = config
+    if not isinstance(config, str):
+        # The Cortex entry point only accepts a configuration file, the object is handed over through a temporary one.
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(config, f)
+        config_file = f.name
+    arguments = [
         "--config-file", config_file,
         "--tag-template-directories", tag_template_directories,
         "--policy-directories", policy_directories,
@@ -50,34 +245,56 @@ def run_deploy_data_mesh(config_file, tag_template_directories, policy_directori
         "--annotation-directories", annotation_directories
     ]
     if overwrite != "false":
-        command.append("--overwrite")
-
-    requirements_path = "metadata/metadata-deployer/cortex_src_code/requirements.in"
+        arguments.append("--overwrite")
 
-    # Check if dependencies are installed
-    if not all([os.path.exists(req) for req in open(requirements_path)]):
-        new_lines = [
-            "exceptiongroup",
-            "google-api-core",
-            "google-cloud-bigquery",
-            "google-cloud-bigquery-datapolicies",
-            "google-cloud-datacatalog",
-            "google-cloud-dataplex",
-        ]
-        add_lines_to_file(requirements_path, new_lines)
-        subprocess.run([f"pip", "install", "-r", requirements_path], check=True)
+    handler = ProgressHandler(progress)
+    start = time.time()
+    try:
+        if in_process:
+            logging.getLogger().addHandler(handler)
+            try:
+                exit_code = load_data_mesh_module(src_code_path).main(arguments) or 0
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                logging.exception(f"Cortex data mesh deployment failed: {e}")
+                exit_code = 1
+            finally:
+                logging.getLogger().removeHandler(handler)
+        else:
+            command = ["python3", f"{src_code_path}/src/common/data_mesh/deploy_data_mesh.py", *arguments]
+            exit_code = subprocess.run(command, check=False).returncode
+    finally:
+        if config_file is not config:
+            os.remove(config_file)
 
-    subprocess.run(command, check=True)
+    resources = []
+    for spec, errors in zip(specs, attribute_errors(specs, handler.errors)):
+        if errors:
+            spec_status = "failed"
+        else:
+            spec_status = "deployed" if exit_code == 0 else "unknown"
+        resources.append({**spec, "status": spec_status, "errors": errors})
+        progress({"event": "resource", **resources[-1]})
+    status = "succeeded" if exit_code == 0 and not handler.errors else "failed"
+    result = {
+        "status": status,
+        "cortex_commit": cortex_commit,
+        "duration_seconds": round(time.time() - start, 1),
+        "resources": resources,
+        "errors": handler.errors,
+    }
+    progress({"event": "done", "status": status})
+    return result
 
 
-def write_json_file(project_id, location, output_filename="cortex_config.json"):
-    """Creates a JSON file with the specified project ID and location.
+def build_cortex_config(project_id, location):
+    """Builds the Cortex data mesh configuration of a project and location.
     Args:
-        project_id (str): The project ID to include in the JSON.
-        location (str):  The location to include in the JSON.
-        output_filename (str, optional): The filename of the output JSON file. Defaults to "config.json".
+        project_id (str): The project ID to include in the configuration.
+        location (str):  The location to include in the configuration.
     """
-    data = {
+    return {
         "deployDataMesh": True,
         "projectIdSource": project_id,
         "projectIdTarget": project_id,
@@ -100,32 +317,102 @@ def write_json_file(project_id, location, output_filename="cortex_config.json"):
             "processingDataset": "VERTEXDATASET"
         }
     }
+
+
+def write_json_file(project_id, location, output_filename="cortex_config.json"):
+    """Creates a JSON file with the specified project ID and location.
+    Args:
+        project_id (str): The project ID to include in the JSON.
+        location (str):  The location to include in the JSON.
+        output_filename (str, optional): The filename of the output JSON file. Defaults to "config.json".
+    """
     with open(output_filename, "w") as outfile:
-        json.dump(data, outfile, indent=4)
+        json.dump(build_cortex_config(project_id, location), outfile, indent=4)
     return output_filename
 
 
-def add_lines_to_file(filename, new_lines):
-    """Appends new lines to the end of a file, handling potential errors.
+def read_requirements(requirements_path, extra_requirements=()):
+    """Reads the requirement specifiers of a requirements file, without modifying it.
+
+    Args:
+        requirements_path (str): The path to the requirements file.
+        extra_requirements (iterable): Additional requirement specifiers.
+
+    Returns:
+        list: The requirement specifiers, with comments, options and blank lines left out.
+    """
+    with open(requirements_path, "r") as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+    requirements = [line for line in lines if line and not line.startswith("-")] + list(extra_requirements)
+    # "requests>=2.32.*" is not a valid specifier, wildcards are only allowed with ==.
+    return [requirement.replace("requests>=2.32.*", "requests==2.32.*") for requirement in requirements]
+
+
+def unsatisfied_requirements(requirements):
+    """Probes the installed distributions against requirement specifiers with importlib.metadata.
+
     Args:
-        filename (str): The path to the flat file.
-        new_lines (list): A list of strings representing the new lines to add.
+        requirements (list): The requirement specifiers.
+
+    Returns:
+        list: The specifiers that are not installed, or installed at a version outside their specifier. All of
+        them when the packaging library is not available to evaluate specifiers.
     """
     try:
-        with open(filename, 'a') as file:
-            file.write('\n')
-            for line in new_lines:
-                file.write(line + '\n')
-        print("Lines added successfully!")
-        with open(filename, 'r') as file:
-            file_content = file.read()
-            new_content = file_content.replace("requests>=2.32.*", "requests==2.32.*")
-        with open(filename, 'w') as file:
-            file.write(new_content)
-    except FileNotFoundError:
-        print(f"Error: File '{filename}' not found.")
-    except IOError:
-        print(f"Error: An I/O error occurred while working with '{filename}'.")
+        from packaging.requirements import InvalidRequirement, Requirement
+    except ImportError:
+        try:
+            from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+        except ImportError:
+            return list(requirements)
+
+    unsatisfied = []
+    for specifier in requirements:
+        try:
+            requirement = Requirement(specifier)
+        except InvalidRequirement:
+            unsatisfied.append(specifier)
+            continue
+        if requirement.marker is not None and not requirement.marker.evaluate():
+            continue
+        try:
+            version = importlib.metadata.version(requirement.name)
+        except importlib.metadata.PackageNotFoundError:
+            unsatisfied.append(specifier)
+            continue
+        if not requirement.specifier.contains(version, prereleases=True):
+            unsatisfied.append(specifier)
+    return unsatisfied
+
+
+def ensure_requirements(requirements_path=None, extra_requirements=()):
+    """Installs requirements with pip only when the installed distributions do not satisfy them.
+
+    Args:
+        requirements_path (str): The path to a requirements file, e.g. the Cortex one, None for none.
+        extra_requirements (iterable): Additional requirement specifiers.
+    """
+    if requirements_path:
+        requirements = read_requirements(requirements_path, extra_requirements)
+    else:
+        requirements = list(extra_requirements)
+    unsatisfied = unsatisfied_requirements(requirements)
+    if not unsatisfied:
+        logging.info(f"All {len(requirements)} requirements are satisfied, skipping pip install")
+        return
+    logging.info(f"Installing requirements, unsatisfied: {', '.join(unsatisfied)}")
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(requirements) + "\n")
+    try:
+        subprocess.run([sys.executable, "-m", "pip", "install", "-r", f.name], check=True)
+    finally:
+        os.remove(f.name)
+
+
+def print_progress(event):
+    """Prints the stage events of the deployment to stderr, Cortex already logs its own records."""
+    if event["event"] != "log":
+        print(json.dumps(event), file=sys.stderr)
 
 
 def main(args: collections.abc.Sequence[str]) -> int:
@@ -142,19 +429,103 @@ def main(args: collections.abc.Sequence[str]) -> int:
                         type=str,
                         required=True,
                         help="Whether to overwrite existing metadata")
+    parser.add_argument("--cortex_ref",
+                        type=str,
+                        default="main",
+                        help="Commit SHA, branch or tag of cortex-data-foundation to deploy with. A branch or tag "
+                             "is pinned to the commit it resolves to on the first checkout until it changes.")
+    parser.add_argument("--deployment_mode",
+                        type=str,
+                        choices=["cortex", "plan", "apply"],
+                        default="cortex",
+                        help="cortex redeploys every spec with Cortex data mesh. plan prints the minimal create, "
+                             "update and delete plan between the specs and the live metadata, apply also applies it.")
+    parser.add_argument("--prune",
+                        action="store_true",
+                        help="With plan or apply, also delete the live lakes, tag templates, taxonomies and data "
+                             "policies without a spec.")
+    parser.add_argument("--subprocess",
+                        action="store_true",
+                        help="Run the Cortex deployment in a separate python3 process instead of in this one.")
+    parser.add_argument("--bundle_file",
+                        type=str,
+                        default=None,
+                        help="A bundle compiled by metadata_bundle.py to deploy, the metadata specs are compiled "
+                             "before deploying otherwise.")
+    parser.add_argument("--deployed_bundle_file",
+                        type=str,
+                        default=DEPLOYED_BUNDLE_FILE,
+                        help="File recording the hash of the last successfully deployed bundle. The deployment is "
+                             "skipped when the bundle and the deployment settings did not change since.")
+    parser.add_argument("--force",
+                        action="store_true",
+                        help="Deploy even if the bundle was already deployed.")
     params = parser.parse_args(args)
     project_id = str(params.project_id)
     location = str(params.location)
     overwrite = str(params.overwrite)
 
-    run_deploy_data_mesh(
-        config_file=write_json_file(project_id, location),
-        tag_template_directories="../metadata/tag_templates",
-        policy_directories="../metadata/policy_taxonomies",
-        lake_directories="../metadata/lakes",
-        annotation_directories="../metadata/annotations",
-        overwrite=overwrite
-    )
+    if params.deployment_mode == "cortex":
+        ensure_requirements(extra_requirements=BUNDLE_REQUIREMENTS)
+    else:
+        ensure_requirements(PLANNER_REQUIREMENTS_FILE)
+    try:
+        if params.bundle_file:
+            bundle = metadata_bundle.read_bundle(str(params.bundle_file))
+        else:
+            bundle = metadata_bundle.compile_bundle(metadata_bundle.METADATA_DIRECTORIES, project_id, location)
+    except metadata_bundle.BundleValidationError as e:
+        for error in e.errors:
+            print(error, file=sys.stderr)
+        return 1
+    if (bundle["project_id"], bundle["location"]) != (project_id, location):
+        print(f"The bundle was compiled for {bundle['project_id']} in {bundle['location']}, not {project_id} in "
+              f"{location}", file=sys.stderr)
+        return 1
+    settings = {"deployment_mode": params.deployment_mode, "prune": params.prune, "overwrite": overwrite,
+                "cortex_ref": str(params.cortex_ref)}
+    deployed_bundle_file = str(params.deployed_bundle_file)
+    if (params.deployment_mode != "plan" and not params.force
+            and metadata_bundle.is_deployed(deployed_bundle_file, bundle["hash"], settings)):
+        print(json.dumps({"status": "skipped", "bundle_hash": bundle["hash"]}, indent=2))
+        return 0
+
+    if params.deployment_mode != "cortex":
+        plan, names, live = metadata_planner.plan_metadata(bundle, prune=params.prune)
+        result = {"bundle_hash": bundle["hash"], "summary": metadata_planner.summarize_plan(plan), **plan}
+        if params.deployment_mode == "plan":
+            print(json.dumps(result, indent=2))
+            return 1 if plan["conflicts"] else 0
+        result["results"] = metadata_planner.apply_plan(plan, names, live, project_id)
+        print(json.dumps(result, indent=2))
+        # As in metadata_planner.py, conflicts fail the deployment even though the rest of the plan is applied.
+        if plan["conflicts"] or any(r["status"] == "failed" for r in result["results"]):
+            return 1
+        metadata_bundle.save_deployed(deployed_bundle_file, bundle["hash"], settings)
+        return 0
+
+    # Cortex is given the rendered specs of the bundle, so it deploys exactly what was validated and hashed.
+    with tempfile.TemporaryDirectory() as rendered_directory:
+        directories, sources = metadata_bundle.write_bundle_specs(bundle, rendered_directory)
+        result = run_deploy_data_mesh(
+            config=build_cortex_config(project_id, location),
+            tag_template_directories=directories["tag_templates"],
+            policy_directories=directories["policy_taxonomies"],
+            lake_directories=directories["lakes"],
+            annotation_directories=directories["annotations"],
+            overwrite=overwrite,
+            cortex_ref=str(params.cortex_ref),
+            in_process=not params.subprocess,
+            progress=print_progress
+        )
+    for resource in result["resources"]:
+        resource["spec"] = sources.get(resource["spec"], resource["spec"])
+    result["bundle_hash"] = bundle["hash"]
+    print(json.dumps(result, indent=2))
+    if result["status"] != "succeeded":
+        return 1
+    metadata_bundle.save_deployed(deployed_bundle_file, bundle["hash"], settings)
+    return 0
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,964 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import argparse
+import collections
+import concurrent.futures
+import functools
+import json
+import re
+import sys
+import threading
+import time
+import dataplex_operations
+import metadata_bundle
+
+# Kinds in creation order: a resource is created after its parent and deleted before it.
+KINDS = ("lake", "zone", "asset", "tag_template", "taxonomy", "policy_tag", "data_policy", "annotation")
+# Kinds whose unmanaged live resources are only deleted with prune, children of managed parents always are.
+TOP_LEVEL_KINDS = ("lake", "tag_template", "taxonomy", "data_policy")
+IMMUTABLE_PROPERTIES = {
+    "zone": ("type", "location_type"),
+    "asset": ("resource_name", "resource_type"),
+    "tag_template": ("field_types",),
+}
+# The API each kind is deployed with, and the requests per second allowed to each API.
+KIND_APIS = {
+    "lake": "dataplex",
+    "zone": "dataplex",
+    "asset": "dataplex",
+    "tag_template": "datacatalog",
+    "taxonomy": "datacatalog",
+    "policy_tag": "datacatalog",
+    "data_policy": "bigquerydatapolicy",
+    "annotation": "bigquery",
+}
+API_RATE_LIMITS = {"dataplex": 2, "datacatalog": 10, "bigquerydatapolicy": 5, "bigquery": 5}
+FINE_GRAINED_READER_ROLE = "roles/datacatalog.categoryFineGrainedReader"
+MASKED_READER_ROLE = "roles/bigquerydatapolicy.maskedReader"
+TABLE_DESCRIPTIONS_QUERY = """
+SELECT table_name, option_value AS description
+FROM `{project}.{dataset}`.INFORMATION_SCHEMA.TABLE_OPTIONS
+WHERE option_name = 'description'
+"""
+COLUMN_DESCRIPTIONS_QUERY = """
+SELECT table_name, field_path, description
+FROM `{project}.{dataset}`.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def get_dataplex_client():
+    """Returns the Dataplex client, created on first use."""
+    from google.cloud import dataplex_v1
+    return dataplex_v1.DataplexServiceClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_datacatalog_client():
+    """Returns the Data Catalog client, created on first use."""
+    from google.cloud import datacatalog_v1
+    return datacatalog_v1.DataCatalogClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_policy_tag_manager_client():
+    """Returns the Data Catalog policy tag manager client, created on first use."""
+    from google.cloud import datacatalog_v1
+    return datacatalog_v1.PolicyTagManagerClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_data_policy_client():
+    """Returns the BigQuery data policy client, created on first use."""
+    from google.cloud import bigquery_datapolicies_v1
+    return bigquery_datapolicies_v1.DataPolicyServiceClient()
+
+
+@functools.lru_cache(maxsize=None)
+def get_bigquery_client(project: str):
+    """Returns the BigQuery client of a project, created on first use."""
+    from google.cloud import bigquery
+    return bigquery.Client(project=project)
+
+
+def resource_id(display_name, separator="-"):
+    """Derives a resource id from a display name: lowercase letters, digits and the separator."""
+    return re.sub(r"[^a-z0-9]+", separator, display_name.lower()).strip(separator)
+
+
+def labels_dict(labels):
+    """Normalizes a list of {name, value} labels to a dict."""
+    return {label["name"]: str(label["value"]) for label in labels or []}
+
+
+def add_resource(state, kind, key, properties, parent=None):
+    """Adds a resource to a state, keyed by "<kind>/<key>"."""
+    state[f"{kind}/{key}"] = {"kind": kind, "key": f"{kind}/{key}", "parent": parent, "properties": properties}
+
+
+def add_policy_tags(state, taxonomy_key, policy_tags, location, parent=None, path=""):
+    """Adds the policy tags of a taxonomy spec and their data policies to the desired state, recursively."""
+    for policy_tag in policy_tags or []:
+        tag_path = f"{path}/{policy_tag['display_name']}" if path else policy_tag["display_name"]
+        properties = {"display_name": policy_tag["display_name"], "description": policy_tag.get("description", "")}
+        if "unmasked_readers" in policy_tag:
+            properties["unmasked_readers"] = sorted(policy_tag["unmasked_readers"] or [])
+        tag_key = f"{taxonomy_key.split('/', 1)[1]}/{tag_path}"
+        add_resource(state, "policy_tag", tag_key, properties, parent or taxonomy_key)
+        for data_policy in policy_tag.get("data_policies") or []:
+            data_policy_properties = {"policy_tag": f"policy_tag/{tag_key}",
+                                      "masking_rule": data_policy["masking_rule"]}
+            if "masked_readers" in data_policy:
+                data_policy_properties["masked_readers"] = sorted(data_policy["masked_readers"] or [])
+            add_resource(state, "data_policy", f"{location}/{resource_id(data_policy['display_name'], '_')}",
+                         data_policy_properties, f"policy_tag/{tag_key}")
+        add_policy_tags(state, taxonomy_key, policy_tag.get("child_policy_tags"), location,
+                        f"policy_tag/{tag_key}", tag_path)
+
+
+def field_type(field):
+    """Normalizes the field_type of a tag template field spec to a primitive type name or {"enum": [...]}."""
+    value = field["field_type"]
+    if isinstance(value, dict):
+        return {"enum": list(value["enum_allowed_values"])}
+    return value
+
+
+def desired_state(bundle):
+    """Builds the desired metadata state from the lakes, tag_templates, policy_taxonomies and annotations specs of
+    a compiled bundle.
+
+    Args:
+        bundle (dict): The bundle, as returned by metadata_bundle.compile_bundle.
+
+    Returns:
+        dict: The desired resources keyed by "<kind>/<key>".
+    """
+    project_id = bundle["project_id"]
+    location = bundle["location"]
+    specs = bundle["specs"]
+    state = {}
+    for spec in specs.get("lakes", {}).values():
+        for lake in spec.get("lakes") or []:
+            lake_key = f"{lake.get('region', location)}/{resource_id(lake['display_name'])}"
+            add_resource(state, "lake", lake_key, {"display_name": lake["display_name"],
+                                                   "description": lake.get("description", ""),
+                                                   "labels": labels_dict(lake.get("labels"))})
+            for zone in lake.get("zones") or []:
+                add_resource(state, "zone", f"{lake_key}/{resource_id(zone['display_name'])}",
+                             {"display_name": zone["display_name"], "description": zone.get("description", ""),
+                              "labels": labels_dict(zone.get("labels")), "type": zone["zone_type"],
+                              "location_type": zone.get("location_type", "SINGLE_REGION")},
+                             f"lake/{lake_key}")
+    for asset in bundle.get("assets", []):
+        zone_key = f"{asset['location']}/{asset['lake']}/{asset['zone']}"
+        add_resource(state, "asset", f"{zone_key}/{asset['name']}",
+                     {"resource_name": asset["resource_name"], "resource_type": asset["resource_type"],
+                      "discovery_enabled": asset.get("discovery_enabled", True),
+                      "labels": dict(asset.get("labels") or {})},
+                     f"zone/{zone_key}")
+    for spec in specs.get("tag_templates", {}).values():
+        for template in spec.get("templates") or []:
+            fields = {resource_id(field["display_name"], "_"): field for field in template.get("fields") or []}
+            add_resource(state, "tag_template", f"{location}/{resource_id(template['display_name'], '_')}",
+                         {"display_name": template["display_name"],
+                          "fields": {field_id: field["display_name"] for field_id, field in fields.items()},
+                          "field_types": {field_id: field_type(field) for field_id, field in fields.items()}})
+    for spec in specs.get("policy_taxonomies", {}).values():
+        for taxonomy in spec.get("taxonomies") or []:
+            taxonomy_key = f"{location}/{taxonomy['display_name']}"
+            add_resource(state, "taxonomy", taxonomy_key, {"display_name": taxonomy["display_name"],
+                                                           "description": taxonomy.get("description", "")})
+            add_policy_tags(state, f"taxonomy/{taxonomy_key}", taxonomy.get("policy_tags"), location)
+    for spec in specs.get("annotations", {}).values():
+        table = f"{spec.get('project', project_id)}.{spec['dataset']}.{spec['name']}"
+        properties = {"fields": {field["name"]: field.get("description", "") for field in spec.get("fields") or []}}
+        if "description" in spec:
+            properties["description"] = spec["description"]
+        add_resource(state, "annotation", table, properties)
+    return state
+
+
+def load_desired_state(directories, project_id, location, variables=None):
+    """Compiles the metadata specs of the given directories and builds the desired metadata state from them.
+
+    Args:
+        directories (dict): The comma-separated directories of each kind of spec, as in
+            metadata_bundle.METADATA_DIRECTORIES.
+        project_id (str): The target project, the value of project_id_tgt and project_id_src.
+        location (str): The location of the Data Catalog and data policy resources.
+        variables (dict): Additional values of the Jinja placeholders.
+
+    Returns:
+        dict: The desired resources keyed by "<kind>/<key>".
+    """
+    return desired_state(metadata_bundle.compile_bundle(directories, project_id, location, variables))
+
+
+def get_iam_members(client, resource, role):
+    """Returns the sorted members of a role in the IAM policy of a Data Catalog or data policy resource."""
+    policy = client.get_iam_policy(request={"resource": resource})
+    return sorted(member for binding in policy.bindings if binding.role == role for member in binding.members)
+
+
+def fetch_live_lakes(state, names, desired, project_id, prune):
+    """Lists the live lakes of the desired regions, the zones of the managed ones and the assets of the zones
+    with desired assets or that are deleted.
+
+    Assets can be declared without their lakes and zones, whose specs are deployed separately, so the lakes of
+    their zones are listed too.
+    """
+    client = get_dataplex_client()
+    asset_zones = {resource["parent"] for resource in desired.values() if resource["kind"] == "asset"}
+    asset_lakes = {"lake/" + "/".join(zone_key.split("/")[1:3]) for zone_key in asset_zones}
+    regions = {key.split("/")[1] for key in set(desired) | asset_lakes if key.startswith("lake/")}
+    for region in sorted(regions):
+        for lake in client.list_lakes(parent=f"projects/{project_id}/locations/{region}"):
+            lake_key = f"{region}/{lake.name.split('/')[-1]}"
+            if f"lake/{lake_key}" not in desired and f"lake/{lake_key}" not in asset_lakes and not prune:
+                continue
+            add_resource(state, "lake", lake_key, {"display_name": lake.display_name,
+                                                   "description": lake.description,
+                                                   "labels": dict(lake.labels)})
+            names[f"lake/{lake_key}"] = lake.name
+            for zone in client.list_zones(parent=lake.name):
+                zone_key = f"{lake_key}/{zone.name.split('/')[-1]}"
+                add_resource(state, "zone", zone_key,
+                             {"display_name": zone.display_name, "description": zone.description,
+                              "labels": dict(zone.labels), "type": zone.type_.name,
+                              "location_type": zone.resource_spec.location_type.name},
+                             f"lake/{lake_key}")
+                names[f"zone/{zone_key}"] = zone.name
+                # The assets of an undeclared zone of a managed or pruned lake are listed to be deleted with it.
+                deleted_zone = f"zone/{zone_key}" not in desired and (f"lake/{lake_key}" in desired or prune)
+                if f"zone/{zone_key}" not in asset_zones and not deleted_zone:
+                    continue
+                for asset in client.list_assets(parent=zone.name):
+                    asset_key = f"{zone_key}/{asset.name.split('/')[-1]}"
+                    add_resource(state, "asset", asset_key,
+                                 {"resource_name": asset.resource_spec.name,
+                                  "resource_type": asset.resource_spec.type_.name,
+                                  "discovery_enabled": asset.discovery_spec.enabled, "labels": dict(asset.labels)},
+                                 f"zone/{zone_key}")
+                    names[f"asset/{asset_key}"] = asset.name
+
+
+def fetch_live_tag_templates(state, names, desired, project_id, location, prune, max_workers):
+    """Fetches the live tag templates, the desired ones and, with prune, every template of the project."""
+    from google.api_core import exceptions
+    from google.cloud import datacatalog_v1
+
+    client = get_datacatalog_client()
+    template_names = {client.tag_template_path(project_id, location, key.split("/")[-1])
+                      for key in desired if key.startswith("tag_template/")}
+    if prune:
+        scope = datacatalog_v1.SearchCatalogRequest.Scope(include_project_ids=[project_id])
+        for result in client.search_catalog(scope=scope, query="type=tag_template"):
+            if f"/locations/{location}/" in result.relative_resource_name:
+                template_names.add(result.relative_resource_name)
+
+    def get(name):
+        try:
+            return client.get_tag_template(name=name)
+        except exceptions.NotFound:
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        templates = list(executor.map(get, sorted(template_names)))
+    for template in filter(None, templates):
+        fields = dict(template.fields)
+        field_types = {}
+        for field_id, field in fields.items():
+            if field.type_.enum_type.allowed_values:
+                field_types[field_id] = {"enum": [value.display_name
+                                                  for value in field.type_.enum_type.allowed_values]}
+            else:
+                field_types[field_id] = field.type_.primitive_type.name
+        template_key = f"{location}/{template.name.split('/')[-1]}"
+        add_resource(state, "tag_template", template_key,
+                     {"display_name": template.display_name,
+                      "fields": {field_id: field.display_name for field_id, field in fields.items()},
+                      "field_types": field_types})
+        names[f"tag_template/{template_key}"] = template.name
+
+
+def fetch_live_taxonomies(state, names, desired, project_id, location, prune, max_workers):
+    """Lists the live taxonomies, the policy tags of the managed ones and their readers when they are managed."""
+    client = get_policy_tag_manager_client()
+    iam_lookups = []
+    for taxonomy in client.list_taxonomies(parent=f"projects/{project_id}/locations/{location}"):
+        taxonomy_key = f"{location}/{taxonomy.display_name}"
+        if f"taxonomy/{taxonomy_key}" not in desired and not prune:
+            continue
+        add_resource(state, "taxonomy", taxonomy_key, {"display_name": taxonomy.display_name,
+                                                       "description": taxonomy.description})
+        names[f"taxonomy/{taxonomy_key}"] = taxonomy.name
+        policy_tags = {tag.name: tag for tag in client.list_policy_tags(parent=taxonomy.name)}
+
+        def tag_path(tag):
+            parent = policy_tags.get(tag.parent_policy_tag)
+            return f"{tag_path(parent)}/{tag.display_name}" if parent else tag.display_name
+
+        for tag in policy_tags.values():
+            tag_key = f"{taxonomy_key}/{tag_path(tag)}"
+            parent = policy_tags.get(tag.parent_policy_tag)
+            add_resource(state, "policy_tag", tag_key,
+                         {"display_name": tag.display_name, "description": tag.description},
+                         f"policy_tag/{taxonomy_key}/{tag_path(parent)}" if parent else f"taxonomy/{taxonomy_key}")
+            names[f"policy_tag/{tag_key}"] = tag.name
+            if "unmasked_readers" in desired.get(f"policy_tag/{tag_key}", {}).get("properties", {}):
+                iam_lookups.append((f"policy_tag/{tag_key}", tag.name))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        readers = executor.map(lambda lookup: get_iam_members(client, lookup[1], FINE_GRAINED_READER_ROLE),
+                               iam_lookups)
+        for (key, _), members in zip(iam_lookups, readers):
+            state[key]["properties"]["unmasked_readers"] = members
+
+
+def fetch_live_data_policies(state, names, desired, project_id, location, prune, max_workers):
+    """Lists the live data policies of the location and their masked readers when they are managed."""
+    client = get_data_policy_client()
+    policy_tag_keys = {name: key for key, name in names.items() if key.startswith("policy_tag/")}
+    iam_lookups = []
+    for data_policy in client.list_data_policies(parent=f"projects/{project_id}/locations/{location}"):
+        data_policy_key = f"{location}/{data_policy.data_policy_id}"
+        if f"data_policy/{data_policy_key}" not in desired and not prune:
+            continue
+        policy_tag_key = policy_tag_keys.get(data_policy.policy_tag, data_policy.policy_tag)
+        add_resource(state, "data_policy", data_policy_key,
+                     {"policy_tag": policy_tag_key,
+                      "masking_rule": data_policy.data_masking_policy.predefined_expression.name},
+                     policy_tag_key)
+        names[f"data_policy/{data_policy_key}"] = data_policy.name
+        if "masked_readers" in desired.get(f"data_policy/{data_policy_key}", {}).get("properties", {}):
+            iam_lookups.append((f"data_policy/{data_policy_key}", data_policy.name))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        readers = executor.map(lambda lookup: get_iam_members(client, lookup[1], MASKED_READER_ROLE), iam_lookups)
+        for (key, _), members in zip(iam_lookups, readers):
+            state[key]["properties"]["masked_readers"] = members
+
+
+def fetch_live_annotations(state, desired, project_id, max_workers):
+    """Reads the live table and column descriptions of the annotated tables, with one pair of INFORMATION_SCHEMA
+    queries per dataset."""
+    tables = collections.defaultdict(set)
+    for key in desired:
+        if key.startswith("annotation/"):
+            project, dataset, table = key.split("/", 1)[1].split(".")
+            tables[(project, dataset)].add(table)
+
+    def fetch(dataset_ref):
+        project, dataset = dataset_ref
+        client = get_bigquery_client(project_id)
+        descriptions = {row.table_name: json.loads(row.description) for row in
+                        client.query(TABLE_DESCRIPTIONS_QUERY.format(project=project, dataset=dataset)).result()}
+        fields = collections.defaultdict(dict)
+        for row in client.query(COLUMN_DESCRIPTIONS_QUERY.format(project=project, dataset=dataset)).result():
+            fields[row.table_name][row.field_path] = row.description or ""
+        return descriptions, fields
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (project, dataset), (descriptions, fields) in zip(tables, executor.map(fetch, list(tables))):
+            for table in tables[(project, dataset)]:
+                if table not in fields:
+                    continue
+                add_resource(state, "annotation", f"{project}.{dataset}.{table}",
+                             {"description": descriptions.get(table, ""), "fields": fields[table]})
+
+
+def fetch_live_state(desired, project_id, location, prune=False, max_workers=8):
+    """Fetches the live state of the metadata resources with bulk list APIs.
+
+    Only the resources in scope are fetched: the desired ones and the children of the desired parents, plus
+    every lake, tag template, taxonomy and data policy of the project and location with prune. The kinds are
+    fetched concurrently.
+
+    Args:
+        desired (dict): The desired state, as returned by load_desired_state.
+        project_id (str): The target project.
+        location (str): The location of the Data Catalog and data policy resources.
+        prune (bool): Also fetch the unmanaged top-level resources, so the plan deletes them.
+        max_workers (int): Maximum number of concurrent get requests.
+
+    Returns:
+        tuple: The live resources keyed by "<kind>/<key>", and the API resource name of each of them.
+    """
+    state = {}
+    names = {}
+    kinds = {resource["kind"] for resource in desired.values()}
+
+    def fetch_policies():
+        # Data policies reference policy tags by name, so they are listed once the taxonomies are.
+        fetch_live_taxonomies(state, names, desired, project_id, location, prune, max_workers)
+        fetch_live_data_policies(state, names, desired, project_id, location, prune, max_workers)
+
+    fetches = []
+    if prune or kinds & {"lake", "zone", "asset"}:
+        fetches.append(lambda: fetch_live_lakes(state, names, desired, project_id, prune))
+    if prune or "tag_template" in kinds:
+        fetches.append(lambda: fetch_live_tag_templates(state, names, desired, project_id, location, prune,
+                                                        max_workers))
+    if prune or kinds & {"taxonomy", "policy_tag", "data_policy"}:
+        fetches.append(fetch_policies)
+    if "annotation" in kinds:
+        fetches.append(lambda: fetch_live_annotations(state, desired, project_id, max_workers))
+    # Each kind is fetched from a different API, so they are fetched concurrently.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(fetches), 1)) as executor:
+        for future in [executor.submit(fetch) for fetch in fetches]:
+            future.result()
+    return state, names
+
+
+def diff_properties(desired, live):
+    """Returns the changed properties of a resource, only the properties the desired state declares are managed.
+
+    Dict properties (fields, field types) are compared key by key for the keys the desired state declares, except
+    labels, which are compared as a whole.
+    """
+    changes = {}
+    for name, value in desired.items():
+        current = live.get(name)
+        if isinstance(value, dict) and isinstance(current, dict) and name != "labels":
+            current = {key: current.get(key) for key in value}
+        if value != current:
+            changes[name] = {"from": current, "to": value}
+    return changes
+
+
+def compute_plan(desired, live, prune=False):
+    """Computes the minimal create, update and delete plan from the live to the desired metadata state.
+
+    Resources are deleted when they are live but not desired and either their parent is managed or, with prune,
+    they are top-level. The children of a deleted resource are deleted with it. Changes to immutable properties
+    cannot be applied in place and are reported as conflicts.
+
+    Args:
+        desired (dict): The desired state, as returned by load_desired_state.
+        live (dict): The live state, as returned by fetch_live_state.
+        prune (bool): Delete the live top-level resources that are not desired.
+
+    Returns:
+        dict: The ordered "steps" to apply, each with its action, kind, key, parent and changes, and the
+        "conflicts".
+    """
+    steps = []
+    conflicts = []
+    for key, resource in desired.items():
+        if key not in live:
+            steps.append({"action": "create", "kind": resource["kind"], "key": key, "parent": resource["parent"],
+                          "properties": resource["properties"]})
+            continue
+        changes = diff_properties(resource["properties"], live[key]["properties"])
+        immutable = [name for name in IMMUTABLE_PROPERTIES.get(resource["kind"], ()) if name in changes]
+        if resource["kind"] == "tag_template" and immutable:
+            # New fields can be added, only existing fields cannot change type.
+            live_types = live[key]["properties"]["field_types"]
+            if all(live_types.get(field_id, field) == field
+                   for field_id, field in resource["properties"]["field_types"].items()):
+                immutable = []
+        if immutable:
+            conflicts.append({"kind": resource["kind"], "key": key,
+                              "changes": {name: changes[name] for name in immutable}})
+            continue
+        if changes:
+            steps.append({"action": "update", "kind": resource["kind"], "key": key, "parent": resource["parent"],
+                          "properties": resource["properties"], "changes": changes})
+    deleted = set()
+    order = {kind: index for index, kind in enumerate(KINDS)}
+    # Parents are visited first, so the children of a deleted resource are deleted with it.
+    for key, resource in sorted(live.items(), key=lambda item: (order[item[1]["kind"]], item[0])):
+        if key in desired or resource["kind"] == "annotation":
+            continue
+        parent_deleted = resource["parent"] in deleted
+        # Assets may also be registered by Terraform, so undeclared ones are only deleted with prune or their zone.
+        if resource["kind"] == "asset" and not prune and not parent_deleted:
+            continue
+        if (resource["parent"] in desired or parent_deleted
+                or (prune and resource["kind"] in TOP_LEVEL_KINDS)):
+            deleted.add(key)
+            steps.append({"action": "delete", "kind": resource["kind"], "key": key, "parent": resource["parent"]})
+
+    # Creates and updates go parents first, deletes children first.
+    steps.sort(key=lambda step: (1, -order[step["kind"]], -step["key"].count("/"), step["key"])
+               if step["action"] == "delete" else (0, order[step["kind"]], step["key"].count("/"), step["key"]))
+    return {"steps": steps, "conflicts": conflicts}
+
+
+def set_iam_members(client, resource, role, members):
+    """Sets the members of a role in the IAM policy of a Data Catalog or data policy resource."""
+    policy = client.get_iam_policy(request={"resource": resource})
+    bindings = [binding for binding in policy.bindings if binding.role != role]
+    policy.ClearField("bindings")
+    policy.bindings.extend(bindings)
+    if members:
+        policy.bindings.add(role=role, members=members)
+    client.set_iam_policy(request={"resource": resource, "policy": policy})
+
+
+def start_dataplex_operation(step, names, project_id):
+    """Starts the long-running operation of a lake, zone or asset step without waiting for it.
+
+    Returns:
+        google.api_core.operation.Operation: The operation, its result is the created or updated resource.
+    """
+    from google.cloud import dataplex_v1
+    from google.protobuf import field_mask_pb2
+
+    client = get_dataplex_client()
+    properties = step.get("properties", {})
+    if step["action"] == "delete":
+        delete = {"lake": client.delete_lake, "zone": client.delete_zone, "asset": client.delete_asset}[step["kind"]]
+        return delete(name=names[step["key"]])
+    if step["action"] == "update":
+        update_mask = field_mask_pb2.FieldMask(paths=[{"discovery_enabled": "discovery_spec.enabled"}.get(name, name)
+                                                      for name in step["changes"]])
+    if step["kind"] == "lake":
+        lake = dataplex_v1.Lake(display_name=properties["display_name"], description=properties["description"],
+                                labels=properties["labels"])
+        if step["action"] == "create":
+            region, lake_id = step["key"].split("/")[1:]
+            return client.create_lake(parent=f"projects/{project_id}/locations/{region}", lake_id=lake_id, lake=lake)
+        lake.name = names[step["key"]]
+        return client.update_lake(lake=lake, update_mask=update_mask)
+    if step["kind"] == "asset":
+        asset = dataplex_v1.Asset(discovery_spec=dataplex_v1.Asset.DiscoverySpec(
+                                      enabled=properties["discovery_enabled"]),
+                                  labels=properties["labels"])
+        if step["action"] == "create":
+            asset.resource_spec = dataplex_v1.Asset.ResourceSpec(
+                name=properties["resource_name"],
+                type_=dataplex_v1.Asset.ResourceSpec.Type[properties["resource_type"]])
+            return client.create_asset(parent=names[step["parent"]], asset_id=step["key"].split("/")[-1],
+                                       asset=asset)
+        asset.name = names[step["key"]]
+        return client.update_asset(asset=asset, update_mask=update_mask)
+    zone = dataplex_v1.Zone(display_name=properties["display_name"], description=properties["description"],
+                            labels=properties["labels"])
+    if step["action"] == "create":
+        zone.type_ = dataplex_v1.Zone.Type[properties["type"]]
+        zone.resource_spec = dataplex_v1.Zone.ResourceSpec(
+            location_type=dataplex_v1.Zone.ResourceSpec.LocationType[properties["location_type"]])
+        zone.discovery_spec = dataplex_v1.Zone.DiscoverySpec(enabled=True)
+        return client.create_zone(parent=names[step["parent"]], zone_id=step["key"].split("/")[-1], zone=zone)
+    zone.name = names[step["key"]]
+    return client.update_zone(zone=zone, update_mask=update_mask)
+
+
+def record_dataplex_result(step, names, result):
+    """Records the API resource name of a created lake, zone or asset, its children are created under it."""
+    if step["action"] == "create":
+        names[step["key"]] = result.name
+
+
+def apply_lake_step(step, names, project_id):
+    """Applies a lake, zone or asset step, waiting for its long-running operation."""
+    result = start_dataplex_operation(step, names, project_id).result()
+    record_dataplex_result(step, names, result)
+    return result
+
+
+def tag_template_field(display_name, field_type_spec):
+    """Builds a Data Catalog tag template field from its normalized display name and type."""
+    from google.cloud import datacatalog_v1
+
+    field = datacatalog_v1.TagTemplateField(display_name=display_name)
+    if isinstance(field_type_spec, dict):
+        field.type_.enum_type.allowed_values.extend(
+            datacatalog_v1.FieldType.EnumType.EnumValue(display_name=value) for value in field_type_spec["enum"])
+    else:
+        field.type_.primitive_type = datacatalog_v1.FieldType.PrimitiveType[field_type_spec]
+    return field
+
+
+def apply_tag_template_step(step, names, live, project_id):
+    """Applies a tag template step, changing only the fields that differ on update."""
+    from google.cloud import datacatalog_v1
+    from google.protobuf import field_mask_pb2
+
+    client = get_datacatalog_client()
+    if step["action"] == "delete":
+        return client.delete_tag_template(name=names[step["key"]], force=True)
+    properties = step["properties"]
+    if step["action"] == "create":
+        location, template_id = step["key"].split("/")[1:]
+        template = datacatalog_v1.TagTemplate(display_name=properties["display_name"], fields={
+            field_id: tag_template_field(display_name, properties["field_types"][field_id])
+            for field_id, display_name in properties["fields"].items()})
+        result = client.create_tag_template(parent=f"projects/{project_id}/locations/{location}",
+                                            tag_template_id=template_id, tag_template=template)
+        names[step["key"]] = result.name
+        return result
+    name = names[step["key"]]
+    live_fields = live[step["key"]]["properties"]["fields"]
+    if "display_name" in step["changes"]:
+        client.update_tag_template(tag_template=datacatalog_v1.TagTemplate(name=name,
+                                                                           display_name=properties["display_name"]),
+                                   update_mask=field_mask_pb2.FieldMask(paths=["display_name"]))
+    for field_id, display_name in properties["fields"].items():
+        field = tag_template_field(display_name, properties["field_types"][field_id])
+        if field_id not in live_fields:
+            client.create_tag_template_field(parent=name, tag_template_field_id=field_id, tag_template_field=field)
+        elif live_fields[field_id] != display_name:
+            client.update_tag_template_field(name=f"{name}/fields/{field_id}", tag_template_field=field,
+                                             update_mask=field_mask_pb2.FieldMask(paths=["display_name"]))
+    return name
+
+
+def apply_policy_step(step, names, project_id):
+    """Applies a taxonomy, policy tag or data policy step, including the readers of its IAM policy."""
+    from google.cloud import bigquery_datapolicies_v1
+    from google.cloud import datacatalog_v1
+    from google.protobuf import field_mask_pb2
+
+    properties = step.get("properties", {})
+    changes = step.get("changes", properties)
+    if step["kind"] == "data_policy":
+        client = get_data_policy_client()
+        if step["action"] == "delete":
+            return client.delete_data_policy(name=names[step["key"]])
+        location, data_policy_id = step["key"].split("/")[1:]
+        data_policy = bigquery_datapolicies_v1.DataPolicy(
+            policy_tag=names[properties["policy_tag"]],
+            data_policy_type=bigquery_datapolicies_v1.DataPolicy.DataPolicyType.DATA_MASKING_POLICY,
+            data_masking_policy=bigquery_datapolicies_v1.DataMaskingPolicy(
+                predefined_expression=bigquery_datapolicies_v1.DataMaskingPolicy.PredefinedExpression[
+                    properties["masking_rule"]]))
+        if step["action"] == "create":
+            data_policy.data_policy_id = data_policy_id
+            names[step["key"]] = client.create_data_policy(parent=f"projects/{project_id}/locations/{location}",
+                                                           data_policy=data_policy).name
+        elif "masking_rule" in changes:
+            data_policy.name = names[step["key"]]
+            client.update_data_policy(data_policy=data_policy,
+                                      update_mask=field_mask_pb2.FieldMask(paths=["data_masking_policy"]))
+        if "masked_readers" in changes:
+            set_iam_members(client, names[step["key"]], MASKED_READER_ROLE, properties["masked_readers"])
+        return names[step["key"]]
+
+    client = get_policy_tag_manager_client()
+    if step["action"] == "delete":
+        delete = client.delete_taxonomy if step["kind"] == "taxonomy" else client.delete_policy_tag
+        return delete(name=names[step["key"]])
+    mask = field_mask_pb2.FieldMask(paths=[name for name in ("display_name", "description") if name in changes])
+    if step["kind"] == "taxonomy":
+        taxonomy = datacatalog_v1.Taxonomy(
+            display_name=properties["display_name"], description=properties["description"],
+            activated_policy_types=[datacatalog_v1.Taxonomy.PolicyType.FINE_GRAINED_ACCESS_CONTROL])
+        if step["action"] == "create":
+            location = step["key"].split("/")[1]
+            names[step["key"]] = client.create_taxonomy(parent=f"projects/{project_id}/locations/{location}",
+                                                        taxonomy=taxonomy).name
+        elif mask.paths:
+            taxonomy.name = names[step["key"]]
+            client.update_taxonomy(taxonomy=taxonomy, update_mask=mask)
+        return names[step["key"]]
+    policy_tag = datacatalog_v1.PolicyTag(display_name=properties["display_name"],
+                                          description=properties["description"])
+    if step["action"] == "create":
+        taxonomy_key = "taxonomy/" + "/".join(step["key"].split("/")[1:3])
+        if step["parent"] != taxonomy_key:
+            policy_tag.parent_policy_tag = names[step["parent"]]
+        names[step["key"]] = client.create_policy_tag(parent=names[taxonomy_key], policy_tag=policy_tag).name
+    elif mask.paths:
+        policy_tag.name = names[step["key"]]
+        client.update_policy_tag(policy_tag=policy_tag, update_mask=mask)
+    if "unmasked_readers" in changes:
+        set_iam_members(client, names[step["key"]], FINE_GRAINED_READER_ROLE, properties["unmasked_readers"])
+    return names[step["key"]]
+
+
+def apply_annotation_step(step, project_id):
+    """Applies the table and column descriptions of an annotation step in a single table update."""
+    from google.cloud import bigquery
+
+    client = get_bigquery_client(project_id)
+    properties = step["properties"]
+    changes = step.get("changes", properties)
+    table = client.get_table(step["key"].split("/", 1)[1])
+    fields_to_update = []
+    if "description" in changes:
+        table.description = properties["description"]
+        fields_to_update.append("description")
+    if "fields" in changes:
+        descriptions = properties["fields"]
+
+        def describe(fields, prefix=""):
+            # Every other property of the column, such as its maxLength or defaultValueExpression, is kept as is.
+            described = []
+            for field in fields:
+                resource = field.to_api_repr()
+                resource["description"] = descriptions.get(f"{prefix}{field.name}", field.description)
+                if field.fields:
+                    resource["fields"] = [nested.to_api_repr()
+                                          for nested in describe(field.fields, f"{prefix}{field.name}.")]
+                described.append(bigquery.SchemaField.from_api_repr(resource))
+            return described
+
+        table.schema = describe(table.schema)
+        fields_to_update.append("schema")
+    return client.update_table(table, fields_to_update)
+
+
+def apply_step(step, names, live, project_id):
+    """Applies a single plan step with the API of its kind."""
+    if KIND_APIS[step["kind"]] == "dataplex":
+        return apply_lake_step(step, names, project_id)
+    if step["kind"] == "tag_template":
+        return apply_tag_template_step(step, names, live, project_id)
+    if step["kind"] in ("taxonomy", "policy_tag", "data_policy"):
+        return apply_policy_step(step, names, project_id)
+    return apply_annotation_step(step, project_id)
+
+
+class RateLimiter:
+    """Spaces the requests sent to an API so they stay under a number of requests per second."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Waits for the next slot of the API."""
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def plan_dependencies(steps):
+    """Computes the steps each step of a plan waits for.
+
+    A created or updated resource waits for the creation or update of its parent, and annotations wait for the
+    tag templates, taxonomies and policy tags they can reference. A deleted resource waits for the deletion of
+    its children. Lakes, tag templates and taxonomies are otherwise independent.
+
+    Args:
+        steps (list): The steps of a plan.
+
+    Returns:
+        list: The indexes of the steps each step depends on.
+    """
+    index = {(step["action"] == "delete", step["key"]): i for i, step in enumerate(steps)}
+    catalog_steps = {i for i, step in enumerate(steps)
+                     if step["action"] != "delete" and step["kind"] in ("tag_template", "taxonomy", "policy_tag")}
+    dependencies = [set() for _ in steps]
+    for i, step in enumerate(steps):
+        if step["action"] == "delete":
+            if step["parent"] and (True, step["parent"]) in index:
+                dependencies[index[(True, step["parent"])]].add(i)
+            continue
+        if step["parent"] and (False, step["parent"]) in index:
+            dependencies[i].add(index[(False, step["parent"])])
+        if step["kind"] == "annotation":
+            dependencies[i].update(catalog_steps)
+    return dependencies
+
+
+def apply_plan(plan, names, live, project_id, max_workers=8, rate_limits=None):
+    """Applies the steps of a plan as a dependency graph, running independent steps concurrently.
+
+    A step starts as soon as the steps it depends on are applied, with at most max_workers steps in flight and
+    the requests of each API spaced by its rate limit. The steps depending on a failed step are skipped. Lake,
+    zone and asset steps are long-running operations: they are started as soon as their parents exist and
+    polled together by a dataplex_operations.OperationManager, instead of holding a worker each.
+
+    Args:
+        plan (dict): The plan, as returned by compute_plan.
+        names (dict): The API resource name of each live resource, completed as resources are created.
+        live (dict): The live state the plan was computed from.
+        project_id (str): The target project.
+        max_workers (int): Maximum number of steps applied at the same time.
+        rate_limits (dict): The requests per second of each API, API_RATE_LIMITS by default.
+
+    Returns:
+        list: The steps in plan order, each with its status (applied, failed or skipped), duration and error,
+        and the name of the operation of the Dataplex steps.
+    """
+    steps = plan["steps"]
+    limiters = {api: RateLimiter(rate) for api, rate in {**API_RATE_LIMITS, **(rate_limits or {})}.items()}
+    dependencies = plan_dependencies(steps)
+    dependents = [set() for _ in steps]
+    for i, step_dependencies in enumerate(dependencies):
+        for dependency in step_dependencies:
+            dependents[dependency].add(i)
+    results = [None] * len(steps)
+    # Dataplex steps only depend on each other, see plan_dependencies.
+    operation_steps = {i for i, step in enumerate(steps) if KIND_APIS[step["kind"]] == "dataplex"}
+
+    def start_operation(step):
+        limiters["dataplex"].acquire()
+        logging.info(f"{step['action']} {step['key']}")
+        return start_dataplex_operation(step, names, project_id)
+
+    def run_operations():
+        manager = dataplex_operations.OperationManager(max_concurrent_polls=max_workers)
+        for i in sorted(operation_steps):
+            manager.add(steps[i]["key"], functools.partial(start_operation, steps[i]),
+                        [steps[dependency]["key"] for dependency in dependencies[i]],
+                        functools.partial(record_dataplex_result, steps[i], names))
+        outcomes = manager.run()
+        for i in sorted(operation_steps):
+            outcome = outcomes[steps[i]["key"]]
+            results[i] = {"action": steps[i]["action"], "key": steps[i]["key"],
+                          "status": "applied" if outcome["status"] == "succeeded" else outcome["status"]}
+            if "operation" in outcome:
+                results[i]["operation"] = outcome["operation"]
+            if "latency_seconds" in outcome:
+                results[i]["duration_seconds"] = outcome["latency_seconds"]
+            if "error" in outcome:
+                results[i]["error"] = outcome["error"]
+
+    def run(i):
+        step = steps[i]
+        limiters[KIND_APIS[step["kind"]]].acquire()
+        logging.info(f"{step['action']} {step['key']}")
+        start = time.time()
+        apply_step(step, names, live, project_id)
+        return time.time() - start
+
+    def skip(i, cause):
+        for dependent in dependents[i]:
+            if results[dependent] is None:
+                results[dependent] = {"action": steps[dependent]["action"], "key": steps[dependent]["key"],
+                                      "status": "skipped", "error": f"{cause} failed"}
+                skip(dependent, cause)
+
+    remaining = [len(step_dependencies) for step_dependencies in dependencies]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as operations_executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        operations = operations_executor.submit(run_operations) if operation_steps else None
+        running = {executor.submit(run, i): i for i, count in enumerate(remaining)
+                   if count == 0 and i not in operation_steps}
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                step = steps[i]
+                try:
+                    duration = future.result()
+                except Exception as e:
+                    logging.error(f"Error applying {step['action']} {step['key']}: {e}")
+                    results[i] = {"action": step["action"], "key": step["key"], "status": "failed", "error": str(e)}
+                    skip(i, step["key"])
+                    continue
+                results[i] = {"action": step["action"], "key": step["key"], "status": "applied",
+                              "duration_seconds": round(duration, 1)}
+                for dependent in dependents[i]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0 and results[dependent] is None:
+                        running[executor.submit(run, dependent)] = dependent
+        if operations:
+            operations.result()
+    return results
+
+
+def plan_metadata(bundle, prune=False, max_workers=8):
+    """Builds the desired metadata state of a compiled bundle, fetches the live one and computes the plan between
+    them.
+
+    Returns:
+        tuple: The plan, the API resource names of the live resources and the live state.
+    """
+    project_id = bundle["project_id"]
+    location = bundle["location"]
+    desired = desired_state(bundle)
+    live, names = fetch_live_state(desired, project_id, location, prune=prune, max_workers=max_workers)
+    return compute_plan(desired, live, prune=prune), names, live
+
+
+def summarize_plan(plan):
+    """Counts the steps of a plan by action."""
+    counts = collections.Counter(step["action"] for step in plan["steps"])
+    return {action: counts.get(action, 0) for action in ("create", "update", "delete")}
+
+
+def main(args: collections.abc.Sequence[str]) -> int:
+    """Plans, and optionally applies, the minimal changes that bring the live metadata to the metadata specs.
+    To run the script, provide the required command-line arguments:
+        python metadata_planner.py --project_id your_project_id --location your_location --apply
+    """
+    parser = argparse.ArgumentParser(description="Dataplex and Data Catalog metadata plan engine")
+    parser.add_argument("--project_id",
+                        type=str,
+                        required=True,
+                        help="Project where metadata (lakes, zones, tags, etc.) is deployed.")
+    parser.add_argument("--location",
+                        type=str,
+                        required=True,
+                        help="Location of the tag templates, taxonomies and data policies.")
+    for kind, directory in metadata_bundle.METADATA_DIRECTORIES.items():
+        parser.add_argument(f"--{kind}_directories",
+                            type=str,
+                            default=directory,
+                            help=f"Comma-separated directories of the {kind} specs.")
+    parser.add_argument("--bundle_file",
+                        type=str,
+                        default=None,
+                        help="A bundle compiled by metadata_bundle.py to plan from, instead of compiling the spec "
+                             "directories.")
+    parser.add_argument("--assets",
+                        type=str,
+                        default=None,
+                        help="JSON list of the Dataplex assets to register in the zones, each with its name, "
+                             "location, lake, zone, resource_name, resource_type, discovery_enabled and labels.")
+    parser.add_argument("--prune",
+                        action="store_true",
+                        help="Also delete the live lakes, tag templates, taxonomies and data policies without a spec.")
+    parser.add_argument("--apply",
+                        action="store_true",
+                        help="Apply the plan, it is only printed otherwise.")
+    parser.add_argument("--max_workers",
+                        type=int,
+                        default=8,
+                        help="Maximum number of concurrent API requests while fetching the live state, and of plan "
+                             "steps applied at the same time.")
+    parser.add_argument("--api_rate_limits",
+                        type=str,
+                        default=None,
+                        help="JSON map of API (dataplex, datacatalog, bigquerydatapolicy, bigquery) to the requests "
+                             "per second it is allowed, overriding the defaults.")
+    params = parser.parse_args(args)
+
+    if params.bundle_file:
+        bundle = metadata_bundle.read_bundle(str(params.bundle_file))
+    else:
+        directories = {kind: str(getattr(params, f"{kind}_directories"))
+                       for kind in metadata_bundle.METADATA_DIRECTORIES}
+        try:
+            bundle = metadata_bundle.compile_bundle(directories, str(params.project_id), str(params.location),
+                                                    assets=json.loads(params.assets) if params.assets else None)
+        except metadata_bundle.BundleValidationError as e:
+            for error in e.errors:
+                print(error, file=sys.stderr)
+            return 1
+    plan, names, live = plan_metadata(bundle, prune=params.prune, max_workers=int(params.max_workers))
+    output = {"summary": summarize_plan(plan), **plan}
+    if params.apply:
+        rate_limits = json.loads(params.api_rate_limits) if params.api_rate_limits else None
+        output["results"] = apply_plan(plan, names, live, bundle["project_id"], max_workers=int(params.max_workers),
+                                       rate_limits=rate_limits)
+    print(json.dumps(output, indent=2))
+    failed = any(result["status"] == "failed" for result in output.get("results", []))
+    return 1 if failed or plan["conflicts"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,373 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import argparse
+import collections
+import concurrent.futures
+import fcntl
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+INDEX_CACHE_VERSION = 2
+INDEX_CACHE_MAX_ENTRIES = 20000
+PARALLEL_THRESHOLD = 32
+JS_BLOCK_KEYWORDS = ("config", "js", "pre_operations", "post_operations")
+CONFIG_STRING_FIELDS = ("name", "type", "schema", "database")
+
+_JS_BLOCK_PATTERN = re.compile(r"(%s)\s*{" % "|".join(JS_BLOCK_KEYWORDS))
+_CONFIG_STRING_PATTERN = re.compile(r"\b(%s)\s*:\s*([\"'`])(.*?)\2" % "|".join(CONFIG_STRING_FIELDS), re.DOTALL)
+_CONFIG_TAGS_PATTERN = re.compile(r"\btags\s*:\s*(\[.*?\]|([\"'`]).*?\2)", re.DOTALL)
+_STRING_LITERAL_PATTERN = re.compile(r"([\"'`])(.*?)\1", re.DOTALL)
+_REF_PATTERN = re.compile(r"\bref\(\s*([^)]*)\)")
+_REF_OBJECT_NAME_PATTERN = re.compile(r"\bname\s*:\s*([\"'`])(.*?)\1")
+# Serializes the cache updates of the threads of this process, a file lock serializes those of other processes.
+_index_cache_lock = threading.Lock()
+
+
+def _skip_string(content, i):
+    """Returns the index right after the JS string literal starting at content[i]."""
+    quote = content[i]
+    i += 1
+    while i < len(content):
+        if content[i] == "\\":
+            i += 2
+            continue
+        if content[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def _match_braces(content, start):
+    """Finds the end of the JS block whose opening brace is at content[start].
+
+    Strings and comments inside the block are skipped, so braces within them do not affect nesting.
+
+    Returns:
+        tuple: The index right after the closing brace, the block text with anything nested deeper than the
+        first level blanked out, and the start index of every // comment in the block.
+    """
+    depth = 0
+    i = start
+    top_level = []
+    comments = []
+    while i < len(content):
+        c = content[i]
+        if content.startswith("//", i):
+            comments.append(i)
+            end = content.find("\n", i)
+            i = len(content) if end == -1 else end
+            continue
+        if content.startswith("/*", i):
+            end = content.find("*/", i + 2)
+            i = len(content) if end == -1 else end + 2
+            continue
+        if c in "\"'`":
+            end = _skip_string(content, i)
+            if depth == 1:
+                top_level.append(content[i:end])
+            i = end
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1, "".join(top_level), comments
+        elif depth == 1:
+            top_level.append(c)
+        i += 1
+    return i, "".join(top_level), comments
+
+
+def _collect_iam_metadata(lines, line_index, first_line):
+    """Collects a commented //iam_metadata JSON block that may span several comment lines.
+
+    Returns:
+        tuple: The index of the last line consumed and the decoded metadata, or None if it is not valid JSON.
+    """
+    block = [first_line]
+    depth = first_line.count("{") - first_line.count("}")
+    while depth > 0 and line_index + 1 < len(lines):
+        line_index += 1
+        line = lines[line_index].strip()
+        if line.startswith("//"):
+            line = line[2:]
+        block.append(line)
+        depth += line.count("{") - line.count("}")
+    try:
+        return line_index, json.loads("\n".join(block))
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding iam metadata JSON from .sqlx file: {e}")
+        return line_index, None
+
+
+def _parse_config_block(top_level):
+    """Extracts the name, type, schema, database and tags from the first level of a config block."""
+    config = {field: None for field in CONFIG_STRING_FIELDS}
+    for match in _CONFIG_STRING_PATTERN.finditer(top_level):
+        if config[match.group(1)] is None:
+            config[match.group(1)] = match.group(3)
+    tags_match = _CONFIG_TAGS_PATTERN.search(top_level)
+    config["tags"] = [m.group(2) for m in _STRING_LITERAL_PATTERN.finditer(tags_match.group(1))] if tags_match else []
+    return config
+
+
+def _parse_refs(expression):
+    """Extracts the names of the actions referenced with ref() in a ${...} expression."""
+    refs = []
+    for match in _REF_PATTERN.finditer(expression):
+        arguments = match.group(1)
+        object_name = _REF_OBJECT_NAME_PATTERN.search(arguments)
+        if object_name:
+            refs.append(object_name.group(2))
+            continue
+        names = [m.group(2) for m in _STRING_LITERAL_PATTERN.finditer(arguments)]
+        if names:
+            refs.append(".".join(names))
+    return refs
+
+
+def parse_sqlx(content):
+    """Parses a Dataform SQLX file in a single pass.
+
+    The content is scanned once: JS blocks (config, js, pre_operations, post_operations) and ${...} expressions are
+    brace-matched, //iam_metadata comments are decoded wherever they are, including inside those blocks, and
+    everything else is treated as SQL.
+
+    Args:
+        content (str): The content of the .sqlx file.
+
+    Returns:
+        dict: The config name, type, schema, database and tags, the decoded iam_metadata (or None) and the list of
+        ${ref()} dependencies.
+    """
+    entry = _parse_config_block("")
+    entry["iam_metadata"] = None
+    entry["refs"] = []
+
+    lines = content.split("\n")
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+
+    def read_comment(start, line_index):
+        # Decodes the //iam_metadata comment starting at content[start], returns the last line it spans.
+        while offsets[line_index + 1] <= start:
+            line_index += 1
+        comment = content[start + 2:offsets[line_index + 1] - 1].strip()
+        if comment.startswith("iam_metadata:") and entry["iam_metadata"] is None:
+            line_index, entry["iam_metadata"] = _collect_iam_metadata(lines, line_index,
+                                                                      comment[len("iam_metadata:"):])
+        return line_index
+
+    i = 0
+    line_index = 0
+    while i < len(content):
+        while offsets[line_index + 1] <= i:
+            line_index += 1
+        if content.startswith("//", i):
+            line_index = read_comment(i, line_index)
+            i = offsets[line_index + 1]
+            continue
+        if content.startswith("/*", i):
+            end = content.find("*/", i + 2)
+            i = len(content) if end == -1 else end + 2
+            continue
+        if content.startswith("${", i):
+            end, _, comments = _match_braces(content, i + 1)
+            for comment in comments:
+                line_index = read_comment(comment, line_index)
+            entry["refs"].extend(_parse_refs(content[i:end]))
+            i = end
+            continue
+        block = _JS_BLOCK_PATTERN.match(content, i) if content[i] in "cjp" else None
+        if block and (i == 0 or not (content[i - 1].isalnum() or content[i - 1] == "_")):
+            end, top_level, comments = _match_braces(content, block.end() - 1)
+            for comment in comments:
+                line_index = read_comment(comment, line_index)
+            if block.group(1) == "config" and entry["name"] is None:
+                entry.update(_parse_config_block(top_level))
+            for expression in re.findall(r"\bref\([^)]*\)", content[block.end():end]):
+                entry["refs"].extend(_parse_refs(expression))
+            i = end
+            continue
+        i += 1
+
+    entry["refs"] = list(dict.fromkeys(entry["refs"]))
+    return entry
+
+
+def content_hash(content):
+    """Returns the sha256 hex digest used to key a SQLX file in the index cache."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _read_index_cache(cache_file):
+    """Reads the persisted SQLX index cache, with the last time each entry was used."""
+    if not cache_file or not os.path.exists(cache_file):
+        return {"entries": {}, "used_at": {}}
+    try:
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        logging.warning(f"Could not read SQLX index cache {cache_file}, rebuilding it.")
+        return {"entries": {}, "used_at": {}}
+    if cache.get("version") != INDEX_CACHE_VERSION:
+        return {"entries": {}, "used_at": {}}
+    return cache
+
+
+def load_index_cache(cache_file):
+    """Loads the persisted SQLX index cache.
+
+    Args:
+        cache_file (str): Path to the JSON cache file.
+
+    Returns:
+        dict: Parsed entries keyed by content hash.
+    """
+    return _read_index_cache(cache_file)["entries"]
+
+
+def save_index_cache(cache_file, entries):
+    """Merges entries into the persisted SQLX index cache.
+
+    The entries are added to the ones already on disk, so concurrent callers indexing different repositories
+    keep each other's entries, and are marked as used now. Only the INDEX_CACHE_MAX_ENTRIES most recently used
+    entries are kept.
+
+    Args:
+        cache_file (str): Path to the JSON cache file.
+        entries (dict): The parsed entries used by the caller, keyed by content hash.
+    """
+    if not cache_file:
+        return
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    with _index_cache_lock, open(f"{cache_file}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = _read_index_cache(cache_file)
+        now = time.time()
+        cache["entries"].update(entries)
+        cache["used_at"].update(dict.fromkeys(entries, now))
+        kept = sorted(cache["entries"], key=lambda digest: cache["used_at"].get(digest, 0),
+                      reverse=True)[:INDEX_CACHE_MAX_ENTRIES]
+        fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": INDEX_CACHE_VERSION,
+                       "entries": {digest: cache["entries"][digest] for digest in kept},
+                       "used_at": {digest: cache["used_at"].get(digest, now) for digest in kept}}, f)
+        os.replace(tmp_file, cache_file)
+
+
+def index_sqlx_contents(contents, cache_file=None, max_workers=None):
+    """Indexes SQLX files given their content, parsing only the files missing from the cache.
+
+    Uncached files are parsed in parallel worker processes when there are enough of them to pay off the pool
+    startup, and inline otherwise. The workers are spawned rather than forked, since callers may index from
+    several threads and forking a multi-threaded process can deadlock.
+
+    Args:
+        contents (dict): The content of each .sqlx file, keyed by path.
+        cache_file (str): Path to the JSON index cache, no cache is used when empty.
+        max_workers (int): Maximum number of worker processes.
+
+    Returns:
+        dict: The parsed entry of each file, keyed by path.
+    """
+    cache = load_index_cache(cache_file)
+    hashes = {path: content_hash(content) for path, content in contents.items()}
+    pending = {}
+    for path, digest in hashes.items():
+        if digest not in cache and digest not in pending:
+            pending[digest] = contents[path]
+
+    if pending:
+        logging.info(f"Parsing {len(pending)} of {len(contents)} SQLX files, the rest are cached.")
+        if len(pending) < PARALLEL_THRESHOLD:
+            parsed = map(parse_sqlx, pending.values())
+            cache.update(zip(pending.keys(), parsed))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                        mp_context=multiprocessing.get_context("spawn")) as executor:
+                parsed = executor.map(parse_sqlx, pending.values(), chunksize=16)
+                cache.update(zip(pending.keys(), parsed))
+        save_index_cache(cache_file, {digest: cache[digest] for digest in set(hashes.values())})
+
+    return {path: cache[digest] for path, digest in hashes.items()}
+
+
+def find_sqlx_files(root):
+    """Lists the .sqlx files under a directory.
+
+    Args:
+        root (str): The directory to walk.
+
+    Returns:
+        list: The paths of the .sqlx files, sorted.
+    """
+    paths = []
+    for dir_path, _, file_names in os.walk(root):
+        paths.extend(os.path.join(dir_path, name) for name in file_names if name.endswith(".sqlx"))
+    return sorted(paths)
+
+
+def index_sqlx_files(paths, cache_file=None, max_workers=None):
+    """Indexes SQLX files on disk.
+
+    Args:
+        paths (list): The paths of the .sqlx files.
+        cache_file (str): Path to the JSON index cache, no cache is used when empty.
+        max_workers (int): Maximum number of worker processes.
+
+    Returns:
+        dict: The parsed entry of each file, keyed by path.
+    """
+    contents = {}
+    for path in paths:
+        with open(path, "r") as f:
+            contents[path] = f.read()
+    return index_sqlx_contents(contents, cache_file=cache_file, max_workers=max_workers)
+
+
+def main(args: collections.abc.Sequence[str]) -> int:
+    """Indexes the .sqlx files of a local Dataform repository and prints the index as JSON.
+    To run the script, provide the required command-line arguments:
+        python sqlx_indexer.py --root path/to/dataform/repo --cache_file sqlx_index_cache.json
+    """
+    parser = argparse.ArgumentParser(description="Dataform SQLX repository indexer")
+    parser.add_argument("--root",
+                        type=str,
+                        required=True,
+                        help="The local directory of the Dataform repository.")
+    parser.add_argument("--cache_file",
+                        type=str,
+                        default="sqlx_index_cache.json",
+                        help="JSON file where parsed SQLX files are cached by content hash.")
+    params = parser.parse_args(args)
+
+    index = index_sqlx_files(find_sqlx_files(str(params.root)), cache_file=str(params.cache_file))
+    print(json.dumps(index, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,181 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from google.cloud import dataform_v1beta1
+from google.type import interval_pb2
+
+import dataform_runner
+
+REPO_URI = "projects/my-project/locations/us-central1/repositories/my-repo"
+COMMIT_SHA = "a" * 40
+
+
+def interval(seconds):
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    return interval_pb2.Interval(start_time=start, end_time=start + datetime.timedelta(seconds=seconds))
+
+
+def target(name):
+    return dataform_v1beta1.Target(database="my-project", schema="my_dataset", name=name)
+
+
+class RunWorkflowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.dataform = mock.Mock()
+        self.dataform.create_compilation_result.return_value = dataform_v1beta1.CompilationResult(
+            name=f"{REPO_URI}/compilationResults/c1", resolved_git_commit_sha=COMMIT_SHA)
+        self.dataform.query_compilation_result_actions.return_value = [
+            dataform_v1beta1.CompilationResultAction(
+                target=target("orders"),
+                relation=dataform_v1beta1.CompilationResultAction.Relation(select_query="SELECT 1",
+                                                                           tags=["daily"])),
+        ]
+        self.dataform.create_workflow_invocation.return_value = dataform_v1beta1.WorkflowInvocation(
+            name=f"{REPO_URI}/workflowInvocations/w1")
+        self.dataform.get_workflow_invocation.return_value = dataform_v1beta1.WorkflowInvocation(
+            name=f"{REPO_URI}/workflowInvocations/w1", state=dataform_v1beta1.WorkflowInvocation.State.SUCCEEDED,
+            invocation_timing=interval(30))
+        self.dataform.query_workflow_invocation_actions.return_value = [
+            dataform_v1beta1.WorkflowInvocationAction(
+                target=target("orders"), state=dataform_v1beta1.WorkflowInvocationAction.State.SUCCEEDED,
+                invocation_timing=interval(25)),
+        ]
+        self.bigquery = mock.Mock()
+        self.bigquery.query.return_value = mock.Mock(total_bytes_processed=1024)
+        patches = [
+            mock.patch.object(dataform_runner, "get_dataform_client", return_value=self.dataform),
+            mock.patch.object(dataform_runner, "get_bigquery_client", return_value=self.bigquery),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_workflow(self, **kwargs):
+        return dataform_runner.run_workflow(gcp_project="my-project", project_num="123", location="us-central1",
+                                            repo_name="my-repo", tags=["daily"], branch="main",
+                                            duration_history_file=os.path.join(self.directory.name,
+                                                                               "durations.json"),
+                                            **kwargs)
+
+    def test_compiles_dry_runs_executes_and_summarizes(self):
+        result = self.run_workflow(execute="true", dry_run="true", max_bytes_processed=4096)
+
+        self.assertEqual(result["compilation_result"], f"{REPO_URI}/compilationResults/c1")
+        self.assertEqual(result["commit_sha"], COMMIT_SHA)
+        self.assertEqual(result["estimated_bytes_processed"], 1024)
+        self.assertEqual(result["workflow_invocation"], f"{REPO_URI}/workflowInvocations/w1")
+        self.assertEqual(result["state"], "SUCCEEDED")
+        self.assertEqual(result["duration_seconds"], 30)
+        self.assertEqual(result["action_state_counts"], {"SUCCEEDED": 1})
+        self.assertEqual(result["slowest_actions"][0]["target"], "my-project.my_dataset.orders")
+        request = self.dataform.create_workflow_invocation.call_args.kwargs["request"]
+        self.assertEqual(list(request.workflow_invocation.invocation_config.included_tags), ["daily"])
+        with open(os.path.join(self.directory.name, "durations.json")) as f:
+            self.assertEqual(json.load(f)["invocations"]["my-repo"][0]["duration_seconds"], 30)
+        self.assertFalse(dataform_runner.active_invocations)
+
+    def test_dry_run_over_budget_does_not_invoke(self):
+        with self.assertRaisesRegex(Exception, "over the budget"):
+            self.run_workflow(execute="true", dry_run="true", max_bytes_processed=100)
+        self.dataform.create_workflow_invocation.assert_not_called()
+
+    def test_costs_are_attributed_from_the_execution_project(self):
+        self.dataform.query_workflow_invocation_actions.return_value = [
+            dataform_v1beta1.WorkflowInvocationAction(
+                target=target("orders"), state=dataform_v1beta1.WorkflowInvocationAction.State.SUCCEEDED,
+                invocation_timing=interval(25),
+                bigquery_action=dataform_v1beta1.WorkflowInvocationAction.BigQueryAction(job_id="job_1")),
+        ]
+        self.bigquery.query.return_value.result.return_value = []
+
+        with mock.patch.object(dataform_runner, "get_bigquery_client", return_value=self.bigquery) as client:
+            self.run_workflow(execute="true", attribute_costs="true", default_project="data-project")
+
+        client.assert_called_once_with("data-project")
+        self.assertIn("`data-project.region-us-central1.INFORMATION_SCHEMA.JOBS`",
+                      self.bigquery.query.call_args.args[0])
+
+    def test_compile_only(self):
+        result = self.run_workflow(execute="false")
+
+        self.assertEqual(result["state"], "COMPILED")
+        self.assertIsNone(result["workflow_invocation"])
+        self.dataform.create_workflow_invocation.assert_not_called()
+
+
+class LogProgressTest(unittest.TestCase):
+
+    def test_progress_goes_to_stderr_only(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch("time.time", return_value=100.0), contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            dataform_runner.log_progress(["w1", "w2"], {"w1": 70.0, "w2": 40.0}, {"w1": 40.0},
+                                         labels={"w1": "orders", "w2": "customers"})
+
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(stderr.getvalue().splitlines(), ["orders: 30s elapsed, ETA 10s",
+                                                          "customers: 60s elapsed, no duration history for an ETA"])
+
+
+class AnalyzeProjectRolesTest(unittest.TestCase):
+
+    def test_members_of_groups_hold_their_roles(self):
+        result = mock.Mock()
+        result.iam_binding.role = "roles/bigquery.jobUser"
+        result.iam_binding.members = ["group:runners@example.com"]
+        result.identity_list.identities = [mock.Mock(), mock.Mock()]
+        result.identity_list.identities[0].name = "group:runners@example.com"
+        result.identity_list.identities[1].name = "serviceAccount:runner@my-project.iam.gserviceaccount.com"
+        client = mock.Mock()
+        client.analyze_iam_policy.return_value.main_analysis.analysis_results = [result]
+        with mock.patch.object(dataform_runner, "get_asset_client", return_value=client):
+            members = dataform_runner.analyze_project_roles("my-project", ["roles/bigquery.jobUser"])
+
+        self.assertIn("serviceAccount:runner@my-project.iam.gserviceaccount.com", members["roles/bigquery.jobUser"])
+        query = client.analyze_iam_policy.call_args.kwargs["request"]["analysis_query"]
+        self.assertTrue(query["options"]["expand_groups"])
+
+
+class MainTest(unittest.TestCase):
+
+    def main(self, *args):
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit):
+            dataform_runner.main(["--project_id", "my-project", "--project_number", "1", "--location",
+                                  "us-central1", "--execute", "false", "--repositories", "[]", *args])
+
+    def test_concurrency_limits_below_one_are_rejected(self):
+        for name in ("--max_concurrent_invocations", "--max_concurrent_invocations_per_project"):
+            with self.subTest(name):
+                self.main(name, "0")
+
+    def test_malformed_service_account_roles_are_rejected(self):
+        for pair in ("runner@my-project.iam.gserviceaccount.com", "=roles/bigquery.jobUser", "runner@example.com="):
+            with self.subTest(pair):
+                self.main("--service_account_roles", pair)
+
+
+if __name__ == "__main__":
+    unittest.main()
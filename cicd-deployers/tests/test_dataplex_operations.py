@@ -0,0 +1,128 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import types
+import unittest
+from unittest import mock
+
+import dataplex_operations
+
+
+class FakeClock:
+    """A clock that only moves when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeOperation:
+    """A long-running operation that is done after a number of polls, with a result or an error."""
+
+    def __init__(self, name, polls=1, result=None, error=None):
+        self.operation = types.SimpleNamespace(name=name)
+        self.polls = polls
+        self._result = result
+        self._error = error
+
+    def done(self):
+        self.polls -= 1
+        return self.polls <= 0
+
+    def exception(self):
+        return self._error
+
+    def result(self):
+        return self._result
+
+
+class OperationManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for name in ("time", "sleep"):
+            patcher = mock.patch(f"time.{name}", getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manager = dataplex_operations.OperationManager(initial_poll_seconds=2.0, max_poll_seconds=30.0,
+                                                            backoff=2.0)
+        self.events = []
+
+    def start(self, key, **kwargs):
+        def start():
+            self.events.append(("start", key))
+            return FakeOperation(f"operations/{key}", **kwargs)
+        return start
+
+    def done(self, key):
+        return lambda result: self.events.append(("done", key))
+
+    def test_children_start_after_their_parent_is_done(self):
+        self.manager.add("lake", self.start("lake", polls=3, result="lake"), on_done=self.done("lake"))
+        self.manager.add("zone", self.start("zone"), ["lake"], on_done=self.done("zone"))
+        self.manager.add("other", self.start("other"), on_done=self.done("other"))
+        with self.assertLogs(level="INFO"):
+            outcomes = self.manager.run()
+
+        self.assertLess(self.events.index(("done", "lake")), self.events.index(("start", "zone")))
+        self.assertLess(self.events.index(("done", "other")), self.events.index(("done", "lake")))
+        self.assertEqual({key: outcome["status"] for key, outcome in outcomes.items()},
+                         {"lake": "succeeded", "zone": "succeeded", "other": "succeeded"})
+        self.assertEqual(outcomes["lake"]["result"], "lake")
+        self.assertEqual(outcomes["lake"]["operation"], "operations/lake")
+        # The lake is polled after 2, 4 and 8 seconds.
+        self.assertEqual(outcomes["lake"]["latency_seconds"], 14.0)
+        self.assertEqual(outcomes["zone"]["latency_seconds"], 2.0)
+
+    def test_failed_operation_skips_its_dependents(self):
+        self.manager.add("lake", self.start("lake", error=RuntimeError("quota exceeded")))
+        self.manager.add("zone", self.start("zone"), ["lake"])
+        self.manager.add("asset", self.start("asset"), ["zone"])
+        with self.assertLogs(level="ERROR"):
+            outcomes = self.manager.run()
+
+        self.assertEqual(outcomes["lake"]["status"], "failed")
+        self.assertEqual(outcomes["lake"]["error"], "quota exceeded")
+        self.assertEqual(outcomes["zone"], {"status": "skipped", "error": "lake failed"})
+        self.assertEqual(outcomes["asset"], {"status": "skipped", "error": "lake failed"})
+        self.assertEqual(self.events, [("start", "lake")])
+
+    def test_failed_start_skips_its_dependents(self):
+        def start():
+            raise RuntimeError("permission denied")
+
+        self.manager.add("lake", start)
+        self.manager.add("zone", self.start("zone"), ["lake"])
+        with self.assertLogs(level="ERROR"):
+            outcomes = self.manager.run()
+
+        self.assertEqual(outcomes["lake"], {"status": "failed", "error": "permission denied", "latency_seconds": 0.0})
+        self.assertEqual(outcomes["zone"]["status"], "skipped")
+        self.assertEqual(self.events, [])
+
+    def test_unknown_dependency_is_rejected(self):
+        self.manager.add("zone", self.start("zone"), ["lake"])
+
+        with self.assertRaisesRegex(ValueError, "zone depends on lake, which was never added"):
+            self.manager.run()
+        self.assertEqual(self.events, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
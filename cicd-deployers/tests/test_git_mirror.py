@@ -0,0 +1,66 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import contextlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import git_mirror
+
+
+class GitMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch("subprocess.run", return_value=subprocess.CompletedProcess([], 0, stdout=b"", stderr=b""))
+        self.run = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_is_passed_in_the_environment(self):
+        mirror = git_mirror.GitMirror("https://github.com/org/repo.git", self.directory.name, token="secret")
+        os.makedirs(mirror.path)
+        with mock.patch.dict(os.environ, {"GIT_CONFIG_COUNT": "1"}):
+            mirror.update()
+
+        (command,), kwargs = self.run.call_args
+        self.assertFalse([argument for argument in command if "secret" in argument or "Authorization" in argument])
+        credentials = base64.b64encode(b"x-access-token:secret").decode()
+        self.assertEqual(kwargs["env"]["GIT_CONFIG_COUNT"], "2")
+        self.assertEqual(kwargs["env"]["GIT_CONFIG_KEY_1"], "http.extraHeader")
+        self.assertEqual(kwargs["env"]["GIT_CONFIG_VALUE_1"], f"Authorization: Basic {credentials}")
+
+
+class MainTest(unittest.TestCase):
+
+    def test_terraform_plans_always_fetch(self):
+        query = {"remote_repo_url": "https://github.com/org/repo.git", "ref": "main", "path": "dataform.json"}
+        with mock.patch.object(git_mirror, "GitMirror") as mirror, \
+                mock.patch("sys.stdin", io.StringIO(json.dumps(query))), \
+                contextlib.redirect_stdout(io.StringIO()):
+            mirror.return_value.update.return_value.resolve.return_value = "a" * 40
+            mirror.return_value.update.return_value.read_file.return_value = "{}"
+            git_mirror.main(["--terraform_external"])
+
+        self.assertEqual(mirror.call_args.args[3], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
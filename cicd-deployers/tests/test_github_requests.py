@@ -0,0 +1,73 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import unittest
+import urllib.error
+from unittest import mock
+
+import github_requests
+
+
+class FakeResponse(io.BytesIO):
+    """An HTTP response whose body read records whether a concurrency slot is held."""
+
+    def __init__(self, requester, body):
+        super().__init__(body)
+        self.requester = requester
+        self.status = 200
+        self.headers = {"ETag": '"etag"'}
+        self.slot_held_on_read = None
+
+    def read(self, *args):
+        self.slot_held_on_read = self.requester._semaphore._value == 0
+        return super().read(*args)
+
+
+class GitHubRequesterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.requester = github_requests.GitHubRequester("token", max_concurrency=1, max_retries=2)
+        patcher = mock.patch("time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connection_errors_are_retried(self):
+        response = FakeResponse(self.requester, b"body")
+        errors = [urllib.error.URLError("Name or service not known"), ConnectionResetError("reset")]
+        with mock.patch("urllib.request.urlopen", side_effect=[*errors, response]) as urlopen:
+            status, etag, body = self.requester.get("https://api.github.com/repos/org/repo")
+
+        self.assertEqual((status, etag, body), (200, '"etag"', b"body"))
+        self.assertEqual(urlopen.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_connection_errors_are_raised_after_the_last_retry(self):
+        with mock.patch("urllib.request.urlopen", side_effect=urllib.error.URLError("reset")) as urlopen:
+            with self.assertRaises(urllib.error.URLError):
+                self.requester.get("https://api.github.com/repos/org/repo")
+
+        self.assertEqual(urlopen.call_count, 3)
+
+    def test_slot_is_held_until_the_body_is_read(self):
+        response = FakeResponse(self.requester, b"body")
+        with mock.patch("urllib.request.urlopen", return_value=response):
+            self.requester.get("https://api.github.com/repos/org/repo")
+
+        self.assertTrue(response.slot_held_on_read)
+        self.assertEqual(self.requester._semaphore._value, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import json
+import tarfile
+import unittest
+from unittest import mock
+
+import iam_metadata_extractor
+
+IAM_METADATA = '{"bindings": [{"role": "roles/bigquery.dataViewer", "members": ["group:analysts@example.com"]}]}'
+
+
+def ddl_sqlx(name):
+    return f'config {{ type: "operations", name: "{name}", tags: ["ddl"] }}\n//iam_metadata: {IAM_METADATA}\nSELECT 1\n'
+
+
+class FakeMirror:
+    """A git mirror serving fixed .sqlx files and recording the blobs read."""
+
+    def __init__(self, contents):
+        self.blobs = {path: iam_metadata_extractor.git_blob_sha(content.encode())
+                      for path, content in contents.items()}
+        self.contents = {self.blobs[path]: content for path, content in contents.items()}
+        self.reads = []
+
+    def list_files(self, ref, suffix):
+        return dict(self.blobs)
+
+    def read_blobs(self, shas):
+        self.reads.append(set(shas))
+        return {sha: self.contents[sha] for sha in shas}
+
+
+class ListSqlxFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = {"full_name": "org/repo", "default_branch": "HEAD"}
+        self.contents = {"definitions/orders.sqlx": ddl_sqlx("orders"),
+                         "definitions/customers.sqlx": ddl_sqlx("customers"),
+                         "definitions/report.sqlx": 'config { type: "table" }\nSELECT 1\n'}
+        patcher = mock.patch.object(iam_metadata_extractor, "MIRROR_READ_BATCH_SIZE", 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reports_each_table_as_its_blob_is_read(self):
+        mirror = FakeMirror(self.contents)
+        reads_at_report = []
+
+        def on_metadata(metadata):
+            reads_at_report.append((metadata["table"], len(mirror.reads)))
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            all_metadata, shas = iam_metadata_extractor.list_sqlx_files(self.repo, None, on_metadata=on_metadata,
+                                                                       mirror=mirror)
+
+        self.assertEqual(all_metadata, [])
+        self.assertEqual(reads_at_report, [("customers", 1), ("orders", 2)])
+        self.assertEqual(shas, set(mirror.blobs.values()))
+
+    def test_cached_blobs_are_not_read(self):
+        mirror = FakeMirror(self.contents)
+        cache = {"trees": {}, "blobs": {}}
+        with contextlib.redirect_stderr(io.StringIO()):
+            first, _ = iam_metadata_extractor.list_sqlx_files(self.repo, None, extraction_cache=cache, mirror=mirror)
+        mirror.reads.clear()
+
+        second, _ = iam_metadata_extractor.list_sqlx_files(self.repo, None, extraction_cache=cache, mirror=mirror)
+
+        self.assertEqual(mirror.reads, [])
+        self.assertEqual(second, first)
+        self.assertEqual([metadata["table"] for metadata in second], ["customers", "orders"])
+
+
+class FakeRequester:
+    """A GitHub requester answering the commit, tree and tarball requests of a repository."""
+
+    def __init__(self, commit, contents, truncated=False):
+        self.commit = commit
+        self.contents = contents
+        self.truncated = truncated
+        self.urls = []
+
+    def get(self, url, etag=None, accept=None):
+        self.urls.append(url)
+        return 200, '"etag"', self.commit.encode()
+
+    def get_json(self, url):
+        self.urls.append(url)
+        tree = [{"path": path, "type": "blob", "sha": iam_metadata_extractor.git_blob_sha(content.encode())}
+                for path, content in self.contents.items()]
+        return {"tree": tree, "truncated": self.truncated}
+
+    def open(self, url, etag=None, accept=None):
+        self.urls.append(url)
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+            for path, content in self.contents.items():
+                data = content.encode()
+                member = tarfile.TarInfo(f"org-repo-{self.commit[:7]}/{path}")
+                member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+        archive.seek(0)
+        return archive
+
+
+class ArchiveFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = {"full_name": "org/repo", "default_branch": "main", "url": "https://api.github.com/repos/org/repo"}
+        self.commit = "0123456789abcdef0123456789abcdef01234567"
+        self.contents = {f"definitions/table_{i}.sqlx": ddl_sqlx(f"table_{i}")
+                         for i in range(iam_metadata_extractor.BLOB_FETCH_LIMIT + 1)}
+
+    def extract(self, requester):
+        with contextlib.redirect_stderr(io.StringIO()):
+            all_metadata, _ = iam_metadata_extractor.list_sqlx_files(self.repo, requester)
+        self.assertEqual(len(all_metadata), len(self.contents))
+        return [url for url in requester.urls if "/tarball/" in url]
+
+    def test_archive_is_fetched_at_the_listed_commit(self):
+        requester = FakeRequester(self.commit, self.contents)
+
+        self.assertEqual(self.extract(requester), [f"{self.repo['url']}/tarball/{self.commit}"])
+        self.assertIn(f"{self.repo['url']}/git/trees/{self.commit}?recursive=1", requester.urls)
+
+    def test_truncated_tree_is_read_from_the_commit_archive(self):
+        requester = FakeRequester(self.commit, self.contents, truncated=True)
+
+        self.assertEqual(self.extract(requester), [f"{self.repo['url']}/tarball/{self.commit}"])
+
+
+class MainTest(unittest.TestCase):
+
+    def test_json_output_is_a_list_of_objects(self):
+        metadata = {"repository": "repo", "table": "orders", "schema": None, "database": None,
+                    "iam_metadata": json.loads(IAM_METADATA)}
+        stdout = io.StringIO()
+        with mock.patch.object(iam_metadata_extractor, "extract_repositories", return_value=([metadata], [])), \
+                contextlib.redirect_stdout(stdout):
+            exit_code = iam_metadata_extractor.main(["--remote_repo_url", "https://github.com/org/repo.git",
+                                                     "--dataform_repositories_git_token", "token"])
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(json.loads(stdout.getvalue()), [metadata])
+
+
+if __name__ == "__main__":
+    unittest.main()
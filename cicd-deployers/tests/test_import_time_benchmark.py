@@ -0,0 +1,45 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import unittest
+from unittest import mock
+
+import import_time_benchmark
+
+IMPORT_TIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       900 |        900 |   _distutils_hack
+import time:      3000 |      30000 | site
+import time:       100 |        100 |       email.errors
+import time:      2000 |       2100 |     email.parser
+import time:      5000 |       7100 |   urllib.request
+import time:       400 |        400 |   logging
+import time:       500 |       8000 | github_requests
+"""
+
+
+class MeasureImportTimeTest(unittest.TestCase):
+
+    def test_only_imports_under_the_module_are_counted(self):
+        completed = subprocess.CompletedProcess([], 0, stdout="", stderr=IMPORT_TIME_OUTPUT)
+        with mock.patch("subprocess.run", return_value=completed):
+            total, packages = import_time_benchmark.measure_import_time("github_requests")
+
+        self.assertEqual(total, 8000)
+        self.assertEqual(packages, {"urllib.request": 7100, "logging": 400})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import unittest
+
+import metadata_bundle
+
+SCHEMA = {
+    "type": "object",
+    "required": ["name"],
+    "properties": {
+        "name": {"type": "string"},
+        "size": {"type": "number"},
+        "type": {"type": "string", "enum": ["RAW", "CURATED"]},
+        "members": {"type": "array", "items": {"type": "string"}},
+        "owner": {"oneOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]},
+    },
+}
+
+
+class ValidateTest(unittest.TestCase):
+
+    def test_valid_document(self):
+        self.assertEqual(metadata_bundle.validate({"name": "sales", "size": 2, "type": "RAW", "members": ["a"],
+                                                   "owner": ["b"]}, SCHEMA), [])
+
+    def test_errors_are_reported_with_their_path(self):
+        errors = metadata_bundle.validate({"size": True, "type": "LANDING", "members": ["a", 1], "owner": 1},
+                                          SCHEMA)
+
+        self.assertEqual(errors, ["$: missing required property name",
+                                  "$.size: expected number, got bool",
+                                  "$.type: 'LANDING' is not one of RAW, CURATED",
+                                  "$.members[1]: expected string, got int",
+                                  "$.owner: does not match any of the allowed forms"])
+
+    def test_wrong_document_type(self):
+        self.assertEqual(metadata_bundle.validate([], SCHEMA), ["$: expected object, got list"])
+
+
+class CompileBundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.directories = {}
+        for kind in metadata_bundle.METADATA_DIRECTORIES:
+            self.directories[kind] = os.path.join(self.directory.name, kind)
+            os.makedirs(self.directories[kind])
+
+    def write_spec(self, kind, name, content):
+        with open(os.path.join(self.directories[kind], name), "w") as f:
+            f.write(content)
+
+    def test_specs_are_rendered_with_the_cortex_configuration(self):
+        self.write_spec("lakes", "sales.yaml", "project: {{ project_id_tgt }}\nlakes:\n  - display_name: sales\n"
+                                               "    description: {{ k9_datasets_reporting }} in {{ location }}\n")
+
+        bundle = metadata_bundle.compile_bundle(self.directories, "project", "us-central1")
+
+        spec = bundle["specs"]["lakes"][os.path.join(self.directories["lakes"], "sales.yaml")]
+        self.assertEqual(spec, {"project": "project", "lakes": [{"display_name": "sales",
+                                                                 "description": "K9_REPORTING in us-central1"}]})
+
+    def test_undefined_placeholders_and_invalid_specs_fail_together(self):
+        self.write_spec("lakes", "sales.yaml", "name: {{ undefined_placeholder }}\n")
+        self.write_spec("tag_templates", "pii.yaml", "display_name: PII\n")
+
+        with self.assertRaises(metadata_bundle.BundleValidationError) as context:
+            metadata_bundle.compile_bundle(self.directories, "project", "us-central1")
+
+        self.assertEqual(len(context.exception.errors), 2)
+        self.assertIn("'undefined_placeholder' is undefined", context.exception.errors[0])
+
+    def test_bundle_hash_round_trip(self):
+        self.write_spec("lakes", "sales.yaml", "project: {{ project_id_tgt }}\nlakes:\n  - display_name: sales\n")
+        bundle = metadata_bundle.compile_bundle(self.directories, "project", "us-central1")
+        path = os.path.join(self.directory.name, "bundle.json")
+        with open(path, "w") as f:
+            json.dump(bundle, f)
+
+        self.assertEqual(metadata_bundle.read_bundle(path), bundle)
+        self.assertEqual(metadata_bundle.compile_bundle(self.directories, "project", "us-central1")["hash"],
+                         bundle["hash"])
+        self.assertNotEqual(metadata_bundle.compile_bundle(self.directories, "other", "us-central1")["hash"],
+                            bundle["hash"])
+
+    def test_edited_bundle_is_rejected(self):
+        self.write_spec("lakes", "sales.yaml", "lakes:\n  - display_name: sales\n")
+        bundle = metadata_bundle.compile_bundle(self.directories, "project", "us-central1")
+        spec = bundle["specs"]["lakes"][os.path.join(self.directories["lakes"], "sales.yaml")]
+        spec["lakes"][0]["display_name"] = "edited"
+        path = os.path.join(self.directory.name, "bundle.json")
+        with open(path, "w") as f:
+            json.dump(bundle, f)
+
+        with self.assertRaisesRegex(ValueError, "does not match its hash"):
+            metadata_bundle.read_bundle(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import metadata_deployer
+
+
+class FakeDataMeshModule:
+    """A Cortex deploy_data_mesh module recording the specs of each run and failing the lakes."""
+
+    def __init__(self):
+        self.runs = []
+
+    def main(self, arguments):
+        parser = argparse.ArgumentParser()
+        for name in ("--config-file", "--tag-template-directories", "--policy-directories", "--lake-directories",
+                     "--annotation-directories"):
+            parser.add_argument(name)
+        parser.add_argument("--overwrite", action="store_true")
+        params = parser.parse_args(arguments)
+        with open(params.config_file) as f:
+            config = json.load(f)
+        specs = {kind: sorted(os.listdir(directory)) if (directory := getattr(params, f"{kind}_directories")) else []
+                 for kind in ("tag_template", "policy", "lake", "annotation")}
+        self.runs.append({"project": config["projectIdTarget"], **specs})
+        if specs["lake"]:
+            logging.error("Could not create lake sales-lake: permission denied")
+            return 1
+        return 0
+
+
+class RunDeployDataMeshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.directories = {}
+        for kind, specs in (("tag_templates", {"pii.yaml": "display_name: PII\n"}),
+                            ("lakes", {"sales.yaml": "name: sales-lake\nzones:\n  - name: sales-raw\n"}),
+                            ("annotations", {"orders.yaml": "name: orders\n", "customers.yaml": "name: customers\n"})):
+            self.directories[kind] = os.path.join(self.directory.name, kind)
+            os.makedirs(self.directories[kind])
+            for name, content in specs.items():
+                with open(os.path.join(self.directories[kind], name), "w") as f:
+                    f.write(content)
+        self.module = FakeDataMeshModule()
+        for name, value in (("ensure_cortex_checkout", mock.Mock(return_value="a" * 40)),
+                            ("ensure_requirements", mock.Mock()),
+                            ("load_data_mesh_module", mock.Mock(return_value=self.module))):
+            patcher = mock.patch.object(metadata_deployer, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def deploy(self, lake_directories, events):
+        return metadata_deployer.run_deploy_data_mesh(
+            metadata_deployer.build_cortex_config("project", "us-central1"), self.directories["tag_templates"], "",
+            lake_directories, self.directories["annotations"], overwrite="false", progress=events.append)
+
+    def test_all_specs_are_deployed_in_one_run(self):
+        events = []
+        result = self.deploy("", events)
+
+        self.assertEqual(result["status"], "succeeded")
+        self.assertEqual(self.module.runs, [{"project": "project", "tag_template": ["pii.yaml"], "policy": [],
+                                             "lake": [], "annotation": ["customers.yaml", "orders.yaml"]}])
+        self.assertEqual([r["status"] for r in result["resources"]], ["deployed"] * 3)
+        self.assertEqual(len([event for event in events if event["event"] == "resource"]), 3)
+
+    def test_logged_errors_fail_the_specs_they_name(self):
+        events = []
+        with self.assertLogs(level="ERROR"):
+            result = self.deploy(self.directories["lakes"], events)
+
+        self.assertEqual(len(self.module.runs), 1)
+        self.assertEqual(result["status"], "failed")
+        self.assertEqual([(os.path.basename(r["spec"]), r["status"]) for r in result["resources"]],
+                         [("pii.yaml", "unknown"), ("sales.yaml", "failed"), ("customers.yaml", "unknown"),
+                          ("orders.yaml", "unknown")])
+        self.assertEqual(result["resources"][1]["errors"], ["Could not create lake sales-lake: permission denied"])
+        self.assertEqual(result["errors"], ["Could not create lake sales-lake: permission denied"])
+        self.assertEqual(len([event for event in events if event["event"] == "resource"]), 4)
+
+
+class PlanModeTest(unittest.TestCase):
+
+    def setUp(self):
+        bundle = {"project_id": "project", "location": "us-central1", "hash": "h1", "specs": {}}
+        for target, name, value in ((metadata_deployer, "ensure_requirements", mock.Mock()),
+                                    (metadata_deployer.metadata_bundle, "compile_bundle",
+                                     mock.Mock(return_value=bundle))):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def plan(self, conflicts):
+        plan = {"steps": [], "conflicts": conflicts}
+        with mock.patch.object(metadata_deployer.metadata_planner, "plan_metadata", return_value=(plan, {}, {})), \
+                contextlib.redirect_stdout(io.StringIO()):
+            return metadata_deployer.main(["--project_id", "project", "--location", "us-central1", "--overwrite",
+                                           "false", "--deployment_mode", "plan"])
+
+    def test_conflicts_fail_the_plan_like_the_planner(self):
+        self.assertEqual(self.plan([{"kind": "zone", "key": "zone/us-central1/sales/raw", "changes": {}}]), 1)
+        self.assertEqual(self.plan([]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from google.cloud import bigquery
+
+import metadata_planner
+
+
+def state(*resources):
+    """Builds a desired or live state from (kind, key, properties, parent) tuples."""
+    resources_state = {}
+    for kind, key, properties, parent in resources:
+        metadata_planner.add_resource(resources_state, kind, key, properties, parent)
+    return resources_state
+
+
+LAKE = ("lake", "us-central1/sales", {"display_name": "sales"}, None)
+RAW_ZONE = ("zone", "us-central1/sales/raw", {"display_name": "raw", "type": "RAW"}, "lake/us-central1/sales")
+CURATED_ZONE = ("zone", "us-central1/sales/curated", {"display_name": "curated", "type": "CURATED"},
+                "lake/us-central1/sales")
+OTHER_LAKE = ("lake", "us-central1/finance", {"display_name": "finance"}, None)
+OTHER_ZONE = ("zone", "us-central1/finance/raw", {"display_name": "raw", "type": "RAW"}, "lake/us-central1/finance")
+
+
+def plan_actions(plan):
+    return [(step["action"], step["key"]) for step in plan["steps"]]
+
+
+class ComputePlanTest(unittest.TestCase):
+
+    def test_undeclared_children_of_managed_parents_are_deleted(self):
+        plan = metadata_planner.compute_plan(state(LAKE, RAW_ZONE), state(LAKE, RAW_ZONE, CURATED_ZONE))
+
+        self.assertEqual(plan_actions(plan), [("delete", "zone/us-central1/sales/curated")])
+
+    def test_top_level_resources_are_only_deleted_with_prune(self):
+        desired = state(LAKE)
+        live = state(LAKE, OTHER_LAKE)
+
+        self.assertEqual(plan_actions(metadata_planner.compute_plan(desired, live)), [])
+        self.assertEqual(plan_actions(metadata_planner.compute_plan(desired, live, prune=True)),
+                         [("delete", "lake/us-central1/finance")])
+
+    def test_deletes_are_ordered_children_first(self):
+        plan = metadata_planner.compute_plan(state(LAKE), state(LAKE, OTHER_LAKE, OTHER_ZONE), prune=True)
+
+        self.assertEqual(plan_actions(plan), [("delete", "zone/us-central1/finance/raw"),
+                                              ("delete", "lake/us-central1/finance")])
+        self.assertEqual(metadata_planner.plan_dependencies(plan["steps"]), [set(), {0}])
+
+    def test_assets_of_a_deleted_zone_are_deleted_without_prune(self):
+        asset = ("asset", "us-central1/sales/curated/orders", {"resource_name": "orders"}, "zone/" + CURATED_ZONE[1])
+
+        plan = metadata_planner.compute_plan(state(LAKE, RAW_ZONE), state(LAKE, RAW_ZONE, CURATED_ZONE, asset))
+
+        self.assertEqual(plan_actions(plan), [("delete", "asset/us-central1/sales/curated/orders"),
+                                              ("delete", "zone/us-central1/sales/curated")])
+
+    def test_immutable_changes_are_conflicts(self):
+        desired = state(LAKE, ("zone", RAW_ZONE[1], {"display_name": "raw", "type": "CURATED"}, RAW_ZONE[3]))
+
+        plan = metadata_planner.compute_plan(desired, state(LAKE, RAW_ZONE))
+
+        self.assertEqual(plan["steps"], [])
+        self.assertEqual(plan["conflicts"], [{"kind": "zone", "key": "zone/us-central1/sales/raw",
+                                              "changes": {"type": {"from": "RAW", "to": "CURATED"}}}])
+
+    def test_new_tag_template_field_is_an_update(self):
+        live_template = {"display_name": "pii", "fields": {"owner": "Owner"}, "field_types": {"owner": "STRING"}}
+        desired_template = {"display_name": "pii", "fields": {"owner": "Owner", "level": "Level"},
+                            "field_types": {"owner": "STRING", "level": "DOUBLE"}}
+
+        plan = metadata_planner.compute_plan(state(("tag_template", "us-central1/pii", desired_template, None)),
+                                             state(("tag_template", "us-central1/pii", live_template, None)))
+
+        self.assertEqual(plan["conflicts"], [])
+        self.assertEqual(plan_actions(plan), [("update", "tag_template/us-central1/pii")])
+        self.assertEqual(plan["steps"][0]["changes"]["field_types"]["to"], {"owner": "STRING", "level": "DOUBLE"})
+
+
+class ApplyPlanTest(unittest.TestCase):
+
+    def test_failed_parent_skips_its_dependents(self):
+        taxonomy = ("taxonomy", "us-central1/pii", {"display_name": "pii", "description": ""}, None)
+        policy_tag = ("policy_tag", "us-central1/pii/email", {"display_name": "email", "description": ""},
+                      "taxonomy/us-central1/pii")
+        other_taxonomy = ("taxonomy", "us-central1/finance", {"display_name": "finance", "description": ""}, None)
+        plan = metadata_planner.compute_plan(state(taxonomy, policy_tag, other_taxonomy), {})
+
+        def apply_step(step, names, live, project_id):
+            if step["key"] == "taxonomy/us-central1/pii":
+                raise RuntimeError("permission denied")
+
+        with mock.patch.object(metadata_planner, "apply_step", side_effect=apply_step):
+            results = metadata_planner.apply_plan(plan, {}, {}, "project")
+
+        statuses = {result["key"]: (result["status"], result.get("error")) for result in results}
+        self.assertEqual(statuses, {"taxonomy/us-central1/finance": ("applied", None),
+                                    "taxonomy/us-central1/pii": ("failed", "permission denied"),
+                                    "policy_tag/us-central1/pii/email": ("skipped",
+                                                                         "taxonomy/us-central1/pii failed")})
+
+
+class ApplyAnnotationStepTest(unittest.TestCase):
+
+    def test_column_descriptions_keep_the_other_column_properties(self):
+        client = mock.Mock()
+        client.get_table.return_value = bigquery.Table("project.dataset.orders", schema=[
+            bigquery.SchemaField.from_api_repr({"name": "code", "type": "STRING", "mode": "NULLABLE", "maxLength": "10",
+                                                "defaultValueExpression": "'none'", "description": "old"}),
+            bigquery.SchemaField("address", "RECORD", fields=[
+                bigquery.SchemaField.from_api_repr({"name": "zip", "type": "NUMERIC", "precision": "5",
+                                                    "scale": "0"})]),
+        ])
+        step = {"action": "update", "kind": "annotation", "key": "annotation/project.dataset.orders",
+                "properties": {"fields": {"code": "The order code", "address.zip": "The zip code"}}}
+
+        with mock.patch.object(metadata_planner, "get_bigquery_client", return_value=client):
+            metadata_planner.apply_annotation_step(step, "project")
+
+        table, fields_to_update = client.update_table.call_args.args
+        self.assertEqual(fields_to_update, ["schema"])
+        code, address = [field.to_api_repr() for field in table.schema]
+        self.assertEqual(code["description"], "The order code")
+        self.assertEqual(code["maxLength"], "10")
+        self.assertEqual(code["defaultValueExpression"], "'none'")
+        self.assertEqual(address["fields"][0]["description"], "The zip code")
+        self.assertEqual((address["fields"][0]["precision"], address["fields"][0]["scale"]), ("5", "0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
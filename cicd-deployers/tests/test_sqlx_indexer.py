@@ -0,0 +1,93 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import os
+import tempfile
+import unittest
+
+import sqlx_indexer
+
+IAM_METADATA = '{"bindings": [{"role": "roles/bigquery.dataViewer", "members": ["group:analysts@example.com"]}]}'
+
+
+class ParseSqlxTest(unittest.TestCase):
+
+    def test_iam_metadata_after_config(self):
+        entry = sqlx_indexer.parse_sqlx(f'config {{ type: "table", name: "orders" }}\n'
+                                        f'//iam_metadata: {IAM_METADATA}\n'
+                                        f'SELECT * FROM ${{ref("raw_orders")}}\n')
+
+        self.assertEqual(entry["name"], "orders")
+        self.assertEqual(entry["iam_metadata"]["bindings"][0]["role"], "roles/bigquery.dataViewer")
+        self.assertEqual(entry["refs"], ["raw_orders"])
+
+    def test_iam_metadata_inside_config(self):
+        entry = sqlx_indexer.parse_sqlx('config {\n'
+                                        '  type: "table",\n'
+                                        '  name: "orders", // see "https://example.com/{docs"\n'
+                                        '  //iam_metadata: {"bindings": [\n'
+                                        '  //  {"role": "roles/bigquery.dataViewer",\n'
+                                        '  //   "members": ["group:analysts@example.com"]}]}\n'
+                                        '  tags: ["daily"]\n'
+                                        '}\n'
+                                        'SELECT 1\n')
+
+        self.assertEqual(entry["name"], "orders")
+        self.assertEqual(entry["tags"], ["daily"])
+        self.assertEqual(entry["iam_metadata"]["bindings"][0]["members"], ["group:analysts@example.com"])
+
+    def test_without_iam_metadata(self):
+        entry = sqlx_indexer.parse_sqlx('config { name: "orders" } // plain comment\nSELECT 1\n')
+
+        self.assertIsNone(entry["iam_metadata"])
+
+
+class IndexCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache_file = os.path.join(self.directory.name, "index.json")
+
+    def test_saves_merge_entries_of_other_callers(self):
+        sqlx_indexer.index_sqlx_contents({"a.sqlx": 'config { name: "a" }'}, cache_file=self.cache_file)
+        sqlx_indexer.index_sqlx_contents({"b.sqlx": 'config { name: "b" }'}, cache_file=self.cache_file)
+
+        cached = {entry["name"] for entry in sqlx_indexer.load_index_cache(self.cache_file).values()}
+        self.assertEqual(cached, {"a", "b"})
+
+    def test_keeps_the_most_recently_used_entries(self):
+        original = sqlx_indexer.INDEX_CACHE_MAX_ENTRIES
+        sqlx_indexer.INDEX_CACHE_MAX_ENTRIES = 2
+        self.addCleanup(setattr, sqlx_indexer, "INDEX_CACHE_MAX_ENTRIES", original)
+        for name in ("a", "b", "c"):
+            sqlx_indexer.save_index_cache(self.cache_file, {name: {"name": name}})
+
+        self.assertEqual(set(sqlx_indexer.load_index_cache(self.cache_file)), {"b", "c"})
+
+    def test_parallel_parsing_from_threads(self):
+        contents = [{f"{repo}/{i}.sqlx": f'config {{ name: "{repo}_{i}" }}'
+                     for i in range(sqlx_indexer.PARALLEL_THRESHOLD)} for repo in ("r1", "r2")]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            indexes = list(executor.map(
+                lambda repo_contents: sqlx_indexer.index_sqlx_contents(repo_contents, cache_file=self.cache_file,
+                                                                       max_workers=2), contents))
+
+        self.assertEqual(indexes[0]["r1/0.sqlx"]["name"], "r1_0")
+        self.assertEqual(len(sqlx_indexer.load_index_cache(self.cache_file)), 2 * sqlx_indexer.PARALLEL_THRESHOLD)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,12 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-#Search for and read dataform.json files in the input dataform repositories
-data "github_repository_file" "dataform_config" {
-  for_each   = var.dataform_repositories
-  repository = local.git_path[each.key]
-  branch     = each.value.branch
-  file       = "dataform.json"
+#Read the dataform.json file and resolve the branch commit of each input dataform repository from a local git mirror,
+#fetched incrementally once per deploy and shared with the cicd-deployers, so plans compile exact commits and can reuse cached compilations
+data "external" "dataform_repository" {
+  for_each = var.dataform_repositories
+  program  = ["python3", "../cicd-deployers/git_mirror.py", "--terraform_external"]
+  query = {
+    remote_repo_url = each.value.remote_repo_url
+    ref             = each.value.branch
+    path            = "dataform.json"
+    mirror_dir      = var.dataform_git_mirror_dir
+    token           = var.dataform_repositories_git_token
+  }
 }
 
 module "aef-dataform-service-account" {
@@ -117,6 +123,7 @@ resource "null_resource" "install_dataform_dependencies" {
       pip install google-api-core
       pip install google-cloud-dataform
       pip install google-cloud-asset
+      pip install google-cloud-bigquery
     EOF
   }
   depends_on = [google_service_account_iam_member.dataform_permissions, module.dataform_with_external_repos, null_resource.run_metadata_deployer]
@@ -125,17 +132,70 @@ resource "null_resource" "install_dataform_dependencies" {
   }
 }
 
-data "external" "dataform_deploy" {
-  for_each = var.compile_dataform_repositories ? local.dataform_repositories : {}
+#Compiles all the dataform repositories and reports the actions an execution would run. It has no side effects other
+#than creating compilation results, so it is safe to run during plan; compilations are cached per commit.
+data "external" "dataform_compile" {
+  count = var.compile_dataform_repositories && length(local.dataform_repositories) > 0 ? 1 : 0
 
-  program = ["aef_dataform_executor/bin/python3", "../cicd-deployers/dataform_runner.py",
+  program = ["bash", "-c", <<-EOF
+    if [ ! -x aef_dataform_executor/bin/python3 ]; then
+      python3 -m venv aef_dataform_executor >&2
+      aef_dataform_executor/bin/pip install google-api-core google-cloud-dataform google-cloud-asset google-cloud-bigquery >&2
+    fi
+    exec aef_dataform_executor/bin/python3 ../cicd-deployers/dataform_runner.py "$@"
+    EOF
+    , "dataform_runner",
     "--project_id", var.project,
     "--project_number", data.google_project.project.number,
     "--location", var.region,
-    "--repository", each.key,
+    "--repositories", jsonencode(local.dataform_run_settings),
     "--tags", "ddl",
-    "--execute", var.execute_dataform_repositories,
-    "--branch", each.value.branch
+    "--execute", "false",
+    "--dry_run", var.dry_run_dataform_repositories,
+    "--max_bytes_processed", var.dataform_max_bytes_processed
   ]
-  depends_on = [null_resource.install_dataform_dependencies,google_service_account_iam_member.dataform_permissions]
+  depends_on = [google_service_account_iam_member.dataform_permissions]
+}
+
+#Runs the compiled dataform repositories under global and per-project admission control, by priority. Execution only
+#happens during apply.
+resource "null_resource" "dataform_execute" {
+  count = var.compile_dataform_repositories && var.execute_dataform_repositories && length(local.dataform_repositories) > 0 ? 1 : 0
+  provisioner "local-exec" {
+    command = <<EOF
+      aef_dataform_executor/bin/python3 ../cicd-deployers/dataform_runner.py \
+        --project_id ${var.project} \
+        --project_number ${data.google_project.project.number} \
+        --location ${var.region} \
+        --repositories "$DATAFORM_REPOSITORIES" \
+        --compilation_results "$DATAFORM_COMPILATION_RESULTS" \
+        --tags ddl \
+        --execute true \
+        --attribute_costs ${var.attribute_dataform_costs} \
+        --invocation_timeout ${var.dataform_invocation_timeout} \
+        --run_timeout ${var.dataform_run_timeout} \
+        --max_concurrent_invocations ${var.dataform_max_concurrent_invocations} \
+        --max_concurrent_invocations_per_project ${var.dataform_max_concurrent_invocations_per_project} \
+        --resume ${var.resume_failed_dataform_runs} \
+        --dry_run ${var.dry_run_dataform_repositories} \
+        --max_bytes_processed ${var.dataform_max_bytes_processed} \
+        --results_file dataform_execution_results.json
+    EOF
+    environment = {
+      DATAFORM_REPOSITORIES        = jsonencode(local.dataform_run_settings)
+      DATAFORM_COMPILATION_RESULTS = jsonencode(local.dataform_compilation_results)
+    }
+  }
+  triggers = {
+    compilation_results = jsonencode(local.dataform_compilation_results)
+    always_run          = timestamp()
+  }
+  depends_on = [null_resource.install_dataform_dependencies, google_service_account_iam_member.dataform_permissions]
+}
+
+#Read the execution results once the dataform repositories have run
+data "local_file" "dataform_execution_results" {
+  count      = length(null_resource.dataform_execute)
+  filename   = "dataform_execution_results.json"
+  depends_on = [null_resource.dataform_execute]
 }
\ No newline at end of file
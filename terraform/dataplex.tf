@@ -29,7 +29,7 @@ resource "null_resource" "run_metadata_deployer" {
     command = <<EOF
       python3 -m venv aef_metadata_deployer || true
       source aef_metadata_deployer/bin/activate || true
-      python3 ../cicd-deployers/metadata_deployer.py --project_id ${var.project} --location ${var.region} --overwrite ${var.overwrite_metadata} || true
+      python3 ../cicd-deployers/metadata_deployer.py --project_id ${var.project} --location ${var.region} --overwrite ${var.overwrite_metadata} --cortex_ref ${var.cortex_ref} --deployment_mode ${var.metadata_deployment_mode} || true
     EOF
   }
   triggers = {
@@ -38,10 +38,31 @@ resource "null_resource" "run_metadata_deployer" {
   depends_on = [google_storage_bucket.data_buckets]
 }
 
+#Registers the dataset and bucket Assets in Dataplex with the metadata plan engine, which creates them concurrently
+#and polls their long-running operations together, once their zones, datasets and buckets exist.
+resource "null_resource" "register_dataplex_assets" {
+  count = local.assets_in_metadata_planner ? 1 : 0
+  provisioner "local-exec" {
+    command = <<EOF
+      python3 -m venv aef_metadata_deployer || true
+      source aef_metadata_deployer/bin/activate || true
+      python3 -m pip install --quiet -r ../cicd-deployers/metadata_planner_requirements.txt
+      python3 ../cicd-deployers/metadata_planner.py --project_id ${var.project} --location ${var.region} --lakes_directories "" --tag_templates_directories "" --policy_taxonomies_directories "" --annotations_directories "" --assets "$AEF_DATAPLEX_ASSETS" --apply
+    EOF
+    environment = {
+      AEF_DATAPLEX_ASSETS = jsonencode(local.dataplex_assets)
+    }
+  }
+  triggers = {
+    assets = jsonencode(local.dataplex_assets)
+  }
+  depends_on = [null_resource.run_metadata_deployer, google_storage_bucket.data_buckets, google_bigquery_dataset.dataform_datasets, google_bigquery_dataset.gcs_datasets]
+}
+
 # TODO move to Cortex Datamesh (once cortex datamesh supports setting discovery)
 #Create BigQuery dataset Assets in Dataplex, with auto discovery so tables will be discovered and added as entities
 resource "google_dataplex_asset" "dataset_assets" {
-  for_each      = var.include_metadata_in_tfe_deployment ? local.all_created_datasets : {}
+  for_each      = var.include_metadata_in_tfe_deployment && !local.assets_in_metadata_planner ? local.all_created_datasets : {}
   project       = var.project
   name          = replace(each.value.dataset_id, "_", "-")
   location      = each.value.location
@@ -63,7 +84,7 @@ resource "google_dataplex_asset" "dataset_assets" {
 #TODO move to Cortex Datamesh (once cortex datamesh supports setting discovery)
 #Create GCS buckets Assets in Dataplex
 resource "google_dataplex_asset" "gcs_assets" {
-  for_each      = var.data_buckets
+  for_each      = local.assets_in_metadata_planner ? {} : var.data_buckets
   project       = var.project
   name          = each.value.name
   location      = var.region
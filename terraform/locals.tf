@@ -44,6 +44,28 @@ locals {
     )
   }
 
+  # Branch, resolved commit, priority and BigQuery execution project (defaultDatabase in dataform.json) of each
+  # repository, used by the dataform runner admission control.
+  dataform_run_settings = {
+    for repo_key, repo_data in var.dataform_repositories :
+    repo_key => {
+      branch     = repo_data.branch
+      commit_sha = data.external.dataform_repository[repo_key].result.commit_sha
+      priority   = repo_data.priority
+      project    = try(jsondecode(data.external.dataform_repository[repo_key].result.content).defaultDatabase, var.project)
+    }
+  }
+
+  dataform_compile_results = {
+    for repo_key, result in try(data.external.dataform_compile[0].result, {}) :
+    repo_key => jsondecode(result)
+  }
+
+  dataform_compilation_results = {
+    for repo_key, result in local.dataform_compile_results :
+    repo_key => result.compilation_result
+  }
+
   /* Extract datasets defined via dataform.json variables if any, it should include 3 variables for each dataset with next format:
       "dataset_id_<DATASET_IDENTIFIER>":"<YOUR_DATASET_NAME>",
       "dataset_projectid_<DATASET_IDENTIFIER>":"<YOUR_DATASET_PROJECT>",
@@ -51,7 +73,7 @@ locals {
   */
   dataform_configs = [
     for repo_key, repo_data in var.dataform_repositories :
-    jsondecode(data.github_repository_file.dataform_config[repo_key].content)
+    jsondecode(data.external.dataform_repository[repo_key].result.content)
   ]
 
   all_vars = merge([
@@ -94,4 +116,29 @@ locals {
       }
     }
   )
-}
\ No newline at end of file
+
+  # Dataplex assets registered by the metadata plan engine when register_dataplex_assets_with_metadata_planner is set.
+  dataplex_assets = concat(
+    [for k, v in local.all_created_datasets : {
+      name              = replace(v.dataset_id, "_", "-")
+      location          = v.location
+      lake              = v.lake
+      zone              = v.zone
+      resource_name     = "projects/${v.project}/datasets/${v.dataset_id}"
+      resource_type     = "BIGQUERY_DATASET"
+      discovery_enabled = true
+      labels            = { domain = var.domain }
+    }],
+    [for k, v in var.data_buckets : {
+      name              = v.name
+      location          = var.region
+      lake              = v.dataplex_lake
+      zone              = v.dataplex_zone
+      resource_name     = "projects/${v.project}/buckets/${v.name}"
+      resource_type     = "STORAGE_BUCKET"
+      discovery_enabled = v.auto_discovery_of_tables == null ? false : tobool(v.auto_discovery_of_tables)
+      labels            = { domain = var.domain }
+    }]
+  )
+  assets_in_metadata_planner = var.include_metadata_in_tfe_deployment && var.register_dataplex_assets_with_metadata_planner
+}
@@ -30,4 +30,14 @@ output "dataform_datasets" {
 
 output "all_created_datasets" {
   value = local.all_created_datasets
-}
\ No newline at end of file
+}
+
+output "dataform_compilation_results" {
+  value = local.dataform_compile_results
+}
+
+output "dataform_execution_results" {
+  value = try({
+    for repo_key, run in jsondecode(data.local_file.dataform_execution_results[0].content) : repo_key => jsondecode(run)
+  }, {})
+}
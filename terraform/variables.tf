@@ -26,6 +26,31 @@ variable "overwrite_metadata" {
   default     = false
 }
 
+variable "cortex_ref" {
+  description = "Commit SHA, branch or tag of cortex-data-foundation used to deploy the metadata. Its checkout is cached and only fetched again when the commit changes, a branch or tag is pinned to the commit it first resolves to."
+  type        = string
+  nullable    = false
+  default     = "main"
+}
+
+variable "metadata_deployment_mode" {
+  description = "How metadata is deployed: cortex redeploys every spec with Cortex data mesh, plan only reports the minimal create, update and delete plan against the live metadata, apply applies that plan."
+  type        = string
+  nullable    = false
+  default     = "cortex"
+  validation {
+    condition     = contains(["cortex", "plan", "apply"], var.metadata_deployment_mode)
+    error_message = "metadata_deployment_mode must be cortex, plan or apply."
+  }
+}
+
+variable "register_dataplex_assets_with_metadata_planner" {
+  description = "Whether the Dataplex assets of the created datasets and data buckets are registered by the metadata plan engine, which creates them concurrently and polls their operations together, instead of as one Terraform resource each. Only applies with include_metadata_in_tfe_deployment."
+  type        = bool
+  nullable    = false
+  default     = false
+}
+
 variable "create_dataform_datasets" {
   description = "Controls whether the datasets found in the dataform.json files in the repositories will be created alongside Terraform resources. If false datasets should be created otherwise."
   type        = bool
@@ -56,6 +81,70 @@ variable "execute_dataform_repositories" {
   nullable    = false
 }
 
+variable "attribute_dataform_costs" {
+  description = "Controls whether BigQuery slot and bytes usage of the executed dataform actions is attributed per action and per tag, flagging actions whose cost grew against their recorded history."
+  type        = bool
+  nullable    = false
+  default     = false
+}
+
+variable "dataform_invocation_timeout" {
+  description = "Maximum seconds a dataform workflow invocation may run before it is cancelled, 0 for no limit."
+  type        = number
+  nullable    = false
+  default     = 0
+}
+
+variable "dataform_run_timeout" {
+  description = "Maximum seconds the whole dataform execution may take before the running invocations are cancelled, 0 for no limit."
+  type        = number
+  nullable    = false
+  default     = 0
+}
+
+variable "dataform_max_concurrent_invocations" {
+  description = "Maximum dataform workflow invocations running at once across all projects. Repositories with a higher priority are admitted first."
+  type        = number
+  nullable    = false
+  default     = 4
+  validation {
+    condition     = var.dataform_max_concurrent_invocations >= 1
+    error_message = "dataform_max_concurrent_invocations must be at least 1."
+  }
+}
+
+variable "dataform_max_concurrent_invocations_per_project" {
+  description = "Maximum dataform workflow invocations running at once in the same BigQuery project."
+  type        = number
+  nullable    = false
+  default     = 2
+  validation {
+    condition     = var.dataform_max_concurrent_invocations_per_project >= 1
+    error_message = "dataform_max_concurrent_invocations_per_project must be at least 1."
+  }
+}
+
+variable "resume_failed_dataform_runs" {
+  description = "Controls whether a dataform repository whose last invocation failed only re-runs its failed, skipped and not yet run actions, reusing the failed compilation result when the commit has not changed."
+  type        = bool
+  nullable    = false
+  default     = false
+}
+
+variable "dry_run_dataform_repositories" {
+  description = "Controls whether the compiled SQL of every dataform action is dry-run in BigQuery during plan and before execution, refusing to run a repository with errors."
+  type        = bool
+  nullable    = false
+  default     = false
+}
+
+variable "dataform_max_bytes_processed" {
+  description = "Budget for the bytes the dry run estimates the actions of a dataform repository process, a repository over it is not run. 0 for no budget."
+  type        = number
+  nullable    = false
+  default     = 0
+}
+
 variable "domain" {
   description = "Your organization or domain name, organization if centralized data management, domain name if one repository for each data domain in a Data mesh environment."
   type        = string
@@ -80,10 +169,17 @@ variable "dataform_repositories" {
     remote_repo_url = optional(string)
     branch          = optional(string, "main")
     secret_version  = optional(string, "v1")
+    priority        = optional(number, 0)
   }))
   default = {}
 }
 
+variable "dataform_git_mirror_dir" {
+  description = "Local directory of the bare git mirrors of the dataform repositories, fetched incrementally and shared by every reader of the repositories during a deploy."
+  type        = string
+  default     = ".dataform_git_mirrors"
+}
+
 variable "dataform_repositories_git_token" {
   description = "Git token to access the dataform repositories, it will be stored as a secret in secret manager, and it will be used to connect and read the dataform.json to create the datasets."
   type        = string